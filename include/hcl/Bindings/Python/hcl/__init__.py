@@ -5,4 +5,5 @@
 # ===----------------------------------------------------------------------=== #
 
 from .build_ir import *
-from .exceptions import *
\ No newline at end of file
+from .exceptions import *
+from .cache import *
\ No newline at end of file
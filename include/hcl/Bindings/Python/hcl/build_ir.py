@@ -4,6 +4,9 @@
 #
 # ===----------------------------------------------------------------------=== #
 
+import contextvars
+import hashlib
+import mmap
 from typing import List
 
 import numpy as np
@@ -18,6 +21,8 @@ class HCLFlags(object):
     def __init__(self):
         self.BUILD_INPLACE = False
         self.BIT_OP = False
+        self.HASH_CONS = False
+        self.COMPACT_GRAPH = False
 
     def enable_build_inplace(self):
         self.BUILD_INPLACE = True
@@ -31,12 +36,84 @@ class HCLFlags(object):
     def reset(self):
         self.BUILD_INPLACE = False
 
+    def enable_hash_cons(self):
+        self.HASH_CONS = True
 
-flags = HCLFlags()
-enable_build_inplace = flags.enable_build_inplace
-disable_build_inplace = flags.disable_build_inplace
-is_build_inplace = flags.is_build_inplace
-reset_build_inplace = flags.reset
+    def disable_hash_cons(self):
+        self.HASH_CONS = False
+
+    def is_hash_cons(self):
+        return self.HASH_CONS
+
+    def enable_compact_graph(self):
+        self.COMPACT_GRAPH = True
+
+    def disable_compact_graph(self):
+        self.COMPACT_GRAPH = False
+
+    def is_compact_graph(self):
+        return self.COMPACT_GRAPH
+
+
+class BuilderProxy(object):
+    """Forwards attribute accesses to a part of the current builder,
+    see BuilderContext.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, "name", name)
+
+    def __getattr__(self, attr):
+        return getattr(getattr(current_builder.get(), self.name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(getattr(current_builder.get(), self.name), attr, value)
+
+    def __len__(self):
+        return len(getattr(current_builder.get(), self.name))
+
+
+flags = BuilderProxy("flags")
+
+
+def enable_build_inplace():
+    flags.enable_build_inplace()
+
+
+def disable_build_inplace():
+    flags.disable_build_inplace()
+
+
+def is_build_inplace():
+    return flags.is_build_inplace()
+
+
+def reset_build_inplace():
+    flags.reset()
+
+
+def enable_hash_cons():
+    flags.enable_hash_cons()
+
+
+def disable_hash_cons():
+    flags.disable_hash_cons()
+
+
+def is_hash_cons():
+    return flags.is_hash_cons()
+
+
+def enable_compact_graph():
+    flags.enable_compact_graph()
+
+
+def disable_compact_graph():
+    flags.disable_compact_graph()
+
+
+def is_compact_graph():
+    return flags.is_compact_graph()
 
 
 def is_floating_point_type(dtype):
@@ -92,7 +169,9 @@ def is_hcl_mlir_type(dtype):
 
 
 def get_mlir_type(dtype):
-    if (
+    if isinstance(dtype, str):
+        return type_registry.parse(dtype)
+    elif (
         is_integer_type(dtype)
         or is_floating_point_type(dtype)
         or is_fixed_type(dtype)
@@ -100,30 +179,6 @@ def get_mlir_type(dtype):
         or is_struct_type(dtype)
     ):
         return dtype
-    elif isinstance(dtype, str):
-        if dtype[0:5] == "index":
-            return IndexType.get()
-        elif dtype[0:3] == "int":
-            return IntegerType.get_signless(int(dtype[3:]))
-        elif dtype[0:4] == "uint":
-            return IntegerType.get_unsigned(int(dtype[4:]))
-        elif dtype[0:5] == "float":
-            if dtype[5:] == "16":
-                return F16Type.get()
-            elif dtype[5:] == "32":
-                return F32Type.get()
-            elif dtype[5:] == "64":
-                return F64Type.get()
-            else:
-                raise DTypeError(f"Not supported floating point type: {dtype}")
-        elif dtype[0:5] == "fixed":
-            strs = dtype[5:].split("_")
-            return hcl_d.FixedType.get(int(strs[0]), int(strs[1]))
-        elif dtype[0:6] == "ufixed":
-            strs = dtype[6:].split("_")
-            return hcl_d.UFixedType.get(int(strs[0]), int(strs[1]))
-        else:
-            raise DTypeError("Unrecognized data type: {}".format(dtype))
     else:
         raise DTypeError(
             "Unrecognized data type format: {} of Type({})".format(
@@ -131,6 +186,32 @@ def get_mlir_type(dtype):
         )
 
 
+def parse_type_str(dtype):
+    if dtype[0:5] == "index":
+        return IndexType.get()
+    elif dtype[0:3] == "int":
+        return IntegerType.get_signless(int(dtype[3:]))
+    elif dtype[0:4] == "uint":
+        return IntegerType.get_unsigned(int(dtype[4:]))
+    elif dtype[0:5] == "float":
+        if dtype[5:] == "16":
+            return F16Type.get()
+        elif dtype[5:] == "32":
+            return F32Type.get()
+        elif dtype[5:] == "64":
+            return F64Type.get()
+        else:
+            raise DTypeError(f"Not supported floating point type: {dtype}")
+    elif dtype[0:5] == "fixed":
+        strs = dtype[5:].split("_")
+        return hcl_d.FixedType.get(int(strs[0]), int(strs[1]))
+    elif dtype[0:6] == "ufixed":
+        strs = dtype[6:].split("_")
+        return hcl_d.UFixedType.get(int(strs[0]), int(strs[1]))
+    else:
+        raise DTypeError("Unrecognized data type: {}".format(dtype))
+
+
 def get_concrete_type(dtype):
     if IntegerType.isinstance(dtype):
         return IntegerType(dtype)
@@ -150,7 +231,7 @@ def get_concrete_type(dtype):
         raise DTypeError("Unrecognized data type: {}".format(dtype))
 
 
-def get_bitwidth(dtype):
+def compute_bitwidth(dtype):
     if IntegerType.isinstance(dtype):
         return dtype.width
     elif F16Type.isinstance(dtype):
@@ -167,7 +248,7 @@ def get_bitwidth(dtype):
         raise DTypeError("Unrecognized data type: {}".format(dtype))
 
 
-def print_mlir_type(dtype):
+def compute_c_type_str(dtype):
     if is_floating_point_type(dtype):
         if dtype.width == 32:
             return "float"
@@ -207,7 +288,7 @@ def print_mlir_type(dtype):
         raise DTypeError("Not supported data type: {}".format(dtype))
 
 
-def mlir_type_to_str(dtype):
+def compute_type_str(dtype):
     if is_signed_type(dtype):
         return "int{}".format(get_bitwidth(dtype))
     elif is_unsigned_type(dtype):
@@ -232,12 +313,115 @@ def mlir_type_to_str(dtype):
         raise DTypeError("Unrecognized data type: {}".format(dtype))
 
 
+def get_bitwidth(dtype):
+    return type_registry.lookup(compute_bitwidth, dtype)
+
+
+def print_mlir_type(dtype):
+    return type_registry.lookup(compute_c_type_str, dtype)
+
+
+def mlir_type_to_str(dtype):
+    return type_registry.lookup(compute_type_str, dtype)
+
+
+class TypeRegistry(object):
+    """Per-context registry of interned MLIR types.
+
+    Parsing a data type string, querying the properties of a type and
+    resolving the promotion of a pair of operand types are computed once
+    per context and served from dictionaries afterwards. MLIR types are
+    uniqued by their context, so the tables are dropped whenever a type
+    from a different context comes in.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.types = {}
+        self.properties = {}
+        self.promotions = {}
+
+    def clear(self):
+        self.context = None
+        self.types = {}
+        self.properties = {}
+        self.promotions = {}
+
+    def sync(self, context):
+        if context is not self.context:
+            self.context = context
+            self.types = {}
+            self.properties = {}
+            self.promotions = {}
+
+    def parse(self, dtype):
+        """Return the interned MLIR type of a data type string,
+        e.g. "int32" or "fixed16_8", in the current context.
+        """
+        self.sync(Context.current)
+        mlir_type = self.types.get(dtype)
+        if mlir_type is None:
+            mlir_type = parse_type_str(dtype)
+            self.types[dtype] = mlir_type
+        return mlir_type
+
+    def lookup(self, compute, dtype):
+        """Return compute(dtype), memoized per type.
+
+        The Python class is part of the key since the same type can be
+        wrapped as a generic Type, for which the predicates differ.
+        """
+        if not isinstance(dtype, Type):
+            # let compute report the unrecognized data type
+            return compute(dtype)
+        self.sync(dtype.context)
+        key = (compute, dtype.__class__, dtype)
+        try:
+            return self.properties[key]
+        except KeyError:
+            pass
+        value = compute(dtype)
+        self.properties[key] = value
+        return value
+
+    def promote(self, ltype, rtype):
+        """Return the promotion of a binary operation on two types.
+
+        Returns
+        -------
+        ret : tuple
+            The result type, and whether the lhs and the rhs have to be
+            cast to it.
+        """
+        self.sync(ltype.context)
+        key = (ltype.__class__, ltype, rtype.__class__, rtype)
+        plan = self.promotions.get(key)
+        if plan is None:
+            if ltype == rtype:
+                res_type = ltype
+            elif self.lookup(compute_type_rank, ltype) > self.lookup(
+                compute_type_rank, rtype
+            ):
+                res_type = get_promoted_type(ltype, rtype)
+            else:
+                res_type = get_promoted_type(rtype, ltype)
+            plan = (res_type, ltype != res_type, rtype != res_type)
+            self.promotions[key] = plan
+        return plan
+
+
+type_registry = BuilderProxy("type_registry")
+
+
 class HCLMLIRInsertionPoint(object):
     def __init__(self):
         self.ip_stack = []
+        # hash-consed expressions built at each insertion point
+        self.pool_stack = []
 
     def clear(self):
         self.ip_stack = []
+        self.pool_stack = []
 
     def get(self):
         return self.ip_stack[-1]
@@ -245,41 +429,107 @@ class HCLMLIRInsertionPoint(object):
     def get_global(self):
         return self.ip_stack[0]
 
+    def get_pool(self):
+        return self.pool_stack[-1]
+
     def save(self, ip):
         if not isinstance(ip, InsertionPoint):
             ip = InsertionPoint(ip)
         self.ip_stack.append(ip)
+        self.pool_stack.append({})
 
     def restore(self):
+        self.pool_stack.pop()
         return self.ip_stack.pop()
 
 
-GlobalInsertionPoint = HCLMLIRInsertionPoint()
+GlobalInsertionPoint = BuilderProxy("insertion_point")
+
+diagnostics = BuilderProxy("diagnostics")
 
 
 def floating_point_error(op_name):
     return DTypeError("{} does not support floating point inputs".format(op_name))
 
 
+def is_hash_consing():
+    # Expressions can only be shared when they are built right away,
+    # since the built op is reused at the same insertion point.
+    return flags.HASH_CONS and flags.BUILD_INPLACE
+
+
+def lookup_or_create(key, OpClass, *args):
+    """Return the expression of the given key built at the current
+    insertion point, or create it with OpClass(*args) and add it to the
+    pool of the insertion point.
+    """
+    pool = GlobalInsertionPoint.get_pool()
+    expr = pool.get(key)
+    # an expression erased with its last user is created again
+    if expr is None or expr.built_op is None:
+        expr = OpClass(*args)
+        expr.pooled = True
+        pool[key] = expr
+    return expr
+
+
+def make_constant(dtype, val):
+    if not is_hash_consing():
+        return ConstantOp(dtype, val)
+    dtype = get_mlir_type(dtype)
+    # floats are told apart by their representation, as -0.0 == 0.0
+    key = repr(val) if isinstance(val, (float, np.floating)) else val
+    return lookup_or_create(
+        ("const", str(dtype), type(val), key), ConstantOp, dtype, val
+    )
+
+
+def make_cast(val, res_type):
+    if not is_hash_consing():
+        return CastOp(val, res_type)
+    res_type = get_mlir_type(res_type)
+    val = get_hcl_op(val)
+    return lookup_or_create(
+        ("cast", str(res_type), id(val)), CastOp, val, res_type
+    )
+
+
+def make_binary_op(OpClass, dtype, lhs, rhs):
+    if not is_hash_consing():
+        return OpClass(dtype, lhs, rhs)
+    return lookup_or_create(
+        (OpClass, str(dtype), id(lhs), id(rhs)), OpClass, dtype, lhs, rhs
+    )
+
+
+def make_integer_op(OpClass, lhs, rhs):
+    if not is_hash_consing():
+        return OpClass(lhs, rhs)
+    return lookup_or_create((OpClass, id(lhs), id(rhs)), OpClass, lhs, rhs)
+
+
 def get_hcl_op(expr, dtype=None):
     if isinstance(expr, (int, float)):
         if dtype == None:
             if isinstance(expr, int):
                 if expr < 0xFFFFFFFF:
-                    return ConstantOp(IntegerType.get_signless(32), expr)
+                    dtype = IntegerType.get_signless(32)
                 else:
-                    return ConstantOp(IntegerType.get_signless(64), expr)
-            elif isinstance(expr, float):
-                return ConstantOp(F32Type.get(), expr)
-        else:
-            return ConstantOp(dtype, expr)
+                    dtype = IntegerType.get_signless(64)
+            else:
+                dtype = F32Type.get()
+        return make_constant(dtype, expr)
     else:
         if dtype != None and dtype != expr.dtype:
-            expr = CastOp(expr, dtype)
+            expr = make_cast(expr, dtype)
         return expr
 
 
 def get_type_rank(dtype):
+    return type_registry.lookup(compute_type_rank, dtype)
+
+
+def compute_type_rank(dtype):
     """
     We always cast lower rank types to higher rank types.
     Base rank 1 (lowest): integer and fixed point types
@@ -318,61 +568,36 @@ def get_type_rank(dtype):
         raise DTypeError("Unrecognized type: {}".format(dtype))
 
 
-def cast_types(lhs, rhs):
+def get_promoted_type(ltype, rtype):
     """
-    Cast types for binary operations
-    lhs always has higher rank than rhs
+    Result type of a binary operation
+    ltype always has higher rank than rtype
     Implementation based on
     https://en.cppreference.com/w/c/language/conversion
     """
-    ltype = lhs.dtype
-    rtype = rhs.dtype
     # 1) If one operand is long double (omitted)
     # 2) Otherwise, if lhs is double
     if isinstance(ltype, F64Type):
         # integer or real floating type to double
-        res_type = F64Type.get()
-        DTypeWarning("Casting value {} from {} to {}".format(
-            rhs, rtype, res_type)).warn()
-        return lhs, CastOp(rhs, res_type)
+        return F64Type.get()
     # 3) Otherwise, if lhs is float
     elif isinstance(ltype, F32Type):
         # integer type to float
-        res_type = F32Type.get()
-        DTypeWarning("Casting value {} from {} to {}".format(
-            rhs, rtype, res_type)).warn()
-        return lhs, CastOp(rhs, res_type)
+        return F32Type.get()
     # 4) Otherwise, if lhs is integer.
     elif isinstance(ltype, (IntegerType, IndexType)):
         # 4.1) lhs is int or index, rhs is int of lower rank, rhs gets promoted
-        if isinstance(rtype, IntegerType):
-            res_type = ltype
-            DTypeWarning("Casting value {} from {} to {}".format(
-                rhs, rtype, res_type)).warn()
-            return lhs, CastOp(rhs, res_type)
         # 4.2) lhs is index, rhs is also index, nothing to do
-        elif isinstance(rtype, IndexType):
-            return lhs, rhs
+        if isinstance(rtype, (IntegerType, IndexType)):
+            return ltype
         # 4.3) lhs is int or index, rhs is fixed point of lower rank
         # e.g. Int(100) + Fixed(3, 2) -> Fixed(100 + 2, 2)
         elif is_signed_fixed_type(rtype):
-            res_type = hcl_d.FixedType.get(
-                ltype.width + rtype.frac, rtype.frac)
-            DTypeWarning("Casting value {} from {} to {}".format(
-                lhs, ltype, res_type)).warn()
-            DTypeWarning("Casting value {} from {} to {}".format(
-                rhs, rtype, res_type)).warn()
-            return CastOp(lhs, res_type), CastOp(rhs, res_type)
+            return hcl_d.FixedType.get(ltype.width + rtype.frac, rtype.frac)
         # 4.4) lhs is int or index, rhs is unsigned fixed point of lower rank
         # e.g. Int(100) + UFixed(3, 2) -> UFixed(100 + 2, 2)
         elif is_unsigned_fixed_type(rtype):
-            res_type = hcl_d.UFixedType.get(
-                ltype.width + rtype.frac, rtype.frac)
-            DTypeWarning("Casting value {} from {} to {}".format(
-                lhs, ltype, res_type)).warn()
-            DTypeWarning("Casting value {} from {} to {}".format(
-                rhs, rtype, res_type)).warn()
-            return CastOp(lhs, res_type), CastOp(rhs, res_type)
+            return hcl_d.UFixedType.get(ltype.width + rtype.frac, rtype.frac)
         else:
             # unexpected type
             raise DTypeError("Unexpected type: {}".format(rtype))
@@ -380,10 +605,7 @@ def cast_types(lhs, rhs):
     elif is_fixed_type(ltype):
         # 5.1) lhs is fixed point, rhs is integer or fixed point of lower rank, cast rhs to lhs
         if is_integer_type(rtype) or is_fixed_type(rtype):
-            res_type = ltype
-            DTypeWarning("Casting value {} from {} to {}".format(
-                rhs, rtype, res_type)).warn()
-            return lhs, CastOp(rhs, res_type)
+            return ltype
         else:
             # unexpected type
             raise DTypeError("Unexpected type: {}".format(rtype))
@@ -394,27 +616,537 @@ def cast_types(lhs, rhs):
         )
 
 
-# TODO(Niansong): this should be covered by cast_types, double-check before removing
-def regularize_fixed_type(lhs, rhs):
-    if not is_fixed_type(lhs.dtype) or not is_fixed_type(rhs.dtype):
-        raise DTypeError("Should be all fixed types")
-    if not lhs.dtype.frac == rhs.dtype.frac:
-        raise DTypeError("Should have the same frac")
-    lwidth = lhs.dtype.width
-    rwidth = rhs.dtype.width
-    if lwidth < rwidth:
-        res_type = hcl_d.FixedType.get(rwidth, lhs.dtype.frac)
-        cast = CastOp(lhs, res_type)
-        return cast, rhs
-    elif lwidth > rwidth:
-        res_type = hcl_d.FixedType.get(lwidth, rhs.dtype.frac)
-        cast = CastOp(rhs, res_type)
-        return lhs, cast
+def cast_types(lhs, rhs):
+    """
+    Cast types for binary operations
+    The operand of lower rank is cast to the promoted type
+    """
+    ltype = lhs.dtype
+    rtype = rhs.dtype
+    res_type, cast_lhs, cast_rhs = type_registry.promote(ltype, rtype)
+    if cast_lhs:
+        diagnostics.warn(DTypeWarning, ("cast", ltype, res_type),
+                         "Casting value {} from {} to {}", lhs, ltype, res_type)
+        lhs = make_cast(lhs, res_type)
+    if cast_rhs:
+        diagnostics.warn(DTypeWarning, ("cast", rtype, res_type),
+                         "Casting value {} from {} to {}", rhs, rtype, res_type)
+        rhs = make_cast(rhs, res_type)
+    return lhs, rhs
+
+
+#################################################
+#
+# Constant folding
+#
+#################################################
+
+
+def wrap_integer(val, width, signed=True):
+    """Two's complement wrap-around of val to width bits"""
+    val &= (1 << width) - 1
+    if signed and val >> (width - 1):
+        val -= 1 << width
+    return val
+
+
+def round_float(val, dtype):
+    """Round a Python float to the precision of a floating point type"""
+    with np.errstate(over="ignore"):
+        if isinstance(dtype, F16Type):
+            return float(np.float16(val))
+        elif isinstance(dtype, F32Type):
+            return float(np.float32(val))
+    return float(val)
+
+
+def normalize_constant(dtype, val):
+    """Return the folding value of a constant of dtype, i.e. the wrapped
+    integer for integer and index types, the rounded float for floating
+    point types, and the wrapped integer encoding for fixed point types.
+    Returns None if the constant cannot be folded.
+    """
+    if isinstance(val, (bool, int, np.integer)):
+        val = int(val)
+    elif isinstance(val, (float, np.floating)):
+        val = float(val)
     else:
-        return lhs, rhs
+        return None
+    if is_index_type(dtype):
+        return wrap_integer(int(val), 64)
+    elif is_integer_type(dtype):
+        return wrap_integer(int(val), dtype.width, not dtype.is_unsigned)
+    elif is_floating_point_type(dtype):
+        return round_float(val, dtype)
+    elif is_fixed_type(dtype):
+        # the encoding must be exactly representable by a Python float
+        if dtype.width > 52:
+            return None
+        return wrap_integer(
+            int(val * (2 ** dtype.frac)),
+            dtype.width,
+            is_signed_fixed_type(dtype),
+        )
+    return None
+
+
+def get_constant(expr):
+    """Return (dtype, folding value) of a scalar constant operand, which
+    can be a Python number or a scalar ConstantOp, or None otherwise.
+    """
+    if isinstance(expr, bool):
+        return None
+    if isinstance(expr, (int, float)):
+        # same types as get_hcl_op
+        if isinstance(expr, int):
+            if expr < 0xFFFFFFFF:
+                dtype = IntegerType.get_signless(32)
+            else:
+                dtype = IntegerType.get_signless(64)
+        else:
+            dtype = F32Type.get()
+    elif isinstance(expr, CastOp) and expr.op is None:
+        return get_constant(expr.val)
+    elif isinstance(expr, ConstantOp):
+        if isinstance(expr.val, (List, np.ndarray)):
+            return None
+        dtype = get_mlir_type(expr.dtype)
+        expr = expr.val
+    else:
+        return None
+    val = normalize_constant(dtype, expr)
+    if val is None:
+        return None
+    return dtype, val
+
+
+def get_constant_value(dtype, val):
+    """Inverse of normalize_constant: the value to build a ConstantOp with"""
+    if is_fixed_type(dtype):
+        return val / (2 ** dtype.frac)
+    return val
+
+
+def fold_cast(val, src_type, res_type):
+    """Fold the cast of a constant value the same way as the op chosen by
+    CastOp and its lowering. Returns None if it cannot be folded.
+    """
+    if src_type == res_type:
+        return val
+    if is_index_type(src_type) and is_integer_type(res_type):
+        # arith.index_cast truncates
+        return normalize_constant(res_type, val)
+    elif is_integer_type(src_type) and is_index_type(res_type):
+        # arith.index_cast sign-extends
+        return wrap_integer(wrap_integer(val, src_type.width), 64)
+    elif is_integer_type(src_type) and is_integer_type(res_type):
+        if src_type.width == 1 or src_type.is_unsigned:
+            val &= (1 << src_type.width) - 1  # arith.extui
+        return normalize_constant(res_type, val)  # arith.extsi / arith.trunci
+    elif is_integer_type(src_type) and is_floating_point_type(res_type):
+        # CastOp builds arith.sitofp for all integer types
+        val = wrap_integer(val, src_type.width)
+        if abs(val) >= 2 ** 53:
+            return None
+        return round_float(float(val), res_type)
+    elif is_floating_point_type(src_type) and is_integer_type(res_type):
+        # arith.fptosi, out-of-range results are poison
+        if val != val or val in (float("inf"), float("-inf")):
+            return None
+        val = int(val)
+        if not -(2 ** (res_type.width - 1)) <= val < 2 ** (res_type.width - 1):
+            return None
+        return normalize_constant(res_type, val)
+    elif is_floating_point_type(src_type) and is_floating_point_type(res_type):
+        return round_float(val, res_type)
+    elif is_fixed_type(src_type) and is_floating_point_type(res_type):
+        # FixedToFloatOp: [su]itofp of the encoding, then divf by 2^frac
+        return round_float(
+            round_float(float(val), res_type) / (2 ** src_type.frac), res_type
+        )
+    elif is_fixed_type(src_type) and is_integer_type(res_type):
+        # FixedToIntOp: arithmetic (logical for ufixed) right shift by frac,
+        # then extend or truncate
+        return normalize_constant(res_type, val >> src_type.frac)
+    # Casts to fixed point types are kept as ops, since scalar
+    # fixed point constants cannot be lowered.
+    return None
+
+
+def fold_binary_op(OpClass, dtype, lhs, rhs):
+    """Fold a binary operation on the folding values of two constants of
+    dtype with the semantics of the op it would build. Returns None if it
+    cannot be folded, e.g. for a division by zero.
+    """
+    if is_floating_point_type(dtype):
+        if OpClass is AddOp:
+            val = lhs + rhs
+        elif OpClass is SubOp:
+            val = lhs - rhs
+        elif OpClass is MulOp:
+            val = lhs * rhs
+        elif OpClass in (DivOp, FloorDivOp):  # both build arith.divf
+            if rhs == 0:
+                return None
+            val = lhs / rhs
+        elif OpClass is RemOp:  # arith.remf
+            if rhs == 0:
+                return None
+            val = np.fmod(lhs, rhs)
+        else:
+            return None
+        return round_float(val, dtype)
+    elif is_fixed_type(dtype):
+        width = dtype.width
+        signed = is_signed_fixed_type(dtype)
+        if OpClass is AddOp:
+            val = lhs + rhs
+        elif OpClass is SubOp:
+            val = lhs - rhs
+        elif OpClass is MulOp:
+            # multiply in 2*width bits, shift right by frac, then truncate
+            val = (lhs * rhs) >> dtype.frac
+        elif OpClass is DivOp:
+            # shift lhs left by frac in 2*width bits, divide, then truncate
+            if rhs == 0:
+                return None
+            lhs = wrap_integer(lhs << dtype.frac, 2 * width, signed)
+            val = abs(lhs) // abs(rhs)
+            if (lhs < 0) != (rhs < 0):
+                val = -val
+        else:
+            return None
+        return wrap_integer(val, width, signed)
+    # integer and index types
+    width = 64 if is_index_type(dtype) else dtype.width
+    signed = is_index_type(dtype) or not dtype.is_unsigned
+    if OpClass is AddOp:
+        val = lhs + rhs
+    elif OpClass is SubOp:
+        val = lhs - rhs
+    elif OpClass is MulOp:
+        val = lhs * rhs
+    elif OpClass in (DivOp, FloorDivOp, RemOp):
+        # arith.divsi / arith.remsi are built for all integer types
+        if not signed or rhs == 0:
+            return None
+        if lhs == -(2 ** (width - 1)) and rhs == -1:
+            return None
+        val = abs(lhs) // abs(rhs)
+        if (lhs < 0) != (rhs < 0):
+            val = -val
+        if OpClass is RemOp:
+            val = lhs - rhs * val
+    elif OpClass is AndOp:
+        val = lhs & rhs
+    elif OpClass is OrOp:
+        val = lhs | rhs
+    elif OpClass is XOrOp:
+        val = lhs ^ rhs
+    elif OpClass in (LeftShiftOp, RightShiftOp):
+        # shift amounts out of range are poison
+        shift = rhs & ((1 << width) - 1)
+        if shift >= width:
+            return None
+        if OpClass is LeftShiftOp:
+            val = lhs << shift
+        else:  # arith.shrui
+            val = (lhs & ((1 << width) - 1)) >> shift
+    else:
+        return None
+    return wrap_integer(val, width, signed)
+
+
+def fold_constants(OpClass, lhs, rhs):
+    """Fold ExprOp.generic_op on two constant operands into a ConstantOp.
+    Returns None if either operand is not a constant or the operation
+    cannot be folded.
+    """
+    lconst = get_constant(lhs)
+    if lconst is None:
+        return None
+    rconst = get_constant(rhs)
+    if rconst is None:
+        return None
+    (ltype, lval), (rtype, rval) = lconst, rconst
+    dtype = type_registry.promote(ltype, rtype)[0]
+    lval = fold_cast(lval, ltype, dtype)
+    rval = fold_cast(rval, rtype, dtype)
+    if lval is None or rval is None:
+        return None
+    val = fold_binary_op(OpClass, dtype, lval, rval)
+    if val is None:
+        return None
+    return make_constant(dtype, get_constant_value(dtype, val))
+
+
+def fold_integer_constants(OpClass, lhs, rhs):
+    """Fold ExprOp.generic_integer_op on two constant operands."""
+    lconst = get_constant(lhs)
+    if lconst is None:
+        return None
+    rconst = get_constant(rhs)
+    if rconst is None:
+        return None
+    (ltype, lval), (rtype, rval) = lconst, rconst
+    if not (is_integer_type(ltype) or is_index_type(ltype)):
+        return None
+    if ltype != rtype:
+        # LeftShiftOp widens the result type of casted operands
+        if OpClass is LeftShiftOp:
+            return None
+        rval = fold_cast(rval, rtype, ltype)
+        if rval is None:
+            return None
+    val = fold_binary_op(OpClass, ltype, lval, rval)
+    if val is None:
+        return None
+    return make_constant(ltype, val)
+
+
+#################################################
+#
+# Fixed point quantization
+#
+#################################################
+
+
+def get_global_storage_type(width):
+    """Element type of a global memref holding integer or fixed point
+    encodings of the given width.
+
+    DenseElementsAttr stores iN elements in ceil(N / 8) bytes, except i1,
+    which is bit-packed. iN is used as it is if that is the size of a
+    NumPy integer, otherwise the encodings are stored in the next wider
+    one, i.e. i8, i16, i32 or i64.
+    """
+    byte_width = (width + 7) // 8 * 8
+    if width > 1 and byte_width in (8, 16, 32, 64):
+        return IntegerType.get_signless(width)
+    for storage_width in (8, 16, 32, 64):
+        if byte_width <= storage_width:
+            return IntegerType.get_signless(storage_width)
+    raise DTypeError(
+        "Integer width ({}) too large, not supported by numpy".format(width))
+
+
+class GlobalConstantIndex(object):
+    """Content-addressed index of the constant tensor globals.
+
+    ConstantOps with the same data type and contents share one
+    memref.GlobalOp. The key is a digest of the stored array with its
+    shape and type, and a global is only reused in the module it was
+    created in.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.globals = {}
+
+    def clear(self):
+        self.context = None
+        self.globals = {}
+
+    def get_key(self, val, dtype):
+        digest = hashlib.sha256(np.ascontiguousarray(val).data).digest()
+        return (digest, val.shape, val.dtype.str, str(dtype))
+
+    def lookup(self, key, module):
+        """Return the symbol name of the global with the given key in
+        module, or None."""
+        context = Context.current
+        if context is not self.context:
+            self.context = context
+            self.globals = {}
+        entry = self.globals.get(key)
+        if entry is None or entry[0] is not module:
+            return None
+        return entry[1]
+
+    def insert(self, key, module, name):
+        self.globals[key] = (module, name)
+
+
+global_constant_index = BuilderProxy("global_constant_index")
+
+
+def get_numpy_storage_type(dtype):
+    """NumPy integer type with the storage size of an integer type"""
+    return {8: np.int8, 16: np.int16, 32: np.int32, 64: np.int64}[
+        (dtype.width + 7) // 8 * 8
+    ]
+
+
+def get_external_data(val, dtype):
+    """Return the file and offset of a memory-mapped constant that the
+    global can reference in place, or None.
+
+    Only an np.memmap of a file region is referenced, not a view of one,
+    and only if its elements are already stored the way the global stores
+    them: in native byte order and C order, as the floating point type
+    itself or as integers of the storage size. Other values, including
+    real values of fixed point tensors, are copied into the IR.
+    """
+    if not isinstance(val, np.memmap) or not isinstance(val.base, mmap.mmap):
+        return None
+    if val.filename is None or not val.flags.c_contiguous or not val.flags.aligned:
+        return None
+    if not val.dtype.isnative:
+        return None
+    if is_integer_type(dtype):
+        if dtype.width > 64:
+            return None
+        storage = np.dtype(get_numpy_storage_type(
+            get_global_storage_type(dtype.width)))
+        if val.dtype.kind not in "iu" or val.dtype.itemsize != storage.itemsize:
+            return None
+    elif isinstance(dtype, F16Type):
+        if val.dtype != np.float16:
+            return None
+    elif isinstance(dtype, F32Type):
+        if val.dtype != np.float32:
+            return None
+    elif isinstance(dtype, F64Type):
+        if val.dtype != np.float64:
+            return None
+    else:
+        return None
+    return val.filename, val.offset
+
+
+def add_external_data(module, name, filename, offset, size):
+    """Record the file region of a constant global in the
+    "hcl.external_data" attribute of the module"""
+    entries = {}
+    if "hcl.external_data" in module.attributes:
+        for entry in DictAttr(module.attributes["hcl.external_data"]):
+            entries[entry.name] = entry.attr
+    i64 = IntegerType.get_signless(64)
+    entries[name] = ArrayAttr.get(
+        [
+            StringAttr.get(filename),
+            IntegerAttr.get(i64, offset),
+            IntegerAttr.get(i64, size),
+        ]
+    )
+    module.attributes["hcl.external_data"] = DictAttr.get(entries)
+
+
+def register_external_constants(engine, module):
+    """Resolve the constant globals of a module that reference external
+    data in an ExecutionEngine.
+
+    The globals are listed in the "hcl.external_data" attribute of the
+    module, which is kept by the lowering to LLVM, and are declared
+    without an initializer. Each file region is memory-mapped read-only
+    and its address is registered as the symbol of the global, so the
+    data is neither copied into the IR nor into the JIT-compiled code.
+    The mappings are kept alive by the engine. This must be called
+    before the first lookup in the engine.
+    """
+    attributes = module.operation.attributes
+    if "hcl.external_data" not in attributes:
+        return
+    mappings = getattr(engine, "external_data", [])
+    for entry in DictAttr(attributes["hcl.external_data"]):
+        path, offset, size = ArrayAttr(entry.attr)
+        data = np.memmap(
+            StringAttr(path).value,
+            dtype=np.uint8,
+            mode="r",
+            offset=IntegerAttr(offset).value,
+            shape=(IntegerAttr(size).value,),
+        )
+        engine.raw_register_runtime(entry.name, data.ctypes.data)
+        mappings.append(data)
+    engine.external_data = mappings
+
+
+FIXED_ROUNDING_MODES = ("truncate", "round")
+FIXED_OVERFLOW_MODES = ("wrap", "saturate")
+
+
+def quantize_fixed(val, dtype, rounding="truncate", overflow="wrap"):
+    """Quantize real values to the integer encoding of a fixed point type.
+
+    The values are scaled by 2^frac and rounded to an integer, either
+    toward zero ("truncate") or to the nearest integer with ties away
+    from zero ("round"). Values out of the range of the type either wrap
+    around in two's complement ("wrap") or are clamped ("saturate").
+    Truncate and wrap is the conversion of a float by FixedPointToInteger,
+    i.e. fptosi of the scaled value truncated to the width.
+
+    Parameters
+    ----------
+    val : array_like
+        The real values.
+    dtype : FixedType or UFixedType
+        The fixed point type, at most 64 bits wide.
+
+    Returns
+    -------
+    ret : np.ndarray
+        The encodings as int64, sign-extended for signed types and
+        zero-extended for unsigned types. A 64-bit unsigned encoding is
+        kept as its two's complement bit pattern.
+    """
+    if rounding not in FIXED_ROUNDING_MODES:
+        raise HCLValueError("Unknown rounding mode: {}".format(rounding))
+    if overflow not in FIXED_OVERFLOW_MODES:
+        raise HCLValueError("Unknown overflow mode: {}".format(overflow))
+    width = dtype.width
+    if width > 64:
+        raise DTypeError(
+            "Fixed point width ({}) too large, not supported by numpy".format(
+                dtype)
+        )
+    signed = is_signed_fixed_type(dtype)
+    # scaling by a power of two is exact
+    scaled = np.asarray(val, dtype=np.float64) * (2.0 ** dtype.frac)
+    finite = np.isfinite(scaled)
+    quantized = np.trunc(np.where(finite, scaled, 0.0))
+    if rounding == "round":
+        # x - trunc(x) is exact, unlike x + 0.5
+        half = np.abs(np.where(finite, scaled, 0.0) - quantized) >= 0.5
+        quantized += np.where(half, np.sign(scaled), 0.0)
+    if overflow == "saturate":
+        if signed:
+            lower, upper = -(2.0 ** (width - 1)), 2.0 ** (width - 1)
+        else:
+            lower, upper = 0.0, 2.0 ** width
+        # the bounds are powers of two, so the comparisons are exact
+        over = (quantized >= upper) | (scaled == np.inf)
+        under = (quantized < lower) | (scaled == -np.inf)
+        quantized = np.where(over | under, 0.0, quantized)
+    # reduce to (-2^64, 2^64) and then to the int64 range, both exact,
+    # so that the low 64 bits of the integer are preserved
+    quantized = np.fmod(quantized, 2.0 ** 64)
+    quantized = np.where(quantized >= 2.0 ** 63,
+                         quantized - 2.0 ** 64, quantized)
+    quantized = np.where(quantized < -(2.0 ** 63),
+                         quantized + 2.0 ** 64, quantized)
+    bits = quantized.astype(np.int64).view(np.uint64)
+    # keep the low width bits, then sign-extend
+    if width < 64:
+        bits &= np.uint64((1 << width) - 1)
+    encoded = bits.view(np.int64)
+    if signed and width < 64:
+        shift = np.int64(64 - width)
+        encoded = np.right_shift(np.left_shift(encoded, shift), shift)
+    if overflow == "saturate":
+        if signed:
+            lower, upper = -(1 << (width - 1)), (1 << (width - 1)) - 1
+        else:
+            lower, upper = 0, wrap_integer((1 << width) - 1, 64)
+        encoded = np.where(over, np.int64(upper), encoded)
+        encoded = np.where(under, np.int64(lower), encoded)
+    return np.asarray(encoded, dtype=np.int64)
 
 
 class ExprOp(object):
+    # whether the expression is shared through the hash-consing pool
+    pooled = False
+
     def __init__(self, op, dtype=None):
         self.op = op
         self.dtype = dtype
@@ -436,6 +1168,14 @@ class ExprOp(object):
                 "Cannot use hcl.scalar to construct expression, "
                 + "use hcl.scalar.v instead"
             )
+        # fold constant operands before any op is created
+        if arg == None:
+            expr = fold_constants(OpClass, lhs, rhs)
+            if expr is not None:
+                return expr
+            if flags.COMPACT_GRAPH and OpClass in ExprGraph.ARITH_OPS:
+                return expr_graph.handle(
+                    expr_graph.add_binary_op(OpClass, lhs, rhs))
         # turn py builtin op to hcl op
         lhs = get_hcl_op(lhs)
         rhs = get_hcl_op(rhs)
@@ -445,34 +1185,34 @@ class ExprOp(object):
         lhs.dtype = get_mlir_type(lhs.dtype)
         rhs.dtype = get_mlir_type(rhs.dtype)
         if lhs.dtype != rhs.dtype:
-            lrank = get_type_rank(lhs.dtype)
-            rrank = get_type_rank(rhs.dtype)
-            # always ensure the first op has higher ranking
-            if lrank > rrank:
-                lhs, rhs = cast_types(lhs, rhs)
-            else:
-                rhs, lhs = cast_types(rhs, lhs)
-            if is_fixed_type(lhs.dtype) or is_fixed_type(rhs.dtype):
-                lhs, rhs = regularize_fixed_type(lhs, rhs)
+            # both operands end up with the promoted type
+            lhs, rhs = cast_types(lhs, rhs)
 
         # create AST node based on different types
         dtype = lhs.dtype
         if arg == None:
-            expr = OpClass(dtype, lhs, rhs)
+            expr = make_binary_op(OpClass, dtype, lhs, rhs)
         else:
             expr = OpClass(lhs, rhs, arg)
         return expr
 
     @staticmethod
     def generic_integer_op(OpClass, lhs, rhs):
+        # fold constant operands before any op is created
+        expr = fold_integer_constants(OpClass, lhs, rhs)
+        if expr is not None:
+            return expr
+        if flags.COMPACT_GRAPH and OpClass in ExprGraph.INTEGER_OPS:
+            return expr_graph.handle(
+                expr_graph.add_binary_op(OpClass, lhs, rhs))
         # turn py builtin op to hcl op
         lhs = get_hcl_op(lhs)
         rhs = get_hcl_op(rhs)
 
         # type checking & conversion
         if lhs.dtype != rhs.dtype:
-            rhs = CastOp(rhs, lhs.dtype)
-        expr = OpClass(lhs, rhs)
+            rhs = make_cast(rhs, lhs.dtype)
+        expr = make_integer_op(OpClass, lhs, rhs)
         return expr
 
     @staticmethod
@@ -759,26 +1499,45 @@ class ConstantOp(ExprOp):
     # TODO(Niansong): Needs a robust way to handle overflow
     """
     Constant tensor is implemented as global memref in MLIR.
-    To support anywidth integer and fixed point numbers,
-    we use i64 global memref to represent the constant.
-    When the constant is to be consumed, we cast it to the
-    target width.
+    Integer and fixed point constants are stored as signless
+    integers of their own width, or of the next width a NumPy
+    integer can hold, see get_global_storage_type. Only in the
+    latter case the constant is cast to the target width when
+    it is consumed.
     """
 
-    def __init__(self, dtype, val, name="const_tensor"):
+    def __init__(
+        self,
+        dtype,
+        val,
+        name="const_tensor",
+        lazy=False,
+        rounding="truncate",
+        overflow="wrap",
+    ):
+        # A lazy constant is not built in place. It is only built when its
+        # result is used, e.g. an index that is not folded into an affine map.
+        # rounding and overflow are the quantization modes of fixed point
+        # tensors, see quantize_fixed.
         super().__init__(arith.ConstantOp)
         self.val = val
         self.name = name
+        self.rounding = rounding
+        self.overflow = overflow
         self.dtype = get_mlir_type(dtype)
-        if flags.BUILD_INPLACE:
+        if flags.BUILD_INPLACE and not lazy:
             self.build()
 
     def build(self):
         if isinstance(self.val, (List, np.ndarray)):
             # val is numpy ndarray
-            if is_integer_type(self.dtype):
+            # a memory-mapped file is referenced by the global, not copied
+            external = get_external_data(self.val, self.dtype)
+            if external is not None:
+                pass  # stored as it is
+            elif is_integer_type(self.dtype):
                 if self.dtype.width <= 64:
-                    np_dtype = np.int64
+                    self.val = np.array(self.val, dtype=np.int64)
                 else:
                     raise DTypeError(
                         "Integer width ({}) too large, not supported by numpy".format(
@@ -794,48 +1553,65 @@ class ConstantOp(ExprOp):
                     np_dtype = np.float64
                 else:
                     raise DTypeError("Unrecognized data type")
+                self.val = np.array(self.val, dtype=np_dtype)
             elif is_fixed_type(self.dtype):  # Fixed point
-                if is_signed_type(self.dtype):
-                    sb = 1 << self.dtype.width
-                    sb_limit = 1 << (self.dtype.width - 1)
-                    self.val = self.val * (2 ** self.dtype.frac)
-                    self.val = np.fix(self.val) % sb
-
-                    def cast_func(x):
-                        return x if x < sb_limit else x - sb
-
-                    self.val = np.vectorize(cast_func)(self.val)
-                else:
-                    sb = 1 << self.dtype.width
-                    self.val = self.val * (2 ** self.dtype.frac)
-                    self.val = np.fix(self.val) % sb
-                np_dtype = np.int64
+                self.val = quantize_fixed(
+                    self.val, self.dtype, self.rounding, self.overflow
+                )
             else:
                 raise DTypeError(
                     "Unrecognized data type: {}".format(self.dtype))
 
-            self.val = np.array(self.val, dtype=np_dtype)
             if is_integer_type(self.dtype) or is_fixed_type(self.dtype):
-                dtype = IntegerType.get_signless(64)
+                # the encodings are sign- or zero-extended to 64 bits,
+                # so narrowing keeps the low bits
+                dtype = get_global_storage_type(self.dtype.width)
+                if external is None:
+                    self.val = self.val.astype(get_numpy_storage_type(dtype))
             else:  # floating point
                 dtype = self.dtype
-            value_attr = DenseElementsAttr.get(self.val, type=dtype)
-            sym_name = StringAttr.get(self.name)
-            sym_visibility = StringAttr.get("private")
             memref_type = MemRefType.get(self.val.shape, dtype)
-            type_attr = TypeAttr.get(memref_type)
-            const_tensor = memref.GlobalOp(
-                sym_name,
-                type_attr,
-                sym_visibility=sym_visibility,
-                initial_value=value_attr,
-                constant=True,
-                alignment=None,
-                ip=GlobalInsertionPoint.get_global(),
-            )
-            const_tensor.attributes["constant"] = UnitAttr.get()
-            if is_unsigned_type(self.dtype):
-                const_tensor.attributes["unsigned"] = UnitAttr.get()
+            # reuse the global of an identical constant in the module
+            if external is not None:
+                key = (external, self.val.shape,
+                       self.val.dtype.str, str(self.dtype))
+            else:
+                key = global_constant_index.get_key(self.val, self.dtype)
+            module = GlobalInsertionPoint.get_global().block.owner.operation
+            name = global_constant_index.lookup(key, module)
+            if name is not None:
+                self.name = name
+            else:
+                sym_name = StringAttr.get(self.name)
+                type_attr = TypeAttr.get(memref_type)
+                if external is not None:
+                    # a public declaration, so that the JIT can resolve
+                    # it to the mapped file, see register_external_constants
+                    self.val.flush()
+                    value_attr = None
+                    sym_visibility = None
+                    add_external_data(
+                        module, self.name, *external, self.val.nbytes)
+                else:
+                    value_attr = DenseElementsAttr.get(self.val, type=dtype)
+                    sym_visibility = StringAttr.get("private")
+                const_tensor = memref.GlobalOp(
+                    sym_name,
+                    type_attr,
+                    sym_visibility=sym_visibility,
+                    initial_value=value_attr,
+                    constant=True,
+                    alignment=None,
+                    ip=GlobalInsertionPoint.get_global(),
+                )
+                const_tensor.attributes["constant"] = UnitAttr.get()
+                if is_unsigned_type(self.dtype):
+                    const_tensor.attributes["unsigned"] = UnitAttr.get()
+                if is_fixed_type(self.dtype):
+                    # lets emitters declare the global with the fixed point type
+                    const_tensor.attributes["fixed_type"] = TypeAttr.get(
+                        self.dtype)
+                global_constant_index.insert(key, module, self.name)
 
             if is_fixed_type(self.dtype):
                 tensor_wrapper = TensorOp(
@@ -850,6 +1626,9 @@ class ConstantOp(ExprOp):
                     ip=GlobalInsertionPoint.get(),
                 )
             else:
+                if is_integer_type(self.dtype) and dtype.width == self.dtype.width:
+                    # stored at its own width, loads need no cast
+                    dtype = self.dtype
                 tensor_wrapper = TensorOp(
                     self.val.shape, memref.AllocOp, dtype, "const_tensor"
                 )
@@ -860,6 +1639,8 @@ class ConstantOp(ExprOp):
                     FlatSymbolRefAttr.get(self.name),
                     ip=GlobalInsertionPoint.get(),
                 )
+                if is_unsigned_type(dtype):
+                    store.attributes["unsigned"] = UnitAttr.get()
             # Note: Why do we have an update_op here?
             # memref.GetGlobalOp is not subscriptable,
             # meaning that we can't do something like
@@ -881,14 +1662,11 @@ class ConstantOp(ExprOp):
                     if self.dtype.width == 1:
                         value_attr = BoolAttr.get(self.val)
                     else:
-                        if self.val == 0xFFFFFFFFFFFFFFFF:
-                            attr_type = IntegerType.get_signless(
-                                self.dtype.width)
-                            self.val = -1
-                        else:
-                            attr_type = IntegerType.get_signless(
-                                self.dtype.width)
-                        value_attr = IntegerAttr.get(attr_type, self.val)
+                        attr_type = IntegerType.get_signless(self.dtype.width)
+                        val = self.val
+                        if val == 0xFFFFFFFFFFFFFFFF:
+                            val = -1
+                        value_attr = IntegerAttr.get(attr_type, val)
                 elif isinstance(self.dtype, F16Type):
                     value_attr = FloatAttr.get(F16Type.get(), self.val)
                 elif isinstance(self.dtype, F32Type):
@@ -913,10 +1691,11 @@ class ConstantOp(ExprOp):
                     )
                 return self.built_op
             else:  # fixed types
-                self.val *= 2 ** self.dtype.frac
-                self.val %= 2 ** self.dtype.width
+                # keep self.val as the real value, it is read by folding
+                val = int(self.val * (2 ** self.dtype.frac))
+                val %= 2 ** self.dtype.width
                 value_attr = IntegerAttr.get(
-                    IntegerType.get_signless(self.dtype.width), self.val
+                    IntegerType.get_signless(self.dtype.width), val
                 )
                 self.built_op = self.op(
                     IntegerType.get_signless(64),
@@ -969,7 +1748,7 @@ class TensorSlice(ExprOp):
             new_indices = []
             for index in self.indices + indices:
                 if isinstance(index, int):
-                    index = ConstantOp(IndexType.get(), index)
+                    index = ConstantOp(IndexType.get(), index, lazy=True)
                 new_indices.append(index)
             load = LoadOp(self.parent, new_indices)
             # TODO(Niansong): Why build in place result in duplicate load?
@@ -990,7 +1769,7 @@ class TensorSlice(ExprOp):
             new_indices = []
             for index in indices:
                 if isinstance(index, int):
-                    index = ConstantOp(IndexType.get(), index)
+                    index = ConstantOp(IndexType.get(), index, lazy=True)
                 new_indices.append(index)
             return StoreOp(expr, self.parent, list(self.indices) + new_indices)
         else:
@@ -1075,7 +1854,7 @@ class TensorOp(ExprOp):
             new_indices = []
             for index in indices:
                 if isinstance(index, int):
-                    index = ConstantOp(IndexType.get(), index)
+                    index = ConstantOp(IndexType.get(), index, lazy=True)
                 new_indices.append(index)
             load = LoadOp(self, new_indices)
             # if flags.BUILD_INPLACE:
@@ -1096,7 +1875,7 @@ class TensorOp(ExprOp):
             new_indices = []
             for index in indices:
                 if isinstance(index, int):
-                    index = ConstantOp(IndexType.get(), index)
+                    index = ConstantOp(IndexType.get(), index, lazy=True)
                 new_indices.append(index)
             expr = get_hcl_op(expr)
             return StoreOp(expr, self, new_indices)
@@ -1550,10 +2329,23 @@ class CastOp(ExprOp):
                 op = hcl_d.FixedToFixedOp
         else:
             op = builtin.UnrealizedConversionCastOp
-            DTypeWarning(
-                "Unrealized conversion cast: {} -> {}".format(
-                    self.val.dtype, res_type)
-            ).warn()
+            diagnostics.warn(
+                DTypeWarning,
+                ("cast", self.val.dtype, res_type),
+                "Unrealized conversion cast: {} -> {}",
+                self.val.dtype,
+                res_type,
+            )
+
+        # cast of a constant: pass through a constant of the result type
+        if op not in (None, builtin.UnrealizedConversionCastOp):
+            const = get_constant(self.val)
+            if const is not None:
+                val = fold_cast(const[1], const[0], res_type)
+                if val is not None:
+                    self.val = make_constant(
+                        res_type, get_constant_value(res_type, val))
+                    op = None
 
         super().__init__(op, res_type)
         if flags.BUILD_INPLACE:
@@ -1606,11 +2398,13 @@ class GetBitOp(ExprOp):
             index = ConstantOp(IndexType.get(), index)
         self.index = index
         if not isinstance(self.index.dtype, IndexType):
-            DTypeWarning(
-                "GetBitOp's input is not an index. Cast from {} to {}.".format(
-                    self.index.dtype, IndexType.get()
-                )
-            ).warn()
+            diagnostics.warn(
+                DTypeWarning,
+                ("index", self.index.dtype),
+                "GetBitOp's input is not an index. Cast from {} to {}.",
+                self.index.dtype,
+                IndexType.get(),
+            )
             self.index = CastOp(self.index, IndexType.get())
         if flags.BUILD_INPLACE:
             self.build()
@@ -1668,11 +2462,13 @@ class SetBitOp(ExprOp):
             )
         self.val = val
         if not isinstance(self.index.dtype, IndexType):
-            DTypeWarning(
-                "SetBitOp's input is not an index. Cast from {} to {}.".format(
-                    self.index.dtype, IndexType.get()
-                )
-            ).warn()
+            diagnostics.warn(
+                DTypeWarning,
+                ("index", self.index.dtype),
+                "SetBitOp's input is not an index. Cast from {} to {}.",
+                self.index.dtype,
+                IndexType.get(),
+            )
             self.index = CastOp(self.index, IndexType.get())
         if flags.BUILD_INPLACE:
             self.build()
@@ -1702,11 +2498,13 @@ class GetSliceOp(ExprOp):
             if isinstance(index, int):
                 index = ConstantOp(IndexType.get(), index)
             if not isinstance(index.dtype, IndexType):
-                DTypeWarning(
-                    "GetSliceOp's input is not an index. Cast from {} to {}.".format(
-                        index.dtype, IndexType.get()
-                    )
-                ).warn()
+                diagnostics.warn(
+                    DTypeWarning,
+                    ("index", index.dtype),
+                    "GetSliceOp's input is not an index. Cast from {} to {}.",
+                    index.dtype,
+                    IndexType.get(),
+                )
                 index = CastOp(index, IndexType.get())
             return index
 
@@ -1742,11 +2540,13 @@ class SetSliceOp(ExprOp):
             if isinstance(index, int):
                 index = ConstantOp(IndexType.get(), index)
             if not isinstance(index.dtype, IndexType):
-                DTypeWarning(
-                    "SetSliceOp's input is not an index. Cast from {} to {}.".format(
-                        index.dtype, IndexType.get()
-                    )
-                ).warn()
+                diagnostics.warn(
+                    DTypeWarning,
+                    ("index", index.dtype),
+                    "SetSliceOp's input is not an index. Cast from {} to {}.",
+                    index.dtype,
+                    IndexType.get(),
+                )
                 index = CastOp(index, IndexType.get())
             return index
 
@@ -1782,46 +2582,39 @@ class LoadOp(ExprOp):
         self.indices = []
         for index in indices:
             if not isinstance(get_mlir_type(index.dtype), IndexType):
-                DTypeWarning(
-                    "LoadOp's input is not an index. Cast from {} to {}.".format(
-                        index.dtype, IndexType.get()
-                    )
-                ).warn()
-                index = CastOp(index, IndexType.get())
+                diagnostics.warn(
+                    DTypeWarning,
+                    ("index", index.dtype),
+                    "LoadOp's input is not an index. Cast from {} to {}.",
+                    index.dtype,
+                    IndexType.get(),
+                )
+                index = make_cast(index, IndexType.get())
             self.indices.append(index)
         if flags.BUILD_INPLACE:
             self.build()
 
     def build(self):
         # test if affine expressions
-        visitor = ASTVisitor(mode="profile")
-        exprs = []
-        flag = True
-        for index in self.indices:
-            try:
-                affine_expr = visitor.visit_affine_expr(index)
-                exprs.append(affine_expr)
-            except:
-                flag = False
-                break
-        if flag:
+        affine_access = affine_index_cache.get(self.indices)
+        if affine_access is not None:
+            affine_attr, ivs = affine_access
             remover = ASTVisitor(mode="remove")
             for index in self.indices:
                 if index.built_op is not None:
                     remover.visit(index)
-            affine_map = AffineMap.get(
-                dim_count=len(visitor.iv), symbol_count=0, exprs=exprs
-            )
-            affine_attr = AffineMapAttr.get(affine_map)
             self.built_op = self.op(
                 self.tensor.result,
-                visitor.iv,
+                ivs,
                 affine_attr,
                 ip=GlobalInsertionPoint.get(),
             )
         else:
             new_indices = []
             for index in self.indices:
+                # literal indices are lazy constants, only built here
+                if index.built_op is None:
+                    ASTVisitor("build").visit(index)
                 new_indices.append(index.result)
             self.built_op = memref.LoadOp(
                 self.tensor.result, new_indices, ip=GlobalInsertionPoint.get()
@@ -1837,53 +2630,49 @@ class StoreOp(ExprOp):
         super().__init__(affine.AffineStoreOp)
         val = get_hcl_op(val)
         if val.dtype != to_tensor.dtype:
-            DTypeWarning(
-                "StoreOp has different input types. Cast from {} to {}.".format(
-                    val.dtype, to_tensor.dtype)
-            ).warn()
+            diagnostics.warn(
+                DTypeWarning,
+                ("cast", val.dtype, to_tensor.dtype),
+                "StoreOp has different input types. Cast from {} to {}.",
+                val.dtype,
+                to_tensor.dtype,
+            )
             val = CastOp(val, to_tensor.dtype)
         self.val = val
         self.to_tensor = to_tensor
         self.indices = []
         for index in indices:
             if not isinstance(get_mlir_type(index.dtype), IndexType):
-                DTypeWarning(
-                    "StoreOp's input is not an index. Cast from {} to {}.".format(
-                        index.dtype, IndexType.get()
-                    )
-                ).warn()
-                index = CastOp(index, IndexType.get())
+                diagnostics.warn(
+                    DTypeWarning,
+                    ("index", index.dtype),
+                    "StoreOp's input is not an index. Cast from {} to {}.",
+                    index.dtype,
+                    IndexType.get(),
+                )
+                index = make_cast(index, IndexType.get())
             self.indices.append(index)
         if flags.BUILD_INPLACE:
             self.build()
 
     def build(self):
         # test if affine expressions
-        visitor = ASTVisitor(mode="profile")
-        exprs = []
-        flag = True
-        for index in self.indices:
-            try:
-                affine_expr = visitor.visit_affine_expr(index)
-                exprs.append(affine_expr)
-            except:
-                flag = False
-                break
-        if flag:
-            affine_map = AffineMap.get(
-                dim_count=len(visitor.iv), symbol_count=0, exprs=exprs
-            )
-            affine_attr = AffineMapAttr.get(affine_map)
+        affine_access = affine_index_cache.get(self.indices)
+        if affine_access is not None:
+            affine_attr, ivs = affine_access
             self.built_op = self.op(
                 self.val.result,
                 self.to_tensor.result,
-                visitor.iv,
+                ivs,
                 affine_attr,
                 ip=GlobalInsertionPoint.get(),
             )
         else:
             new_indices = []
             for index in self.indices:
+                # literal indices are lazy constants, only built here
+                if index.built_op is None:
+                    ASTVisitor("build").visit(index)
                 new_indices.append(index.result)
             self.built_op = memref.StoreOp(
                 self.val.result,
@@ -2058,10 +2847,660 @@ class MaxOp(ReduceOp):
         )
 
 
+#################################################
+#
+# Compact expression graph
+#
+#################################################
+
+
+class ExprGraph(object):
+    """Array-backed storage of scalar expressions.
+
+    Each node is a row of NumPy columns instead of a Python object: its
+    opcode, the id of its data type, the node ids of its operands, an
+    immediate value, and the handle of its built MLIR op. Node ids are
+    assigned in creation order, so the operands of a node always have
+    smaller ids than the node itself. Users hold ExprNode handles, thin
+    views carrying a node id that are only created on demand.
+
+    Operands that are not graph nodes, e.g. loads and loop induction
+    variables, are kept as external nodes referring to the ExprOp.
+    A node is built by creating the ExprOp it stands for on built
+    operands, so the ops are selected exactly as for the ExprOp classes.
+    """
+
+    EXTERNAL = 0
+    # opcode -> ExprOp class, index 0 is an external operand
+    OPCODES = (
+        None,
+        ConstantOp,
+        CastOp,
+        NegOp,
+        AddOp,
+        SubOp,
+        MulOp,
+        DivOp,
+        FloorDivOp,
+        RemOp,
+        AndOp,
+        OrOp,
+        XOrOp,
+    )
+    ARITH_OPS = (AddOp, SubOp, MulOp, DivOp, FloorDivOp, RemOp)
+    INTEGER_OPS = (AndOp, OrOp, XOrOp)
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.generation = -1
+        self.clear()
+
+    def clear(self):
+        """Drop all nodes. The existing handles are invalidated, as
+        their node ids are reused."""
+        self.generation += 1
+        self.size = 0
+        self.opcode = np.zeros(self.capacity, dtype=np.int8)
+        self.dtype = np.zeros(self.capacity, dtype=np.int16)
+        self.lhs = np.full(self.capacity, -1, dtype=np.int32)
+        self.rhs = np.full(self.capacity, -1, dtype=np.int32)
+        # constant value (float bits for floating point types)
+        # or index of the external operand
+        self.value = np.zeros(self.capacity, dtype=np.int64)
+        # index of the built op, -1 if not built, and -(index + 2) if
+        # the op is borrowed from the operand, i.e. a pass-through cast
+        self.built = np.full(self.capacity, -1, dtype=np.int32)
+        self.dtypes = []
+        self.dtype_ids = {}
+        self.externals = []
+        self.external_ids = {}
+        self.built_ops = []
+
+    def __len__(self):
+        return self.size
+
+    def grow(self):
+        capacity = self.capacity * 2
+        for name, fill in (
+            ("opcode", 0),
+            ("dtype", 0),
+            ("lhs", -1),
+            ("rhs", -1),
+            ("value", 0),
+            ("built", -1),
+        ):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[: self.capacity] = old
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def get_dtype_id(self, dtype):
+        key = (dtype.__class__, dtype)
+        dtype_id = self.dtype_ids.get(key)
+        if dtype_id is None:
+            dtype_id = len(self.dtypes)
+            self.dtypes.append(dtype)
+            self.dtype_ids[key] = dtype_id
+        return dtype_id
+
+    def add_node(self, opcode, dtype, lhs=-1, rhs=-1, value=0):
+        if self.size == self.capacity:
+            self.grow()
+        index = self.size
+        self.opcode[index] = opcode
+        self.dtype[index] = self.get_dtype_id(dtype)
+        self.lhs[index] = lhs
+        self.rhs[index] = rhs
+        self.value[index] = value
+        self.size += 1
+        if flags.BUILD_INPLACE:
+            self.build(index)
+        return index
+
+    def handle(self, index):
+        return ExprNode(self, index)
+
+    def get_dtype(self, index):
+        return self.dtypes[self.dtype[index]]
+
+    def set_dtype(self, index, dtype):
+        self.dtype[index] = self.get_dtype_id(dtype)
+
+    def get_built_op(self, index):
+        if self.opcode[index] == self.EXTERNAL:
+            return self.externals[self.value[index]].built_op
+        handle = self.built[index]
+        if handle == -1:
+            return None
+        elif handle < -1:
+            handle = -handle - 2
+        return self.built_ops[handle]
+
+    def set_built_op(self, index, op):
+        if op is None:
+            self.built[index] = -1
+        else:
+            self.built[index] = len(self.built_ops)
+            self.built_ops.append(op)
+
+    def get_node(self, expr):
+        """Return the node id of an operand, adding it to the graph if
+        it is a Python number or an ExprOp that is not a graph node.
+        """
+        if isinstance(expr, ExprNode) and expr.graph is self:
+            return expr.index
+        if isinstance(expr, (int, float)) and not isinstance(expr, bool):
+            if isinstance(expr, int):
+                if expr < 0xFFFFFFFF:
+                    dtype = IntegerType.get_signless(32)
+                else:
+                    dtype = IntegerType.get_signless(64)
+            else:
+                dtype = F32Type.get()
+            index = self.add_constant(dtype, expr)
+            if index is not None:
+                return index
+        expr = get_hcl_op(expr)
+        key = id(expr)
+        index = self.external_ids.get(key)
+        if index is None:
+            expr.dtype = get_mlir_type(expr.dtype)
+            index = self.add_node(
+                self.EXTERNAL, expr.dtype, value=len(self.externals))
+            # keep the ExprOp alive so that its id stays unique
+            self.externals.append(expr)
+            self.external_ids[key] = index
+        return index
+
+    def add_constant(self, dtype, val):
+        """Add a scalar constant, or return None if its value cannot be
+        kept in the value column."""
+        if is_integer_type(dtype) and dtype.width == 1:
+            return None
+        val = normalize_constant(dtype, val)
+        if val is None:
+            return None
+        if is_floating_point_type(dtype):
+            bits = int(np.array(val, dtype=np.float64).view(np.int64))
+        elif is_integer_type(dtype) and dtype.width > 64:
+            return None
+        else:
+            bits = wrap_integer(val, 64)
+        return self.add_node(self.OPCODES.index(ConstantOp), dtype, value=bits)
+
+    def get_constant(self, index):
+        """Return the folding value of a constant node, or None."""
+        if self.OPCODES[self.opcode[index]] is not ConstantOp:
+            return None
+        dtype = self.get_dtype(index)
+        bits = int(self.value[index])
+        if is_floating_point_type(dtype):
+            return float(np.array(bits, dtype=np.int64).view(np.float64))
+        elif is_fixed_type(dtype):
+            return wrap_integer(bits, dtype.width, is_signed_fixed_type(dtype))
+        return normalize_constant(dtype, bits)
+
+    def add_cast(self, index, res_type):
+        dtype = self.get_dtype(index)
+        if dtype == res_type:
+            return index
+        val = self.get_constant(index)
+        if val is not None:
+            val = fold_cast(val, dtype, res_type)
+            if val is not None:
+                folded = self.add_constant(
+                    res_type, get_constant_value(res_type, val))
+                if folded is not None:
+                    return folded
+        return self.add_node(self.OPCODES.index(CastOp), res_type, index)
+
+    def add_neg(self, index):
+        return self.add_node(
+            self.OPCODES.index(NegOp), self.get_dtype(index), index)
+
+    def add_binary_op(self, OpClass, lhs, rhs):
+        """Add a binary operation with the type conversion of
+        ExprOp.generic_op or ExprOp.generic_integer_op."""
+        lhs = self.get_node(lhs)
+        rhs = self.get_node(rhs)
+        ltype = self.get_dtype(lhs)
+        rtype = self.get_dtype(rhs)
+        if OpClass in self.INTEGER_OPS:
+            dtype = ltype
+            if ltype != rtype:
+                rhs = self.add_cast(rhs, ltype)
+        else:
+            dtype, cast_lhs, cast_rhs = type_registry.promote(ltype, rtype)
+            if cast_lhs:
+                diagnostics.warn(
+                    DTypeWarning, ("cast", ltype, dtype),
+                    "Casting value {} from {} to {}",
+                    self.handle(lhs), ltype, dtype)
+                lhs = self.add_cast(lhs, dtype)
+            if cast_rhs:
+                diagnostics.warn(
+                    DTypeWarning, ("cast", rtype, dtype),
+                    "Casting value {} from {} to {}",
+                    self.handle(rhs), rtype, dtype)
+                rhs = self.add_cast(rhs, dtype)
+        lval = self.get_constant(lhs)
+        rval = self.get_constant(rhs)
+        if lval is not None and rval is not None:
+            val = fold_binary_op(OpClass, dtype, lval, rval)
+            if val is not None:
+                folded = self.add_constant(
+                    dtype, get_constant_value(dtype, val))
+                if folded is not None:
+                    return folded
+        return self.add_node(self.OPCODES.index(OpClass), dtype, lhs, rhs)
+
+    def get_operand(self, index):
+        """Return an ExprOp standing for a built node."""
+        if self.opcode[index] == self.EXTERNAL:
+            return self.externals[self.value[index]]
+        placeholder = ExprOp(None, dtype=self.get_dtype(index))
+        placeholder.built_op = self.get_built_op(index)
+        return placeholder
+
+    def get_subgraph(self, index, unbuilt=False):
+        """Return the ids of the nodes an expression depends on,
+        in ascending order, i.e. operands first. If unbuilt is set, the
+        walk stops at built nodes, which are left out with their
+        operands."""
+        visited = {index}
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            if self.opcode[node] == self.EXTERNAL:
+                continue
+            for operand in (self.lhs[node], self.rhs[node]):
+                if operand < 0 or operand in visited:
+                    continue
+                if unbuilt and self.built[operand] != -1:
+                    continue
+                visited.add(int(operand))
+                stack.append(operand)
+        return sorted(visited)
+
+    def get_external_operands(self, index):
+        """Return the external ExprOps an expression depends on."""
+        return [
+            self.externals[self.value[node]]
+            for node in self.get_subgraph(index)
+            if self.opcode[node] == self.EXTERNAL
+        ]
+
+    def build(self, index):
+        """Build all unbuilt nodes of an expression at the current
+        insertion point and return the built op of the expression.
+        External operands are built lazily through their result."""
+        if self.get_built_op(index) is not None:
+            return self.get_built_op(index)
+        # The ExprOps are only created to build their op, they must not
+        # build themselves when created.
+        build_inplace = flags.BUILD_INPLACE
+        flags.BUILD_INPLACE = False
+        try:
+            # Only the unbuilt part is walked: nodes built in place are
+            # complete with their operands, so a chain grows in O(1).
+            for node in self.get_subgraph(index, unbuilt=True):
+                if self.built[node] == -1 and self.opcode[node] != self.EXTERNAL:
+                    self.build_node(node)
+        finally:
+            flags.BUILD_INPLACE = build_inplace
+        return self.get_built_op(index)
+
+    def build_node(self, index):
+        OpClass = self.OPCODES[self.opcode[index]]
+        dtype = self.get_dtype(index)
+        lhs = self.lhs[index]
+        rhs = self.rhs[index]
+        if OpClass is ConstantOp:
+            val = get_constant_value(dtype, self.get_constant(index))
+            expr = ConstantOp(dtype, val)
+        elif OpClass is CastOp:
+            expr = CastOp(self.get_operand(lhs), dtype)
+        elif OpClass is NegOp:
+            expr = NegOp(self.get_operand(lhs))
+        elif OpClass in self.INTEGER_OPS:
+            expr = OpClass(self.get_operand(lhs), self.get_operand(rhs))
+        else:
+            expr = OpClass(dtype, self.get_operand(lhs), self.get_operand(rhs))
+        built_op = expr.build()
+        if expr.op is None:  # pass-through
+            self.built_ops.append(built_op)
+            self.built[index] = -len(self.built_ops) - 1
+        else:
+            self.set_built_op(index, built_op)
+
+    def erase(self, index):
+        """Erase the built ops of an expression, users first. The ops
+        that are still used, e.g. by another expression sharing the
+        node, are kept with their operands. External operands are left
+        to the caller."""
+        subgraph = self.get_subgraph(index)
+        for node in reversed(subgraph):
+            handle = self.built[node]
+            if handle >= 0 and hcl_d.is_unused(
+                self.built_ops[handle].operation
+            ):
+                self.built_ops[handle].operation.erase()
+                self.built_ops[handle] = None
+                self.built[node] = -1
+        # a pass-through node goes with the op it borrows
+        for node in subgraph:
+            lhs = self.lhs[node]
+            if self.built[node] < -1 and (
+                self.opcode[lhs] == self.EXTERNAL or self.built[lhs] == -1
+            ):
+                self.built[node] = -1
+
+
+class ExprNode(ExprOp):
+    """Handle to a node of an ExprGraph
+
+    The handle only carries the graph and the node id; the type and the
+    built op are views into the columns of the graph. A handle is only
+    valid until the graph is cleared, see BuilderContext.finish().
+    """
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.generation = graph.generation
+        self.node = index
+
+    @property
+    def index(self):
+        if self.generation != self.graph.generation:
+            raise APIError(
+                "The expression belongs to a finished build and cannot "
+                "be used anymore")
+        return self.node
+
+    @property
+    def op(self):
+        return ExprGraph.OPCODES[self.graph.opcode[self.index]]
+
+    @property
+    def dtype(self):
+        return self.graph.get_dtype(self.index)
+
+    @dtype.setter
+    def dtype(self, dtype):
+        self.graph.set_dtype(self.index, dtype)
+
+    @property
+    def built_op(self):
+        return self.graph.get_built_op(self.index)
+
+    @built_op.setter
+    def built_op(self, op):
+        self.graph.set_built_op(self.index, op)
+
+    @property
+    def result(self):
+        if self.built_op is None:
+            ASTVisitor(mode="build").visit(self)
+        return self.built_op.result
+
+    def build(self):
+        return ASTVisitor(mode="build").visit(self)
+
+    def __neg__(self):
+        return self.graph.handle(self.graph.add_neg(self.index))
+
+
+expr_graph = BuilderProxy("expr_graph")
+
+
+class AffineIndexCache(object):
+    """Memoized affine analysis of LoadOp/StoreOp indices.
+
+    The indices are encoded into a structural key in which the loop
+    induction variables are numbered by their first appearance, so all
+    accesses sharing the same index shape, e.g. A[i+1, j] and B[k+1, l],
+    share one cached AffineMapAttr. The operands are always taken from
+    the IterVars of the current access.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.maps = {}
+
+    def clear(self):
+        self.context = None
+        self.maps = {}
+
+    def get(self, indices):
+        """Analyze the indices of a memory access.
+
+        Parameters
+        ----------
+        indices : list of ExprOp
+            The index expressions.
+
+        Returns
+        -------
+        ret : tuple or None
+            A tuple of the AffineMapAttr and the list of its dimension
+            operands, or None if any index is not an affine expression.
+        """
+        ivs = []
+        keys = []
+        for index in indices:
+            key = self.encode(index, ivs)
+            if key is None:
+                return None
+            keys.append(key[0])
+        keys = tuple(keys)
+        context = Context.current
+        if context is not self.context:
+            self.context = context
+            self.maps = {}
+        affine_attr = self.maps.get(keys)
+        if affine_attr is None:
+            affine_map = AffineMap.get(
+                dim_count=len(ivs),
+                symbol_count=0,
+                exprs=[self.materialize(key) for key in keys],
+            )
+            affine_attr = AffineMapAttr.get(affine_map)
+            self.maps[keys] = affine_attr
+        return affine_attr, ivs
+
+    def encode(self, expr, ivs):
+        """Return the structural key of an index expression and whether
+        it depends on an induction variable, or None if it is not affine.
+        Induction variables are appended to `ivs` on first appearance.
+        """
+        if isinstance(expr, IterVar):
+            if isinstance(expr.op.owner.owner, scf.ForOp):
+                # outer loop is not affine
+                return None
+            for pos, iv in enumerate(ivs):
+                if iv == expr.op:
+                    break
+            else:
+                pos = len(ivs)
+                ivs.append(expr.op)  # BlockArgument
+            return ("dim", pos), True
+        elif isinstance(expr, ConstantOp):
+            if not isinstance(expr.val, (int, np.integer)):
+                return None
+            return ("const", int(expr.val)), False
+        elif isinstance(expr, CastOp):
+            return self.encode(expr.val, ivs)
+        elif isinstance(expr, ExprNode):
+            return self.encode_node(expr.graph, expr.index, ivs)
+        kind = AFFINE_BINARY_OPS.get(type(expr))
+        if kind is None:
+            return None
+        lhs = self.encode(expr.lhs, ivs)
+        if lhs is None:
+            return None
+        rhs = self.encode(expr.rhs, ivs)
+        return self.combine(kind, lhs, rhs)
+
+    def encode_node(self, graph, index, ivs):
+        """encode() for a node of an ExprGraph."""
+        OpClass = ExprGraph.OPCODES[graph.opcode[index]]
+        if OpClass is None:
+            return self.encode(graph.externals[graph.value[index]], ivs)
+        elif OpClass is ConstantOp:
+            dtype = graph.get_dtype(index)
+            if not (is_integer_type(dtype) or is_index_type(dtype)):
+                return None
+            return ("const", graph.get_constant(index)), False
+        elif OpClass is CastOp:
+            return self.encode_node(graph, graph.lhs[index], ivs)
+        kind = AFFINE_BINARY_OPS.get(OpClass)
+        if kind is None:
+            return None
+        lhs = self.encode_node(graph, graph.lhs[index], ivs)
+        if lhs is None:
+            return None
+        rhs = self.encode_node(graph, graph.rhs[index], ivs)
+        return self.combine(kind, lhs, rhs)
+
+    def combine(self, kind, lhs, rhs):
+        if rhs is None:
+            return None
+        # a product needs a constant factor, a division a constant divisor
+        if kind == "mul" and lhs[1] and rhs[1]:
+            return None
+        if kind in ("floordiv", "mod") and rhs[1]:
+            return None
+        return (kind, lhs[0], rhs[0]), lhs[1] or rhs[1]
+
+    def materialize(self, key):
+        """Build the AffineExpr of a structural key."""
+        kind = key[0]
+        if kind == "dim":
+            return AffineExpr.get_dim(key[1])
+        elif kind == "const":
+            return AffineExpr.get_constant(key[1])
+        lhs = self.materialize(key[1])
+        rhs = self.materialize(key[2])
+        if kind == "add":
+            return lhs + rhs
+        elif kind == "sub":
+            return lhs - rhs
+        elif kind == "mul":
+            return lhs * rhs
+        elif kind == "floordiv":
+            return AffineExpr.get_floor_div(lhs, rhs)
+        else:  # mod
+            return lhs % rhs
+
+
+AFFINE_BINARY_OPS = {
+    AddOp: "add",
+    SubOp: "sub",
+    MulOp: "mul",
+    DivOp: "floordiv",
+    RemOp: "mod",
+}
+
+affine_index_cache = BuilderProxy("affine_index_cache")
+
+
+class BuilderContext(object):
+    """State of one IR builder: the insertion point stack, the build flags,
+    the caches and the diagnostics of the builder.
+
+    The module-level GlobalInsertionPoint, flags, caches and diagnostics
+    forward to the builder that is current in the running thread or
+    asyncio task. A BuilderContext is made current with a with statement,
+    so that modules can be built concurrently in a thread pool or
+    interleaved in one thread:
+
+        with hcl_mlir.BuilderContext() as builder:
+            hcl_mlir.enable_build_inplace()
+            ...
+
+    Threads and tasks that do not enter a builder share the default one.
+    """
+
+    def __init__(self):
+        self.flags = HCLFlags()
+        self.insertion_point = HCLMLIRInsertionPoint()
+        self.type_registry = TypeRegistry()
+        self.global_constant_index = GlobalConstantIndex()
+        self.expr_graph = ExprGraph()
+        self.affine_index_cache = AffineIndexCache()
+        self.diagnostics = DiagnosticEngine()
+        self.tokens = []
+
+    def __enter__(self):
+        self.tokens.append(current_builder.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        current_builder.reset(self.tokens.pop())
+        if not self.tokens:
+            self.finish()
+
+    def finish(self):
+        """Report the aggregated warnings of the module that was built and
+        drop the state that refers to its ops, i.e. the expression graph.
+        Called when the builder is left, and by finish_build for the
+        default builder."""
+        self.diagnostics.report()
+        self.expr_graph.clear()
+
+
+current_builder = contextvars.ContextVar(
+    "hcl_builder", default=BuilderContext())
+
+
+def get_builder():
+    return current_builder.get()
+
+
+def finish_build():
+    """End the module built by the current builder"""
+    current_builder.get().finish()
+
+
 class ASTVisitor:
+    # Handler of each AST node class and the operands the visitor walks
+    # before (build, profile) or after (remove) calling it. A concrete
+    # class uses the first entry it is a subclass of, following the same
+    # priority as the original isinstance chain. Anything else is treated
+    # as a block argument, i.e. an IterVar.
+    _VISIT_RULES = (
+        (UnaryOp, "visit_unary_op", lambda e: (e.val,)),
+        (BinaryOp, "visit_binary_op", lambda e: (e.lhs, e.rhs)),
+        (SelectOp, "visit_ternary_op", lambda e: (e.cond, e.true_val, e.false_val)),
+        (LoadOp, "visit_load_op", None),
+        (StoreOp, "visit_store_op", None),
+        (GetBitOp, "visit_getbit_op", lambda e: (e.num, e.index)),
+        (SetBitOp, "visit_setbit_op", lambda e: (e.num, e.index, e.val)),
+        (GetSliceOp, "visit_getslice_op", lambda e: (e.num, e.hi, e.lo)),
+        (SetSliceOp, "visit_setslice_op", lambda e: (e.num, e.hi, e.lo, e.val)),
+        (CastOp, "visit_cast_op", lambda e: (e.val,)),
+        (ReduceOp, "visit_reduce_op", None),
+        (ConstantOp, "visit_constant_op", None),
+        # tuple expr corresponds to a struct construction
+        (tuple, "visit_struct_op", None),
+        (StructGetOp, "visit_struct_get_op", lambda e: (e.struct,)),
+        (ExprNode, "visit_graph_node", None),
+    )
+    # Handlers that build their operands themselves in build mode,
+    # e.g. inside the regions of an scf.if
+    _SELF_BUILDING_HANDLERS = ("visit_ternary_op",)
+    _MODES = ("build", "remove", "profile")
+    # node class -> (handler, operands), filled on first use per mode
+    _dispatch_tables = {mode: {} for mode in _MODES}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch_tables = {mode: {} for mode in cls._MODES}
+
     def __init__(self, mode="build"):
         self.iv = []
-        if mode not in ["build", "remove", "profile"]:
+        if mode not in self._MODES:
             raise APIError(
                 "ASTVisitor only supports build, remove, or profile mode"
             )
@@ -2069,47 +3508,72 @@ class ASTVisitor:
         self.load = []
         self.store = []
         self.scf_cnt = 0
+        self._dispatch_table = self._dispatch_tables[mode]
+
+    def _resolve(self, node_cls):
+        for rule_cls, name, operands in self._VISIT_RULES:
+            if issubclass(node_cls, rule_cls):
+                break
+        else:  # IterVar
+            name, operands = "visit_block_arg", None
+        if self.mode == "build" and name in self._SELF_BUILDING_HANDLERS:
+            operands = None
+        entry = (getattr(type(self), name), operands)
+        self._dispatch_table[node_cls] = entry
+        return entry
 
     def visit(self, expr):
-        """Apply the visitor to an expression."""
-        if (
-            self.mode == "build"
-            and not isinstance(expr, tuple)
-            and expr.built_op is not None
-        ):
-            return expr.built_op
+        """Apply the visitor to an expression.
 
-        if isinstance(expr, UnaryOp):
-            return self.visit_unary_op(expr)
-        elif isinstance(expr, BinaryOp):
-            return self.visit_binary_op(expr)
-        elif isinstance(expr, SelectOp):
-            return self.visit_ternary_op(expr)
-        elif isinstance(expr, LoadOp):
-            return self.visit_load_op(expr)
-        elif isinstance(expr, StoreOp):
-            return self.visit_store_op(expr)
-        elif isinstance(expr, GetBitOp):
-            return self.visit_getbit_op(expr)
-        elif isinstance(expr, SetBitOp):
-            return self.visit_setbit_op(expr)
-        elif isinstance(expr, GetSliceOp):
-            return self.visit_getslice_op(expr)
-        elif isinstance(expr, SetSliceOp):
-            return self.visit_setslice_op(expr)
-        elif isinstance(expr, CastOp):
-            return self.visit_cast_op(expr)
-        elif isinstance(expr, ReduceOp):
-            return self.visit_reduce_op(expr)
-        elif isinstance(expr, ConstantOp):
-            return self.visit_constant_op(expr)
-        elif isinstance(expr, tuple):
-            # tuple expr corresponds to a struct construction
-            return self.visit_struct_op(expr)
-        elif isinstance(expr, StructGetOp):
-            return self.visit_struct_get_op(expr)
-        else:  # IterVar
-            return self.visit_block_arg(expr)
+        The expression graph is walked with an explicit work stack
+        instead of Python recursion, so the depth of an expression is
+        not limited by the interpreter recursion limit. The operands of
+        a node are visited before its handler in build and profile mode,
+        and after it in remove mode.
+        """
+        build = self.mode == "build"
+        remove = self.mode == "remove"
+        table = self._dispatch_table
+        result = None
+        # (node, handler): handler is None if the node is not expanded yet
+        stack = [(expr, None)]
+        while stack:
+            node, handler = stack.pop()
+            if handler is not None:
+                result = handler(self, node)
+                continue
+            node_cls = node.__class__
+            if build and node_cls is not tuple and node.built_op is not None:
+                result = node.built_op
+                continue
+            if (
+                remove
+                and node_cls is not tuple
+                and node.pooled
+                and node.op is not None
+            ):
+                # a hash-consed expression is shared by all its users and
+                # only erased, with its operands, after the last of them.
+                # The use list of its op is its reference count.
+                if node.built_op is None or not hcl_d.is_unused(
+                    node.built_op.operation
+                ):
+                    continue
+            entry = table.get(node_cls)
+            if entry is None:
+                entry = self._resolve(node_cls)
+            handler, operands = entry
+            if operands is None:
+                result = handler(self, node)
+            elif remove:
+                result = handler(self, node)
+                stack.extend([(operand, None) for operand in operands(node)])
+            else:
+                stack.append((node, handler))
+                stack.extend(
+                    [(operand, None) for operand in reversed(operands(node))]
+                )
+        return result
 
     def visit_block_arg(self, expr):
         if self.mode == "profile":
@@ -2162,76 +3626,87 @@ class ASTVisitor:
         if expr.op is None:
             expr.built_op = None
             return
+        # shared sub-expressions of a DAG are only erased once
+        if expr.built_op is None:
+            return
         expr.built_op.operation.erase()
         expr.built_op = None
 
-    def visit_unary_op(self, expr):
+    def visit_inner_op(self, expr):
+        # operands have already been visited (build, profile)
+        # or are visited right after (remove)
         if self.mode == "build":
-            self.visit(expr.val)
             return expr.build()
-        elif self.mode == "profile":
-            self.visit(expr.val)
-        else:
+        elif self.mode == "remove":
             self.erase_op(expr)
-            self.visit(expr.val)
 
-    def visit_binary_op(self, expr):
-        if self.mode == "build":
-            self.visit(expr.lhs)
-            self.visit(expr.rhs)
-            return expr.build()
-        elif self.mode == "profile":
-            self.visit(expr.lhs)
-            self.visit(expr.rhs)
-        else:
-            self.erase_op(expr)
-            self.visit(expr.rhs)
-            self.visit(expr.lhs)
+    visit_unary_op = visit_inner_op
+    visit_binary_op = visit_inner_op
+    visit_cast_op = visit_inner_op
+    visit_getbit_op = visit_inner_op
+    visit_getslice_op = visit_inner_op
+    visit_setbit_op = visit_inner_op
+    visit_setslice_op = visit_inner_op
 
     def visit_ternary_op(self, expr):
+        if self.mode != "build":
+            return self.visit_inner_op(expr)
+        # condition
+        if is_unsigned_type(expr.dtype):
+            dtype = IntegerType.get_signless(expr.dtype.width)
+        else:
+            dtype = expr.dtype
+        if_op = make_if(
+            expr.cond,
+            ip=GlobalInsertionPoint.get(),
+            hasElse=True,
+            resultType=[dtype],
+            yieldOp=False,
+        )
+        if is_unsigned_type(expr.dtype):
+            if_op.attributes["unsigned"] = UnitAttr.get()
+        # true branch
+        GlobalInsertionPoint.save(if_op.then_block)
+        true_val = self.visit(expr.true_val).result
+        if isinstance(if_op, affine.AffineIfOp):
+            affine.AffineYieldOp([true_val], ip=GlobalInsertionPoint.get())
+        else:  # scf.IfOp
+            scf.YieldOp([true_val], ip=GlobalInsertionPoint.get())
+        GlobalInsertionPoint.restore()
+        # false branch
+        GlobalInsertionPoint.save(if_op.else_block)
+        false_val = self.visit(expr.false_val).result
+        if isinstance(if_op, affine.AffineIfOp):
+            affine.AffineYieldOp(
+                [false_val], ip=GlobalInsertionPoint.get())
+        else:  # scf.IfOp
+            scf.YieldOp([false_val], ip=GlobalInsertionPoint.get())
+        GlobalInsertionPoint.restore()
+        expr.built_op = if_op
+        return if_op
+
+    def visit_graph_node(self, expr):
+        graph = expr.graph
         if self.mode == "build":
-            # condition
-            if is_unsigned_type(expr.dtype):
-                dtype = IntegerType.get_signless(expr.dtype.width)
-            else:
-                dtype = expr.dtype
-            if_op = make_if(
-                expr.cond,
-                ip=GlobalInsertionPoint.get(),
-                hasElse=True,
-                resultType=[dtype],
-                yieldOp=False,
-            )
-            if is_unsigned_type(expr.dtype):
-                if_op.attributes["unsigned"] = UnitAttr.get()
-            # true branch
-            GlobalInsertionPoint.save(if_op.then_block)
-            true_val = self.visit(expr.true_val).result
-            if isinstance(if_op, affine.AffineIfOp):
-                affine.AffineYieldOp([true_val], ip=GlobalInsertionPoint.get())
-            else:  # scf.IfOp
-                scf.YieldOp([true_val], ip=GlobalInsertionPoint.get())
-            GlobalInsertionPoint.restore()
-            # false branch
-            GlobalInsertionPoint.save(if_op.else_block)
-            false_val = self.visit(expr.false_val).result
-            if isinstance(if_op, affine.AffineIfOp):
-                affine.AffineYieldOp(
-                    [false_val], ip=GlobalInsertionPoint.get())
-            else:  # scf.IfOp
-                scf.YieldOp([false_val], ip=GlobalInsertionPoint.get())
-            GlobalInsertionPoint.restore()
-            expr.built_op = if_op
-            return if_op
-        elif self.mode == "profile":
-            self.visit(expr.cond)
-            self.visit(expr.true_val)
-            self.visit(expr.false_val)
+            # the external operands are built by the visitor,
+            # the graph nodes in id order by the graph
+            for operand in graph.get_external_operands(expr.index):
+                self.visit(operand)
+            return graph.build(expr.index)
+        elif self.mode == "remove":
+            graph.erase(expr.index)
+            # the operands still used by kept nodes are kept as well
+            for operand in graph.get_external_operands(expr.index):
+                if (
+                    operand.op is not None
+                    and operand.built_op is not None
+                    and not hcl_d.is_unused(operand.built_op.operation)
+                ):
+                    continue
+                self.visit(operand)
         else:
-            self.erase_op(expr)
-            self.visit(expr.false_val)
-            self.visit(expr.true_val)
-            self.visit(expr.cond)
+            for operand in graph.get_external_operands(expr.index):
+                self.visit(operand)
 
     def visit_struct_op(self, expr):
         fields = [self.visit(e) for e in expr]
@@ -2239,7 +3714,9 @@ class ASTVisitor:
         return op.build()
 
     def visit_struct_get_op(self, expr):
-        self.visit(expr.struct)
+        if self.mode == "remove":
+            self.erase_op(expr)
+            return
         return expr.build()
 
     def visit_load_op(self, expr):
@@ -2262,61 +3739,6 @@ class ASTVisitor:
         else:
             return expr.build()
 
-    def visit_cast_op(self, expr):
-        if self.mode == "remove":
-            self.erase_op(expr)
-        self.visit(expr.val)
-        if self.mode == "build":
-            return expr.build()
-
-    def visit_getbit_op(self, expr):
-        if self.mode == "build":
-            self.visit(expr.num)
-            self.visit(expr.index)
-            return expr.build()
-        elif self.mode == "remove":
-            self.erase_op(expr)
-            self.visit(expr.index)
-            self.visit(expr.num)
-        else:
-            self.visit(expr.num)
-            self.visit(expr.index)
-
-    def visit_getslice_op(self, expr):
-        if self.mode == "build":
-            self.visit(expr.num)
-            self.visit(expr.hi)
-            self.visit(expr.lo)
-            return expr.build()
-        elif self.mode == "remove":
-            self.erase_op(expr)
-            self.visit(expr.lo)
-            self.visit(expr.hi)
-            self.visit(expr.num)
-        else:
-            self.visit(expr.num)
-            self.visit(expr.hi)
-            self.visit(expr.lo)
-
-    def visit_setbit_op(self, expr):
-        if self.mode == "remove":
-            self.erase_op(expr)
-        self.visit(expr.num)
-        self.visit(expr.index)
-        self.visit(expr.val)
-        if self.mode == "build":
-            return expr.build()
-
-    def visit_setslice_op(self, expr):
-        if self.mode == "remove":
-            self.erase_op(expr)
-        self.visit(expr.num)
-        self.visit(expr.hi)
-        self.visit(expr.lo)
-        self.visit(expr.val)
-        if self.mode == "build":
-            return expr.build()
-
     def visit_constant_op(self, expr):
         if self.mode == "build":
             return expr.build()
@@ -2432,11 +3854,13 @@ class ASTVisitor:
         if "unsigned" in data.attributes:
             data_type = IntegerType.get_unsigned(data_type.width)
         if dtype != data_type:
-            DTypeWarning(
-                "Reduction variable should have the same type with the data. Got {0} and {1}. Do type casting from {1} to {0}".format(
-                    dtype, data_type
-                )
-            ).warn()
+            diagnostics.warn(
+                DTypeWarning,
+                ("cast", data_type, dtype),
+                "Reduction variable should have the same type with the data. Got {0} and {1}. Do type casting from {1} to {0}",
+                dtype,
+                data_type,
+            )
             placeholder = ExprOp(None, dtype=data_type)
             placeholder.built_op = data
             data = CastOp(placeholder, dtype)
@@ -0,0 +1,307 @@
+# ===----------------------------------------------------------------------=== #
+#
+# Copyright 2021-2022 The HCL-MLIR Authors.
+#
+# ===----------------------------------------------------------------------=== #
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from hcl_mlir import _mlir_libs
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.ir import *
+from hcl_mlir.exceptions import *
+
+__all__ = ["CompilationCache"]
+
+# Part of every key, so that the entries of an older layout are never hit
+CACHE_VERSION = "1"
+
+build_id = None
+
+CACHED_PASSES = {
+    "loop_transformation": hcl_d.loop_transformation,
+    "lower_composite_type": hcl_d.lower_composite_type,
+    "lower_bit_ops": hcl_d.lower_bit_ops,
+    "legalize_cast": hcl_d.legalize_cast,
+    "remove_stride_map": hcl_d.remove_stride_map,
+    "lower_fixed_to_int": hcl_d.lower_fixed_to_int,
+    "lower_anywidth_int": hcl_d.lower_anywidth_int,
+    "lower_anywidth_int_native": lambda module: hcl_d.lower_anywidth_int(
+        module, native_width=True),
+    "move_return_to_input": hcl_d.move_return_to_input,
+    "lower_loop_attributes": hcl_d.lower_loop_attributes,
+    "lower_hcl_to_llvm": lambda module, num_threads: hcl_d.lower_hcl_to_llvm(
+        module, module.context, num_threads=num_threads),
+}
+
+# pass -> the options it accepts and their defaults
+CACHED_PASS_OPTIONS = {
+    "lower_anywidth_int": {"native_width": False},
+    "lower_loop_attributes": {"interleave_factor": 4},
+    "lower_hcl_to_llvm": {"num_threads": 1},
+}
+
+CACHED_EMITTERS = {
+    "vhls": hcl_d.emit_vhls_str,
+    "ihls": hcl_d.emit_ihls_str,
+}
+
+
+def get_build_id():
+    """Identifier of the native libraries of the package, i.e. of the HCL
+    passes and emitters and of the LLVM they are built with. It is part
+    of every key, so that the results of another build are never hit."""
+    global build_id
+    if build_id is None:
+        h = hashlib.sha256()
+        lib_dir = os.path.dirname(_mlir_libs.__file__)
+        for name in sorted(os.listdir(lib_dir)):
+            if not name.endswith((".so", ".dylib", ".dll", ".pyd")):
+                continue
+            stat = os.stat(os.path.join(lib_dir, name))
+            h.update("{}:{}:{}".format(
+                name, stat.st_size, stat.st_mtime_ns).encode())
+        build_id = h.hexdigest()
+    return build_id
+
+
+def get_module_fingerprint(module):
+    """Content hash of a module, including the state of the files of its
+    external constants, which the IR only references"""
+    h = hashlib.sha256(str(module).encode())
+    attributes = module.operation.attributes
+    if "hcl.external_data" in attributes:
+        for entry in DictAttr(attributes["hcl.external_data"]):
+            path = StringAttr(ArrayAttr(entry.attr)[0]).value
+            stat = os.stat(path)
+            h.update("{}:{}:{}".format(
+                path, stat.st_size, stat.st_mtime_ns).encode())
+    return h.hexdigest()
+
+
+class CompilationCache(object):
+    """Content-addressed on-disk cache of compilation results.
+
+    Entries are keyed by a hash of the module IR, the applied passes and
+    their options, and are shared by all processes that use the same
+    directory. Transformed modules are stored as MLIR assembly, emitted
+    HLS code as text and JIT-compiled code as object files. When the
+    entries exceed max_size bytes, the least recently used ones are
+    evicted.
+
+    Parameters
+    ----------
+    path : str, optional
+        The cache directory, $HCL_CACHE_DIR or ~/.cache/hcl_mlir by
+        default.
+
+    max_size : int, optional
+        The size budget in bytes.
+    """
+
+    def __init__(self, path=None, max_size=1 << 30):
+        if path is None:
+            path = os.environ.get(
+                "HCL_CACHE_DIR",
+                os.path.join(os.path.expanduser("~"), ".cache", "hcl_mlir"))
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.size = sum(size for _, _, size in self.entries())
+
+    def key(self, *parts):
+        """Hash of the parts of a key, which are converted to str, for the
+        cache version and the build of the package"""
+        h = hashlib.sha256(CACHE_VERSION.encode())
+        h.update(get_build_id().encode())
+        for part in parts:
+            data = str(part).encode()
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def get_path(self, key, kind):
+        return os.path.join(self.path, key[:2], key + "." + kind)
+
+    def entries(self):
+        """(path, last use, size) of all entries"""
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.startswith("tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def lookup(self, key, kind):
+        """Return the path of an entry and mark it as used, or None"""
+        path = self.get_path(key, kind)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses[kind] += 1
+            return None
+        with self.lock:
+            self.hits[kind] += 1
+        return path
+
+    def get(self, key, kind):
+        """Return the data of an entry, or None"""
+        path = self.lookup(key, kind)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return None
+
+    def put(self, key, kind, data):
+        """Store the data of an entry and return its path"""
+        path = self.get_path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file first, so that readers of other
+        # processes never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.commit(tmp, path)
+
+    def put_file(self, key, kind, src):
+        """Move a file into the cache as an entry and return its path"""
+        path = self.get_path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        os.replace(src, tmp)
+        return self.commit(tmp, path)
+
+    def commit(self, tmp, path):
+        size = os.path.getsize(tmp)
+        with self.lock:
+            # an entry written again replaces the previous file
+            try:
+                size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+        return path
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the statistics"""
+        with self.lock:
+            for path, _, _ in list(self.entries()):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.size = 0
+            self.hits.clear()
+            self.misses.clear()
+            self.evictions = 0
+
+    def statistics(self):
+        """Hits and misses per kind of entry, evictions and size"""
+        with self.lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.evictions,
+                "size": self.size,
+            }
+
+    def run_passes(self, module, passes):
+        """Apply a list of passes to a module, e.g. ["loop_transformation",
+        ("lower_hcl_to_llvm", {"num_threads": 4})].
+
+        A pass is a name in CACHED_PASSES, or a (name, options) pair for
+        the options in CACHED_PASS_OPTIONS, which are part of the key
+        with their defaults. On a miss, the passes are applied to the
+        module in place and the module is returned. On a hit, the cached
+        result is parsed into a new module of the same context, and the
+        given module is not changed.
+        """
+        pipeline = []
+        for entry in passes:
+            name, options = (entry, {}) if isinstance(entry, str) else entry
+            if name not in CACHED_PASSES:
+                raise APIError("Unknown pass {}, expected one of {}".format(
+                    name, list(CACHED_PASSES)))
+            defaults = CACHED_PASS_OPTIONS.get(name, {})
+            unknown = set(options) - set(defaults)
+            if unknown:
+                raise APIError(
+                    "Unknown options {} of pass {}, expected some of {}".format(
+                        sorted(unknown), name, list(defaults)))
+            pipeline.append((name, dict(defaults, **options)))
+        key = self.key(get_module_fingerprint(module), "passes", *[
+            (name, sorted(options.items())) for name, options in pipeline])
+        data = self.get(key, "mlir")
+        if data is not None:
+            return Module.parse(data.decode(), module.context)
+        for name, options in pipeline:
+            if not CACHED_PASSES[name](module, **options):
+                raise APIError("Pass {} failed".format(name))
+        self.put(key, "mlir", str(module).encode())
+        return module
+
+    def emit(self, module, target="vhls"):
+        """Return the HLS code of a module for the target "vhls" or
+        "ihls", or None if the emission fails"""
+        if target not in CACHED_EMITTERS:
+            raise APIError("Unknown target {}, expected one of {}".format(
+                target, list(CACHED_EMITTERS)))
+        key = self.key(get_module_fingerprint(module), "emit", target)
+        data = self.get(key, "cpp")
+        if data is not None:
+            return data.decode()
+        code = CACHED_EMITTERS[target](module)
+        if code is not None:
+            self.put(key, "cpp", code.encode())
+        return code
+
+    def object_key(self, module, opt_level, shared_libs=None, num_threads=1):
+        """Key of the JIT-compiled code of a module lowered to LLVM for
+        num_threads threads"""
+        return self.key(get_module_fingerprint(module), "object", opt_level,
+                        sorted(shared_libs or []), num_threads)
+
+    def put_object(self, key, engine):
+        """Store the object file of an ExecutionEngine, whose code has
+        been generated by a lookup, and return its path or None"""
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".o")
+        os.close(fd)
+        engine.dump_to_object_file(tmp)
+        if os.path.getsize(tmp) == 0:
+            os.remove(tmp)
+            return None
+        return self.put_file(key, "o", tmp)
@@ -1,3 +1,5 @@
+import os
+import sys
 import warnings
 
 # By default, Python ignores deprecation warnings.
@@ -185,4 +187,119 @@ class HCLDeprecationWarning(HCLWarning):
 
     def __init__(self, msg, line=None):
         category_str = bcolors.WARNING + "[Deprecation]" + bcolors.ENDC
-        HCLWarning.__init__(self, msg, line, category_str, DeprecationWarning)
\ No newline at end of file
+        HCLWarning.__init__(self, msg, line, category_str, DeprecationWarning)
+
+
+# the frames of the package are skipped to find the call site of a warning
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def get_call_site():
+    """(file, line) of the innermost frame outside of the package"""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename.startswith(
+        PACKAGE_DIR
+    ):
+        frame = frame.f_back
+    if frame is None:
+        return ("<unknown>", 0)
+    return (frame.f_code.co_filename, frame.f_lineno)
+
+
+class DiagnosticEngine(object):
+    """Issues the warnings of an IR builder, each BuilderContext has its
+    own engine.
+
+    Warnings of hot paths like implicit casts are reported with a message
+    format and its arguments, and the message is only formatted when the
+    warning is issued.
+
+    Modes
+    -----
+    "always"
+        Every warning is formatted and issued.
+    "aggregate"
+        A warning is issued on the first occurrence per call site and
+        kind, later occurrences are only counted. The call site is the
+        first frame of the user's code, outside of the package. report()
+        lists the counts and call sites at the end of a build.
+    "off"
+        Warnings are dropped without being formatted or counted.
+    """
+
+    MODES = ("always", "aggregate", "off")
+
+    def __init__(self, mode="aggregate"):
+        self.set_mode(mode)
+
+    def set_mode(self, mode):
+        if mode not in self.MODES:
+            raise APIError(
+                "Unknown diagnostic mode {}, expected one of {}".format(
+                    mode, self.MODES))
+        self.mode = mode
+        self.clear()
+
+    def clear(self):
+        # (call site, category, kind) -> [message, count]
+        self.entries = {}
+
+    def warn(self, category, kind, fmt, *args):
+        """Issue a warning of an HCLWarning subclass.
+
+        Parameters
+        ----------
+        category : type
+            The warning class, e.g. DTypeWarning.
+
+        kind : hashable
+            What is warned about, e.g. the source and target types of a
+            cast. Warnings are deduplicated by call site and kind.
+
+        fmt : str
+            The message format, formatted with args.
+        """
+        if self.mode == "off":
+            return
+        if self.mode == "always":
+            category(fmt.format(*args)).warn()
+            return
+        key = (get_call_site(), category, kind)
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[1] += 1
+            return
+        message = fmt.format(*args)
+        self.entries[key] = [message, 1]
+        category(message).warn()
+
+    def summary(self):
+        """Return (category, message, count, call site) of the aggregated
+        warnings, most frequent first. The message is the one of the
+        first occurrence, the call site is a (file, line) pair."""
+        entries = [
+            (key[1], message, count, key[0])
+            for key, (message, count) in self.entries.items()
+        ]
+        return sorted(entries, key=lambda entry: -entry[2])
+
+    def report(self, file=None):
+        """Print the counts of the aggregated warnings and clear them"""
+        entries = self.summary()
+        self.clear()
+        if not entries:
+            return
+        if file is None:
+            file = sys.stderr
+        total = sum(count for _, _, count, _ in entries)
+        print(
+            bcolors.WARNING
+            + "{} warnings at {} sites:".format(total, len(entries))
+            + bcolors.ENDC,
+            file=file,
+        )
+        for category, message, count, (filename, lineno) in entries:
+            print("  {:>6} x {} at {}:{}: {}".format(
+                count, category.__name__, filename, lineno, message),
+                file=file)
+
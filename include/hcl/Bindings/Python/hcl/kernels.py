@@ -0,0 +1,778 @@
+# ===----------------------------------------------------------------------=== #
+#
+# Copyright 2021-2022 The HCL-MLIR Authors.
+#
+# ===----------------------------------------------------------------------=== #
+
+import asyncio
+import ctypes
+import functools
+import os
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.execution_engine import ExecutionEngine
+from hcl_mlir.ir import *
+from hcl_mlir.exceptions import *
+from hcl_mlir.build_ir import register_external_constants
+from hcl_mlir.cache import CompilationCache, get_module_fingerprint
+
+
+def get_top_function_name(module):
+    """Name of the function with the "top" attribute, or of the only
+    function of a module"""
+    funcs = [
+        op for op in module.body.operations
+        if op.operation.name in ("func.func", "llvm.func")
+        and "sym_visibility" not in op.attributes
+    ]
+    for op in funcs:
+        if "top" in op.attributes:
+            return StringAttr(op.attributes["sym_name"]).value
+    if len(funcs) != 1:
+        raise APIError(
+            "Cannot determine the kernel of a module with {} functions, "
+            "please give its name".format(len(funcs)))
+    return StringAttr(funcs[0].attributes["sym_name"]).value
+
+
+class Kernel(object):
+    """A JIT-compiled function with the llvm.emit_c_interface attribute,
+    which is called with the ctypes arguments of ExecutionEngine.invoke,
+    e.g. pointers to pointers to memref descriptors. The engine is kept
+    alive by the kernel."""
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        func = engine.raw_lookup("_mlir_ciface_" + name)
+        if not func:
+            raise APIError("Unknown kernel {}".format(name))
+        self.func = ctypes.CFUNCTYPE(None, ctypes.c_void_p)(func)
+
+    def __call__(self, *ctypes_args):
+        packed_args = (ctypes.c_void_p * len(ctypes_args))()
+        for i, arg in enumerate(ctypes_args):
+            packed_args[i] = ctypes.cast(arg, ctypes.c_void_p)
+        self.func(packed_args)
+
+
+def get_function(module, name):
+    for op in module.body.operations:
+        if (op.operation.name == "func.func"
+                and StringAttr(op.attributes["sym_name"]).value == name):
+            return op
+    raise APIError("Unknown function {}".format(name))
+
+
+def get_numpy_dtype(dtype, unsigned=False):
+    """NumPy dtype of an element type as it is stored by the JIT-compiled
+    code, where an integer takes the next power of two bytes"""
+    if F16Type.isinstance(dtype):
+        return np.dtype(np.float16)
+    if F32Type.isinstance(dtype):
+        return np.dtype(np.float32)
+    if F64Type.isinstance(dtype):
+        return np.dtype(np.float64)
+    if IndexType.isinstance(dtype):
+        return np.dtype(np.int64)
+    if IntegerType.isinstance(dtype) and IntegerType(dtype).width <= 64:
+        width = IntegerType(dtype).width
+        size = 1
+        while size * 8 < width:
+            size *= 2
+        return np.dtype(("u" if unsigned else "i") + str(size))
+    raise APIError("Unsupported kernel type {}".format(dtype))
+
+
+memref_descriptor_types = {}
+
+
+def get_memref_descriptor_type(rank):
+    """ctypes struct of a memref descriptor, with the layout of the ones
+    of hcl_mlir.runtime, but untyped pointers that are set directly"""
+    if rank not in memref_descriptor_types:
+        fields = [
+            ("allocated", ctypes.c_void_p),
+            ("aligned", ctypes.c_void_p),
+            ("offset", ctypes.c_longlong),
+        ]
+        if rank > 0:
+            fields += [
+                ("shape", ctypes.c_longlong * rank),
+                ("strides", ctypes.c_longlong * rank),
+            ]
+        memref_descriptor_types[rank] = type(
+            "MemRefDescriptor{}D".format(rank), (ctypes.Structure,),
+            {"_fields_": fields})
+    return memref_descriptor_types[rank]
+
+
+# memref.get_global sets the allocated pointer to this address
+GLOBAL_MEMREF_ADDRESS = 0xDEADBEEF
+
+# ops whose result is a view of the buffer of their first operand
+VIEW_OPS = (
+    "memref.cast",
+    "memref.collapse_shape",
+    "memref.expand_shape",
+    "memref.reinterpret_cast",
+    "memref.reshape",
+    "memref.subview",
+    "memref.transpose",
+    "memref.view",
+)
+
+
+def get_result_ownership(func, index):
+    """Where the buffer of a memref result of a function comes from:
+    "alloc" if it is allocated by the function, "borrowed" if it is an
+    argument, a global or on the stack, and None if the IR does not tell"""
+    entry = func.regions[0].blocks[0]
+    kinds = set()
+    for block in func.regions[0].blocks:
+        term = block.operations[len(block.operations) - 1].operation
+        if term.name != "func.return":
+            continue
+        value = term.operands[index]
+        while True:
+            if BlockArgument.isinstance(value):
+                kinds.add("borrowed" if BlockArgument(value).owner == entry
+                          else None)
+                break
+            op = OpResult(value).owner.operation
+            if op.name in VIEW_OPS:
+                value = op.operands[0]
+            else:
+                kinds.add({
+                    "memref.alloc": "alloc",
+                    "memref.alloca": "borrowed",
+                    "memref.get_global": "borrowed",
+                }.get(op.name))
+                break
+    return kinds.pop() if len(kinds) == 1 else None
+
+libc = None
+
+
+def free_result(address):
+    global libc
+    if libc is None:
+        libc = ctypes.CDLL(None)
+        libc.free.argtypes = [ctypes.c_void_p]
+    libc.free(address)
+
+
+class MemRefArgument(object):
+    """A memref argument or result, whose descriptor is updated in place
+    and only recomputes the shape and strides when they change"""
+
+    def __init__(self, memref_type, dtype):
+        self.dtype = dtype
+        self.shape = tuple(memref_type.shape)
+        self.desc = get_memref_descriptor_type(len(self.shape))()
+        self.pointer = ctypes.pointer(ctypes.pointer(self.desc))
+        self.array_shape = None
+        # of a result, see get()
+        self.ownership = None
+        self.global_ranges = []
+
+    def set(self, array):
+        if not isinstance(array, np.ndarray):
+            raise APIError("Expected a NumPy array, got {}".format(
+                type(array).__name__))
+        if array.dtype != self.dtype:
+            raise APIError("Expected an array of {}, got {}".format(
+                self.dtype, array.dtype))
+        if not array.flags.c_contiguous:
+            raise APIError("Expected a C-contiguous array")
+        if array.shape != self.array_shape:
+            if len(array.shape) != len(self.shape) or any(
+                dim >= 0 and dim != size
+                for dim, size in zip(self.shape, array.shape)
+            ):
+                raise APIError("Expected an array of shape {}, got {}".format(
+                    self.shape, array.shape))
+            for i, size in enumerate(array.shape):
+                self.desc.shape[i] = size
+                self.desc.strides[i] = array.strides[i] // array.itemsize
+            self.array_shape = array.shape
+        address = array.ctypes.data
+        self.desc.allocated = address
+        self.desc.aligned = address
+
+    def set_batch(self, array):
+        """Set the shape of the descriptor to the items of an array of
+        stacked arguments, and return the address and size of an item"""
+        if not isinstance(array, np.ndarray) or array.ndim == 0:
+            raise APIError("Expected a NumPy array of stacked arguments")
+        if not array.flags.c_contiguous:
+            raise APIError("Expected a C-contiguous array")
+        self.set(array[0])
+        return array.ctypes.data, array[0].nbytes
+
+    def get(self, inputs):
+        """Return a NumPy view of a result.
+
+        The buffer is freed with the view only if it is owned by the
+        result: its ownership in the IR is not "borrowed", and its
+        allocated pointer is neither the one of an input memref nor
+        GLOBAL_MEMREF_ADDRESS nor inside one of global_ranges, the
+        address ranges of the globals the engine resolves. A result
+        that the IR allocates has to be owned.
+        """
+        rank = len(self.shape)
+        shape = tuple(self.desc.shape[i] for i in range(rank))
+        size = int(np.prod(shape)) * self.dtype.itemsize
+        buffer = (ctypes.c_char * size).from_address(
+            self.desc.aligned + self.desc.offset * self.dtype.itemsize)
+        allocated = self.desc.allocated
+        owned = (
+            allocated != GLOBAL_MEMREF_ADDRESS
+            and all(allocated != arg.desc.allocated for arg in inputs)
+            and not any(start <= allocated < stop
+                        for start, stop in self.global_ranges)
+        )
+        assert owned or self.ownership != "alloc", \
+            "The buffer allocated for a result aliases an input or a global"
+        if owned and self.ownership != "borrowed":
+            weakref.finalize(buffer, free_result, allocated)
+        return np.frombuffer(buffer, dtype=self.dtype).reshape(shape)
+
+
+class ScalarArgument(object):
+    """A scalar argument or result, passed by pointer"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.value = np.ctypeslib.as_ctypes_type(dtype)()
+        self.pointer = ctypes.pointer(self.value)
+
+    def set(self, value):
+        self.value.value = value
+
+    def get(self, inputs):
+        return self.dtype.type(self.value.value)
+
+
+class NumpyKernel(object):
+    """Calls a kernel with NumPy arrays and returns its results as NumPy
+    arrays.
+
+    The argument handling is generated once from the signature of the
+    function and its "itypes" and "otypes" signedness hints. The
+    descriptors of the arguments are reused by all calls and only the
+    data pointers are updated, so the arrays are neither copied nor
+    converted, but have to match the element type and shape of the
+    memrefs exactly and be C-contiguous. As the descriptors are shared,
+    a NumpyKernel must not be called by several threads at once, see
+    copy().
+    """
+
+    def __init__(self, kernel, func):
+        self.kernel = kernel
+        self.func = func
+        func_type = func.type
+        itypes = otypes = ""
+        if "itypes" in func.attributes:
+            itypes = StringAttr(func.attributes["itypes"]).value
+        if "otypes" in func.attributes:
+            otypes = StringAttr(func.attributes["otypes"]).value
+        self.args = [
+            self.make_argument(dtype, i < len(itypes) and itypes[i] == "u")
+            for i, dtype in enumerate(func_type.inputs)
+        ]
+        self.results = [
+            self.make_argument(dtype, i < len(otypes) and otypes[i] == "u")
+            for i, dtype in enumerate(func_type.results)
+        ]
+        if len(self.results) > 1:
+            raise APIError("Kernels with several results are not supported")
+        if self.results and isinstance(self.results[0], MemRefArgument):
+            result = self.results[0]
+            result.ownership = get_result_ownership(func, 0)
+            result.global_ranges = [
+                (data.ctypes.data, data.ctypes.data + data.nbytes)
+                for data in getattr(kernel.engine, "external_data", [])
+            ]
+        # the C interface returns a memref through a pointer in front of
+        # the arguments and a scalar through the last slot of the packed
+        # arguments
+        pointers = [arg.pointer for arg in self.args]
+        if self.results and isinstance(self.results[0], MemRefArgument):
+            pointers.insert(0, self.results[0].pointer)
+        elif self.results:
+            pointers.append(self.results[0].pointer)
+        self.packed_args = (ctypes.c_void_p * len(pointers))(
+            *[ctypes.cast(pointer, ctypes.c_void_p) for pointer in pointers])
+        # guards batch_statistics
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_argument(dtype, unsigned):
+        if MemRefType.isinstance(dtype):
+            memref_type = MemRefType(dtype)
+            return MemRefArgument(
+                memref_type, get_numpy_dtype(memref_type.element_type, unsigned))
+        return ScalarArgument(get_numpy_dtype(dtype, unsigned))
+
+    def copy(self):
+        """A wrapper of the same kernel with its own descriptors"""
+        return NumpyKernel(self.kernel, self.func)
+
+    def __call__(self, *args):
+        if len(args) != len(self.args):
+            raise APIError("Expected {} arguments, got {}".format(
+                len(self.args), len(args)))
+        for arg, value in zip(self.args, args):
+            arg.set(value)
+        self.kernel.func(self.packed_args)
+        if not self.results:
+            return None
+        return self.results[0].get(
+            [arg for arg in self.args if isinstance(arg, MemRefArgument)])
+
+    def submit(self, *args, executor=None):
+        """Queue a call of the kernel on a KernelExecutor, the default one
+        by default, and return a concurrent.futures.Future of its result"""
+        if executor is None:
+            executor = get_default_executor()
+        return executor.submit(self, *args)
+
+    async def run_async(self, *args, executor=None):
+        """Call the kernel on a KernelExecutor without blocking the event
+        loop, neither while the kernel runs nor while the queue is full"""
+        if executor is None:
+            executor = get_default_executor()
+        return await executor.run_async(self, *args)
+
+    def run_batch(self, args, start, stop, outputs):
+        """Call the kernel on the items [start, stop) of a batch. Only the
+        data pointers of the descriptors are moved from item to item."""
+        items = []
+        scalars = []
+        for arg, value in zip(self.args, args):
+            if isinstance(arg, MemRefArgument):
+                address, size = arg.set_batch(value)
+                items.append((arg.desc, address, size))
+            elif np.ndim(value) == 0:
+                arg.set(value)
+            else:
+                scalars.append((arg, value))
+        inputs = [arg for arg in self.args if isinstance(arg, MemRefArgument)]
+        for i in range(start, stop):
+            for desc, address, size in items:
+                desc.allocated = desc.aligned = address + i * size
+            for arg, values in scalars:
+                arg.set(values[i])
+            self.kernel.func(self.packed_args)
+            if outputs is not None:
+                outputs[i] = self.results[0].get(inputs)
+
+    def batch(self, *args, num_threads=1, chunk_size=None):
+        """Call the kernel on every item of a batch and return the stacked
+        results.
+
+        Every memref argument is given as a C-contiguous array with an
+        extra leading batch dimension. A scalar argument is either the
+        same for all items or an array of one value per item. With
+        several threads, the batch is split into chunks, which are run
+        in parallel as the kernel is called without the GIL. The
+        throughput of the last batch is kept in batch_statistics.
+        """
+        if len(args) != len(self.args):
+            raise APIError("Expected {} arguments, got {}".format(
+                len(self.args), len(args)))
+        sizes = set(
+            len(value) for arg, value in zip(self.args, args)
+            if isinstance(arg, MemRefArgument) or np.ndim(value) > 0)
+        if len(sizes) != 1:
+            raise APIError("Expected arguments of one batch size, got {}".format(
+                sorted(sizes)))
+        size = sizes.pop()
+
+        result = self.results[0] if self.results else None
+        if result is None:
+            outputs = None
+        elif isinstance(result, ScalarArgument):
+            outputs = np.empty(size, dtype=result.dtype)
+        elif all(dim >= 0 for dim in result.shape):
+            outputs = np.empty((size,) + result.shape, dtype=result.dtype)
+        else:
+            outputs = [None] * size
+        if size == 0:
+            return None if isinstance(outputs, list) else outputs
+
+        start = time.perf_counter()
+        if num_threads <= 1 or size <= 1:
+            self.run_batch(args, 0, size, outputs)
+        else:
+            if chunk_size is None:
+                chunk_size = -(-size // num_threads)
+            # every thread calls the kernel through its own copy, however
+            # many chunks it runs
+            local = threading.local()
+
+            def run_chunk(start, stop):
+                kernel = getattr(local, "kernel", None)
+                if kernel is None:
+                    kernel = local.kernel = self.copy()
+                kernel.run_batch(args, start, stop, outputs)
+
+            with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                futures = [
+                    pool.submit(run_chunk, i, min(i + chunk_size, size))
+                    for i in range(0, size, chunk_size)
+                ]
+                for future in futures:
+                    future.result()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.batch_statistics = {
+                "items": size,
+                "seconds": elapsed,
+                "items_per_second":
+                    size / elapsed if elapsed > 0 else float("inf"),
+            }
+        if isinstance(outputs, list):
+            outputs = np.stack(outputs)
+        return outputs
+
+
+class KernelPool(object):
+    """LRU pool of JIT-compiled modules, so that repeated invocations of
+    a module neither lower nor compile it again.
+
+    The modules are keyed by the hash of their IR, which is computed once
+    per module object: a module must not be changed in place once it is
+    passed to the pool, a changed module is parsed again or given with
+    its own key. If a CompilationCache is given, the object code of a compiled module is stored in it, and
+    a module that misses the pool but hits the cache is only linked,
+    even by another process.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        The number of compiled modules that are kept.
+
+    cache : CompilationCache, optional
+        The cache of the object files.
+
+    opt_level : int, optional
+        The optimization level of the code generation.
+
+    shared_libs : list of str, optional
+        The runtime libraries the code is linked with.
+
+    num_threads : int, optional
+        The number of threads the loops marked parallel are lowered for,
+        all hardware threads if 0. The parallel code calls the MLIR async
+        runtime, so libmlir_async_runtime has to be one of the
+        shared_libs. With 1, the loops are lowered to sequential code.
+    """
+
+    def __init__(self, capacity=16, cache=None, opt_level=3, shared_libs=None,
+                 num_threads=1):
+        self.capacity = capacity
+        self.cache = cache
+        self.opt_level = opt_level
+        self.shared_libs = list(shared_libs or [])
+        self.num_threads = num_threads
+        # module key -> (engine, {name: kernel})
+        self.entries = OrderedDict()
+        # module key -> Future of the entry, while the module is compiled
+        self.pending = {}
+        # module -> key, so that a hit does not print the module again
+        self.keys = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "compiles": 0,
+                      "evictions": 0}
+
+    def get_key(self, module):
+        with self.lock:
+            key = self.keys.get(module)
+        if key is not None:
+            return key
+        if self.cache is not None:
+            key = self.cache.object_key(
+                module, self.opt_level, self.shared_libs, self.num_threads)
+        else:
+            key = (get_module_fingerprint(module), self.opt_level,
+                   tuple(sorted(self.shared_libs)), self.num_threads)
+        with self.lock:
+            self.keys[module] = key
+        return key
+
+    def get_kernel(self, module, name=None, key=None):
+        """Return the kernel of a function of a module, the top function
+        by default. The module is either lowered to LLVM already, or
+        lowered on a miss, on a copy of it. The key of the module is
+        computed by get_key() unless it is given."""
+        if name is None:
+            name = get_top_function_name(module)
+        if key is None:
+            key = self.get_key(module)
+        # the module is compiled without the lock, so that the other
+        # modules are still served meanwhile, and only once: the threads
+        # that miss the same module wait for the first one
+        with self.lock:
+            entry, future, owner = None, None, False
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                entry = self.entries[key]
+            elif key in self.pending:
+                self.stats["hits"] += 1
+                future = self.pending[key]
+            else:
+                self.stats["misses"] += 1
+                future = self.pending[key] = Future()
+                owner = True
+        if owner:
+            try:
+                entry = (self.compile(module, key, name), {})
+            except BaseException as e:
+                with self.lock:
+                    del self.pending[key]
+                future.set_exception(e)
+                raise
+            with self.lock:
+                del self.pending[key]
+                self.entries[key] = entry
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+            future.set_result(entry)
+        elif entry is None:
+            entry = future.result()
+        engine, kernels = entry
+        with self.lock:
+            if name not in kernels:
+                kernels[name] = Kernel(engine, name)
+            return kernels[name]
+
+    def compile(self, module, key, name):
+        if self.cache is not None:
+            path = self.cache.lookup(key, "o")
+            if path is not None:
+                try:
+                    engine = hcl_d.ObjectEngine(path, self.shared_libs)
+                except RuntimeError:
+                    # evicted by another process in the meantime
+                    engine = None
+                if engine is not None:
+                    register_external_constants(engine, module)
+                    with self.lock:
+                        self.stats["loads"] += 1
+                    return engine
+        lowered = Module.parse(str(module), module.context)
+        if any(op.operation.name == "func.func"
+               for op in lowered.body.operations):
+            if not hcl_d.lower_hcl_to_llvm(lowered, lowered.context,
+                                           num_threads=self.num_threads):
+                raise APIError("Failed to lower the module to LLVM")
+        engine = ExecutionEngine(
+            lowered, opt_level=self.opt_level, shared_libs=self.shared_libs)
+        register_external_constants(engine, lowered)
+        with self.lock:
+            self.stats["compiles"] += 1
+        if self.cache is not None:
+            # the code is generated by the first lookup
+            engine.raw_lookup("_mlir_ciface_" + name)
+            self.cache.put_object(key, engine)
+        return engine
+
+    def get_numpy_kernel(self, module, name=None, key=None):
+        """Return a NumpyKernel of a function of a module, which is not
+        lowered to LLVM yet"""
+        if name is None:
+            name = get_top_function_name(module)
+        return NumpyKernel(self.get_kernel(module, name, key),
+                           get_function(module, name))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self):
+        """Hits and misses of the pool, and how many missed modules were
+        loaded from object files or compiled"""
+        with self.lock:
+            return dict(self.stats)
+
+
+default_pool = None
+default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """The default pool, whose object files are stored in the default
+    CompilationCache"""
+    global default_pool
+    with default_pool_lock:
+        if default_pool is None:
+            default_pool = KernelPool(cache=CompilationCache())
+    return default_pool
+
+
+def get_kernel(module, name=None, key=None):
+    """Return a kernel of a module from the default pool"""
+    return get_default_pool().get_kernel(module, name, key)
+
+
+def get_numpy_kernel(module, name=None, key=None):
+    """Return a NumpyKernel of a module from the default pool"""
+    return get_default_pool().get_numpy_kernel(module, name, key)
+
+
+class KernelExecutor(object):
+    """Runs kernel calls on a pool of worker threads.
+
+    A call is queued with submit(), which returns a
+    concurrent.futures.Future, or awaited with run_async(). The kernels
+    are called through ctypes, which releases the GIL, so the workers
+    run in parallel to each other and to the submitting threads. Every
+    worker calls a NumpyKernel through its own copy, so that the
+    descriptors are never shared. The queue is bounded: submit() blocks
+    while max_pending calls are waiting, and run_async() waits for a
+    free slot without blocking the event loop. The arrays of a call
+    must not be modified until its future is done.
+
+    Parameters
+    ----------
+    num_workers : int, optional
+        The number of worker threads, the number of CPUs by default.
+
+    max_pending : int, optional
+        The number of queued calls beyond which submit() blocks.
+    """
+
+    def __init__(self, num_workers=None, max_pending=64):
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        if num_workers < 1 or max_pending < 1:
+            raise APIError("Expected at least one worker and one pending "
+                           "call, got {} and {}".format(num_workers, max_pending))
+        self.num_workers = num_workers
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shutdown_requested = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0,
+                      "cancelled": 0}
+        self.workers = [
+            threading.Thread(target=self.work, daemon=True,
+                             name="hcl-kernel-worker-{}".format(i))
+            for i in range(num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kernel, *args, block=True):
+        """Queue a call of a NumpyKernel or a Kernel and return a
+        concurrent.futures.Future of its result. If the queue is full,
+        wait for a free slot, or raise queue.Full if block is False."""
+        with self.lock:
+            if self.shutdown_requested:
+                raise APIError("Cannot submit to a shut down executor")
+        future = Future()
+        self.queue.put((future, kernel, args), block)
+        with self.lock:
+            self.stats["submitted"] += 1
+        return future
+
+    async def run_async(self, kernel, *args):
+        """Call a kernel on the workers and return its result"""
+        try:
+            future = self.submit(kernel, *args, block=False)
+        except queue.Full:
+            # wait for a free slot on a thread of the event loop
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(
+                None, functools.partial(self.submit, kernel, *args))
+        return await asyncio.wrap_future(future)
+
+    def get_local_kernel(self, kernel):
+        """The copy of a NumpyKernel that belongs to the calling worker"""
+        if not isinstance(kernel, NumpyKernel):
+            return kernel
+        kernels = getattr(self.local, "kernels", None)
+        if kernels is None:
+            kernels = self.local.kernels = weakref.WeakKeyDictionary()
+        local_kernel = kernels.get(kernel)
+        if local_kernel is None:
+            local_kernel = kernels[kernel] = kernel.copy()
+        return local_kernel
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            future, kernel, args = item
+            if not future.set_running_or_notify_cancel():
+                self.count("cancelled")
+                continue
+            try:
+                result = self.get_local_kernel(kernel)(*args)
+            except BaseException as error:
+                self.count("failed")
+                future.set_exception(error)
+            else:
+                self.count("completed")
+                future.set_result(result)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def shutdown(self, wait=True):
+        """Stop the workers after the queued calls"""
+        with self.lock:
+            if self.shutdown_requested:
+                return
+            self.shutdown_requested = True
+        for _ in self.workers:
+            self.queue.put(None)
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def statistics(self):
+        """Submitted, completed, failed and cancelled calls, and the
+        number of queued ones"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats["pending"] = self.queue.qsize()
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+default_executor = None
+default_executor_lock = threading.Lock()
+
+
+def get_default_executor():
+    """The default executor, with one worker per CPU"""
+    global default_executor
+    with default_executor_lock:
+        if default_executor is None:
+            default_executor = KernelExecutor()
+    return default_executor
+
+
+def submit(kernel, *args):
+    """Queue a call of a kernel on the default executor and return a
+    concurrent.futures.Future of its result"""
+    return get_default_executor().submit(kernel, *args)
@@ -7,6 +7,10 @@
 #ifndef HCLTOLLVM_PASSES_H
 #define HCLTOLLVM_PASSES_H
 
+#include "mlir/Dialect/Async/IR/Async.h"
+#include "mlir/Dialect/ControlFlow/IR/ControlFlow.h"
+#include "mlir/Dialect/LLVMIR/LLVMDialect.h"
+#include "mlir/Dialect/SCF/IR/SCF.h"
 #include "mlir/IR/BuiltinOps.h"
 #include "mlir/Pass/Pass.h"
 #include "mlir/Pass/PassRegistry.h"
@@ -17,8 +21,10 @@ namespace mlir {
 namespace hcl {
 
 // HeteroCL Dialect -> LLVM Dialect
-std::unique_ptr<OperationPass<ModuleOp>> createHCLToLLVMLoweringPass();
-bool applyHCLToLLVMLoweringPass(ModuleOp &module, MLIRContext &context);
+std::unique_ptr<OperationPass<ModuleOp>>
+createHCLToLLVMLoweringPass(unsigned numThreads = 1);
+bool applyHCLToLLVMLoweringPass(ModuleOp &module, MLIRContext &context,
+                                unsigned numThreads = 1);
 
 void registerHCLConversionPasses();
 
@@ -15,22 +15,26 @@ namespace hcl {
 
 std::unique_ptr<OperationPass<ModuleOp>> createLoopTransformationPass();
 std::unique_ptr<OperationPass<ModuleOp>> createFixedPointToIntegerPass();
-std::unique_ptr<OperationPass<ModuleOp>> createAnyWidthIntegerPass();
+std::unique_ptr<OperationPass<ModuleOp>>
+createAnyWidthIntegerPass(bool nativeWidth = false);
 std::unique_ptr<OperationPass<ModuleOp>> createMoveReturnToInputPass();
 std::unique_ptr<OperationPass<ModuleOp>> createLowerCompositeTypePass();
 std::unique_ptr<OperationPass<ModuleOp>> createLowerBitOpsPass();
 std::unique_ptr<OperationPass<ModuleOp>> createLegalizeCastPass();
 std::unique_ptr<OperationPass<ModuleOp>> createRemoveStrideMapPass();
+std::unique_ptr<OperationPass<ModuleOp>>
+createLowerLoopAttributesPass(unsigned interleaveFactor = 4);
 
 bool applyLoopTransformation(ModuleOp &f);
 
 bool applyFixedPointToInteger(ModuleOp &module);
-bool applyAnyWidthInteger(ModuleOp &module);
+bool applyAnyWidthInteger(ModuleOp &module, bool nativeWidth = false);
 bool applyMoveReturnToInput(ModuleOp &module);
 bool applyLowerCompositeType(ModuleOp &module);
 bool applyLowerBitOps(ModuleOp &module);
 bool applyLegalizeCast(ModuleOp &module);
 bool applyRemoveStrideMap(ModuleOp &module);
+bool applyLowerLoopAttributes(ModuleOp &module, unsigned interleaveFactor = 4);
 
 /// Registers all HCL transformation passes
 void registerHCLPasses();
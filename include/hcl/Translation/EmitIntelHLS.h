@@ -9,12 +9,15 @@
 #ifndef HCL_TRANSLATION_EMITINTELHLS_H
 #define HCL_TRANSLATION_EMITINTELHLS_H
 
+#include "hcl/Translation/EmitterOptions.h"
 #include "mlir/IR/BuiltinOps.h"
 
 namespace mlir {
 namespace hcl {
 
 LogicalResult emitIntelHLS(ModuleOp module, llvm::raw_ostream &os);
+LogicalResult emitIntelHLS(ModuleOp module, llvm::raw_ostream &os,
+                           const EmitterOptions &options);
 void registerEmitIntelHLSTranslation();
 
 } // namespace hcl
@@ -9,12 +9,25 @@
 #ifndef HCL_TRANSLATION_EMITVIVADOHLS_H
 #define HCL_TRANSLATION_EMITVIVADOHLS_H
 
+#include "hcl/Translation/EmitterOptions.h"
 #include "mlir/IR/BuiltinOps.h"
 
+#include <string>
+#include <vector>
+
 namespace mlir {
 namespace hcl {
 
 LogicalResult emitVivadoHLS(ModuleOp module, llvm::raw_ostream &os);
+LogicalResult emitVivadoHLS(ModuleOp module, llvm::raw_ostream &os,
+                            const EmitterOptions &options);
+/// Emit the module into one file per function and a shared "kernel.h" in dir,
+/// where the functions are emitted in parallel. The fingerprints of the files
+/// are recorded in "manifest.json", so that an incremental emission skips the
+/// unchanged functions. The paths of the written files are appended to files.
+LogicalResult emitVivadoHLSFiles(ModuleOp module, StringRef dir,
+                                 const EmitterOptions &options,
+                                 std::vector<std::string> &files);
 void registerEmitVivadoHLSTranslation();
 
 } // namespace hcl
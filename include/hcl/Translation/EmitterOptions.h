@@ -0,0 +1,46 @@
+//===----------------------------------------------------------------------===//
+//
+// Copyright 2021-2022 The HCL-MLIR Authors.
+//
+//===----------------------------------------------------------------------===//
+
+#ifndef HCL_TRANSLATION_EMITTEROPTIONS_H
+#define HCL_TRANSLATION_EMITTEROPTIONS_H
+
+#include <cstdint>
+#include <string>
+
+namespace mlir {
+namespace hcl {
+
+/// Options of the HLS emitters.
+struct EmitterOptions {
+  /// Constant globals of at least this many bytes are written to a sidecar
+  /// file "<name>.dat", which is included by the initializer of the global.
+  /// 0 emits all globals inline.
+  uint64_t sidecarThreshold = 0;
+  /// Directory of the sidecar files. They are included by file name, so this
+  /// is usually the directory of the generated code.
+  std::string sidecarDir = ".";
+  /// If not empty, the Vivado HLS emitter writes one file per function and a
+  /// shared "kernel.h" to this directory, and only the list of the written
+  /// files to the output stream.
+  std::string splitDir;
+  /// With splitDir, only rewrite the files whose functions changed since the
+  /// last emission to the directory, according to the fingerprints in its
+  /// "manifest.json".
+  bool incremental = false;
+};
+
+/// Register the emitter options of hcl-translate, i.e. -sidecar-threshold,
+/// -sidecar-dir, -split-dir and -incremental.
+void registerEmitterCLOptions();
+
+/// The emitter options given on the command line, or the default options if
+/// they are not registered.
+EmitterOptions getEmitterOptionsFromCommandLine();
+
+} // namespace hcl
+} // namespace mlir
+
+#endif // HCL_TRANSLATION_EMITTEROPTIONS_H
@@ -16,6 +16,7 @@
 
 #include "hcl/Dialect/HeteroCLDialect.h"
 #include "hcl/Dialect/HeteroCLOps.h"
+#include "hcl/Translation/EmitterOptions.h"
 
 using namespace mlir;
 using namespace hcl;
@@ -28,11 +29,15 @@ using namespace hcl;
 /// various emitters.
 class HCLEmitterState {
 public:
-  explicit HCLEmitterState(raw_ostream &os) : os(os) {}
+  explicit HCLEmitterState(raw_ostream &os,
+                           const EmitterOptions &options = EmitterOptions())
+      : os(os), options(options) {}
 
   // The stream to emit to.
   raw_ostream &os;
 
+  EmitterOptions options;
+
   bool encounteredError = false;
   unsigned currentIndent = 0;
 
@@ -72,6 +77,10 @@ public:
 
   SmallString<8> getName(Value val);
 
+  /// Emit the initializer list of a constant global. Globals of at least the
+  /// sidecar threshold are written to a sidecar file, which is included.
+  void emitGlobalInitializer(memref::GlobalOp op);
+
   bool isDeclared(Value val) {
     if (getName(val).empty()) {
       return false;
@@ -86,4 +95,17 @@ private:
 
 void fixUnsignedType(Value &result, bool isUnsigned);
 
+/// Return the [path, offset, size] entry of a constant global created from a
+/// memory-mapped file, see the "hcl.external_data" attribute of the module.
+ArrayAttr getExternalData(memref::GlobalOp op);
+
+/// Return whether a global has an initial value or external data to emit.
+bool hasGlobalData(memref::GlobalOp op);
+
+/// Return the type a constant global is declared with. Globals are stored as
+/// signless integers, so unsigned globals are declared unsigned, and
+/// fixed-point globals of up to 53 bits, whose real values are exact in a
+/// double, are declared with their fixed-point type.
+Type getGlobalDeclType(memref::GlobalOp op);
+
 #endif // HCL_TRANSLATION_UTILS_H
\ No newline at end of file
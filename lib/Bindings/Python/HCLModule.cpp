@@ -11,18 +11,26 @@
 #include "hcl-c/Dialect/HCLAttributes.h"
 #include "hcl-c/Dialect/HCLTypes.h"
 #include "hcl-c/Dialect/Registration.h"
-#include "hcl-c/Translation/EmitIntelHLS.h"
-#include "hcl-c/Translation/EmitVivadoHLS.h"
 #include "hcl/Conversion/HCLToLLVM.h"
 #include "hcl/Dialect/HeteroCLDialect.h"
 #include "hcl/Transforms/Passes.h"
+#include "hcl/Translation/EmitIntelHLS.h"
+#include "hcl/Translation/EmitVivadoHLS.h"
 #include "mlir-c/Bindings/Python/Interop.h"
 #include "mlir/Bindings/Python/PybindAdaptors.h"
 #include "mlir/CAPI/IR.h"
 #include "mlir/Dialect/Affine/Analysis/LoopAnalysis.h"
 
 #include "llvm-c/ErrorHandling.h"
+#include "llvm/ExecutionEngine/Orc/ExecutionUtils.h"
+#include "llvm/ExecutionEngine/Orc/LLJIT.h"
+#include "llvm/Support/MemoryBuffer.h"
+#include "llvm/Support/Path.h"
 #include "llvm/Support/Signals.h"
+#include "llvm/Support/TargetSelect.h"
+#include "llvm/Support/raw_ostream.h"
+
+#include <pybind11/stl.h>
 
 namespace py = pybind11;
 using namespace mlir::python::adaptors;
@@ -32,44 +40,24 @@ using namespace mlir::python;
 using namespace hcl;
 
 //===----------------------------------------------------------------------===//
-// Customized Python classes
+// IR APIs
 //===----------------------------------------------------------------------===//
 
-// PybindUtils.h
-class PyFileAccumulator {
-public:
-  PyFileAccumulator(const pybind11::object &fileObject, bool binary)
-      : pyWriteFunction(fileObject.attr("write")), binary(binary) {}
-
-  void *getUserData() { return this; }
-
-  MlirStringCallback getCallback() {
-    return [](MlirStringRef part, void *userData) {
-      pybind11::gil_scoped_acquire acquire;
-      PyFileAccumulator *accum = static_cast<PyFileAccumulator *>(userData);
-      if (accum->binary) {
-        // Note: Still has to copy and not avoidable with this API.
-        pybind11::bytes pyBytes(part.data, part.length);
-        accum->pyWriteFunction(pyBytes);
-      } else {
-        pybind11::str pyStr(part.data,
-                            part.length); // Decodes as UTF-8 by default.
-        accum->pyWriteFunction(pyStr);
-      }
-    };
-  }
-
-private:
-  pybind11::object pyWriteFunction;
-  bool binary;
-};
+// Whether no operation uses the results of an operation, e.g. a hash-consed
+// expression of the builder after its last user has been erased.
+static bool isUnused(MlirOperation op) { return unwrap(op)->use_empty(); }
 
 //===----------------------------------------------------------------------===//
 // Loop transform APIs
 //===----------------------------------------------------------------------===//
 
+// The transformation, emission and lowering entry points run without the
+// GIL, so that modules of different contexts can be processed by Python
+// threads in parallel. The module must not be used by another thread in
+// the meantime.
+
 static bool loopTransformation(MlirModule &mlir_mod) {
-  py::gil_scoped_release();
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyLoopTransformation(mod);
 }
@@ -78,65 +66,245 @@ static bool loopTransformation(MlirModule &mlir_mod) {
 // Emission APIs
 //===----------------------------------------------------------------------===//
 
-static bool emitVivadoHls(MlirModule &mod, py::object fileObject) {
-  PyFileAccumulator accum(fileObject, false);
-  py::gil_scoped_release();
-  return mlirLogicalResultIsSuccess(
-      mlirEmitVivadoHls(mod, accum.getCallback(), accum.getUserData()));
+using EmitFunction = LogicalResult (*)(ModuleOp, llvm::raw_ostream &,
+                                       const EmitterOptions &);
+
+static EmitterOptions getEmitterOptions(uint64_t sidecarThreshold,
+                                        py::object sidecarDir) {
+  EmitterOptions options;
+  options.sidecarThreshold = sidecarThreshold;
+  if (!sidecarDir.is_none())
+    options.sidecarDir = py::module::import("os")
+                             .attr("fspath")(sidecarDir)
+                             .cast<std::string>();
+  return options;
+}
+
+// The emitters write into a native buffer, which is handed to Python in one
+// piece instead of one write() call per fragment.
+static bool emitToBuffer(MlirModule &mod, EmitFunction emit,
+                         const EmitterOptions &options, std::string &code) {
+  py::gil_scoped_release release;
+  llvm::raw_string_ostream os(code);
+  auto result = emit(unwrap(mod), os, options);
+  os.flush();
+  return succeeded(result);
 }
 
-static bool emitIntelHls(MlirModule &mod, py::object fileObject) {
-  PyFileAccumulator accum(fileObject, false);
-  py::gil_scoped_release();
-  return mlirLogicalResultIsSuccess(
-      mlirEmitIntelHls(mod, accum.getCallback(), accum.getUserData()));
+static py::object emitToString(MlirModule &mod, EmitFunction emit,
+                               uint64_t sidecarThreshold,
+                               py::object sidecarDir) {
+  auto options = getEmitterOptions(sidecarThreshold, sidecarDir);
+  std::string code;
+  if (!emitToBuffer(mod, emit, options, code))
+    return py::none();
+  return py::str(code);
+}
+
+// The file is either a file object or a path, which is written natively.
+// Sidecar files of large constant globals go to the directory of the path
+// unless another directory is given.
+static bool emitToFile(MlirModule &mod, py::object file, EmitFunction emit,
+                       uint64_t sidecarThreshold, py::object sidecarDir) {
+  auto options = getEmitterOptions(sidecarThreshold, sidecarDir);
+  if (py::isinstance<py::str>(file) || py::hasattr(file, "__fspath__")) {
+    auto path =
+        py::module::import("os").attr("fspath")(file).cast<std::string>();
+    if (sidecarDir.is_none()) {
+      auto dir = llvm::sys::path::parent_path(path);
+      options.sidecarDir = dir.empty() ? "." : dir.str();
+    }
+    py::gil_scoped_release release;
+    std::error_code ec;
+    llvm::raw_fd_ostream os(path, ec);
+    if (ec)
+      throw std::runtime_error("cannot open " + path + ": " + ec.message());
+    return succeeded(emit(unwrap(mod), os, options));
+  }
+  std::string code;
+  bool success = emitToBuffer(mod, emit, options, code);
+  if (py::hasattr(file, "encoding"))
+    file.attr("write")(py::str(code));
+  else
+    file.attr("write")(py::bytes(code));
+  return success;
+}
+
+static bool emitVivadoHls(MlirModule &mod, py::object file,
+                          uint64_t sidecarThreshold, py::object sidecarDir) {
+  return emitToFile(mod, file, emitVivadoHLS, sidecarThreshold, sidecarDir);
+}
+
+static bool emitIntelHls(MlirModule &mod, py::object file,
+                         uint64_t sidecarThreshold, py::object sidecarDir) {
+  return emitToFile(mod, file, emitIntelHLS, sidecarThreshold, sidecarDir);
+}
+
+static py::object emitVivadoHlsString(MlirModule &mod,
+                                      uint64_t sidecarThreshold,
+                                      py::object sidecarDir) {
+  return emitToString(mod, emitVivadoHLS, sidecarThreshold, sidecarDir);
+}
+
+static py::object emitIntelHlsString(MlirModule &mod,
+                                     uint64_t sidecarThreshold,
+                                     py::object sidecarDir) {
+  return emitToString(mod, emitIntelHLS, sidecarThreshold, sidecarDir);
+}
+
+// One file per function and a shared header are written to dir, where the
+// functions are emitted in parallel. An incremental emission only rewrites
+// the functions which changed since the last emission to dir. Returns the
+// paths of the written files.
+static py::object emitVivadoHlsFiles(MlirModule &mod, py::object dir,
+                                     uint64_t sidecarThreshold,
+                                     bool incremental) {
+  auto path = py::module::import("os").attr("fspath")(dir).cast<std::string>();
+  auto options = getEmitterOptions(sidecarThreshold, py::none());
+  options.incremental = incremental;
+  std::vector<std::string> files;
+  LogicalResult result = success();
+  {
+    py::gil_scoped_release release;
+    result = emitVivadoHLSFiles(unwrap(mod), path, options, files);
+  }
+  if (failed(result))
+    return py::none();
+  py::list paths;
+  for (auto &file : files)
+    paths.append(py::str(file));
+  return paths;
 }
 
 //===----------------------------------------------------------------------===//
 // Lowering APIs
 //===----------------------------------------------------------------------===//
 
-static bool lowerHCLToLLVM(MlirModule &mlir_mod, MlirContext &mlir_ctx) {
+static bool lowerHCLToLLVM(MlirModule &mlir_mod, MlirContext &mlir_ctx,
+                           unsigned numThreads) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   auto ctx = unwrap(mlir_ctx);
-  return applyHCLToLLVMLoweringPass(mod, *ctx);
+  return applyHCLToLLVMLoweringPass(mod, *ctx, numThreads);
 }
 
 static bool lowerFixedPointToInteger(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyFixedPointToInteger(mod);
 }
 
-static bool lowerAnyWidthInteger(MlirModule &mlir_mod) {
+static bool lowerAnyWidthInteger(MlirModule &mlir_mod, bool nativeWidth) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
-  return applyAnyWidthInteger(mod);
+  return applyAnyWidthInteger(mod, nativeWidth);
 }
 
 static bool moveReturnToInput(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyMoveReturnToInput(mod);
 }
 
 static bool lowerCompositeType(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyLowerCompositeType(mod);
 }
 
 static bool lowerBitOps(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyLowerBitOps(mod);
 }
 
 static bool legalizeCast(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyLegalizeCast(mod);
 }
 
 static bool removeStrideMap(MlirModule &mlir_mod) {
+  py::gil_scoped_release release;
   auto mod = unwrap(mlir_mod);
   return applyRemoveStrideMap(mod);
 }
 
+static bool lowerLoopAttributes(MlirModule &mlir_mod,
+                                unsigned interleaveFactor) {
+  py::gil_scoped_release release;
+  auto mod = unwrap(mlir_mod);
+  return applyLowerLoopAttributes(mod, interleaveFactor);
+}
+
+//===----------------------------------------------------------------------===//
+// Object file APIs
+//===----------------------------------------------------------------------===//
+
+// Links an object file dumped by an ExecutionEngine, so that the code of a
+// module is loaded without generating it again. It provides the lookup and
+// symbol registration of the ExecutionEngine, so it can be invoked the same
+// way.
+class ObjectEngine {
+public:
+  ObjectEngine(const std::string &path,
+               const std::vector<std::string> &sharedLibs) {
+    llvm::InitializeNativeTarget();
+    llvm::InitializeNativeTargetAsmPrinter();
+    auto expectedJit = llvm::orc::LLJITBuilder().create();
+    if (!expectedJit)
+      throw std::runtime_error(llvm::toString(expectedJit.takeError()));
+    jit = std::move(*expectedJit);
+
+    // The code calls into the process, e.g. libc, and the runtime libraries.
+    auto &dylib = jit->getMainJITDylib();
+    char prefix = jit->getDataLayout().getGlobalPrefix();
+    dylib.addGenerator(llvm::cantFail(
+        llvm::orc::DynamicLibrarySearchGenerator::GetForCurrentProcess(
+            prefix)));
+    for (auto &lib : sharedLibs) {
+      auto generator =
+          llvm::orc::DynamicLibrarySearchGenerator::Load(lib.c_str(), prefix);
+      if (!generator)
+        throw std::runtime_error(llvm::toString(generator.takeError()));
+      dylib.addGenerator(std::move(*generator));
+    }
+
+    auto buffer = llvm::MemoryBuffer::getFile(path);
+    if (!buffer)
+      throw std::runtime_error("cannot open " + path + ": " +
+                               buffer.getError().message());
+    if (auto err = jit->addObjectFile(std::move(*buffer)))
+      throw std::runtime_error(llvm::toString(std::move(err)));
+  }
+
+  // Address of the packed interface of a function, or 0. The first lookup
+  // links the object file.
+  uintptr_t rawLookup(const std::string &name) {
+    py::gil_scoped_release release;
+    auto symbol = jit->lookup("_mlir_" + name);
+    if (!symbol) {
+      llvm::consumeError(symbol.takeError());
+      return 0;
+    }
+    return symbol->getValue();
+  }
+
+  // Resolve a symbol of the object file to an address, before the first
+  // lookup.
+  void rawRegisterRuntime(const std::string &name, uintptr_t address) {
+    llvm::orc::SymbolMap symbols;
+    symbols[jit->mangleAndIntern(name)] =
+        llvm::JITEvaluatedSymbol(address, llvm::JITSymbolFlags::Exported);
+    if (auto err = jit->getMainJITDylib().define(
+            llvm::orc::absoluteSymbols(std::move(symbols))))
+      throw std::runtime_error(llvm::toString(std::move(err)));
+  }
+
+private:
+  std::unique_ptr<llvm::orc::LLJIT> jit;
+};
+
 //===----------------------------------------------------------------------===//
 // HCL Python module definition
 //===----------------------------------------------------------------------===//
@@ -165,22 +333,60 @@ PYBIND11_MODULE(_hcl, m) {
   populateHCLIRTypes(hcl_m);
   populateHCLAttributes(hcl_m);
 
+  // IR APIs.
+  hcl_m.def("is_unused", &isUnused, py::arg("op"));
+
   // Loop transform APIs.
   hcl_m.def("loop_transformation", &loopTransformation);
 
   // Codegen APIs.
-  hcl_m.def("emit_vhls", &emitVivadoHls);
-  hcl_m.def("emit_ihls", &emitIntelHls);
+  // Constant globals of at least sidecar_threshold bytes are written to
+  // sidecar .dat files in sidecar_dir.
+  hcl_m.def("emit_vhls", &emitVivadoHls, py::arg("module"), py::arg("file"),
+            py::arg("sidecar_threshold") = 0,
+            py::arg("sidecar_dir") = py::none());
+  hcl_m.def("emit_ihls", &emitIntelHls, py::arg("module"), py::arg("file"),
+            py::arg("sidecar_threshold") = 0,
+            py::arg("sidecar_dir") = py::none());
+  hcl_m.def("emit_vhls_str", &emitVivadoHlsString, py::arg("module"),
+            py::arg("sidecar_threshold") = 0,
+            py::arg("sidecar_dir") = py::none());
+  hcl_m.def("emit_ihls_str", &emitIntelHlsString, py::arg("module"),
+            py::arg("sidecar_threshold") = 0,
+            py::arg("sidecar_dir") = py::none());
+  hcl_m.def("emit_vhls_files", &emitVivadoHlsFiles, py::arg("module"),
+            py::arg("dir"), py::arg("sidecar_threshold") = 0,
+            py::arg("incremental") = false);
 
   // LLVM backend APIs.
-  hcl_m.def("lower_hcl_to_llvm", &lowerHCLToLLVM);
+  // With num_threads other than 1, the loops marked parallel are lowered to
+  // tasks of the MLIR async runtime, for all hardware threads if it is 0.
+  hcl_m.def("lower_hcl_to_llvm", &lowerHCLToLLVM, py::arg("module"),
+            py::arg("context"), py::arg("num_threads") = 1);
   hcl_m.def("lower_fixed_to_int", &lowerFixedPointToInteger);
-  hcl_m.def("lower_anywidth_int", &lowerAnyWidthInteger);
+  // With native_width, the integers of the top function interface keep the
+  // width of the next NumPy integer type instead of being widened to 64 bits.
+  hcl_m.def("lower_anywidth_int", &lowerAnyWidthInteger, py::arg("module"),
+            py::arg("native_width") = false);
   hcl_m.def("move_return_to_input", &moveReturnToInput);
 
+  // Object file APIs.
+  // The memory mappings of the external constants are kept alive as an
+  // attribute of the engine, see register_external_constants.
+  py::class_<ObjectEngine>(hcl_m, "ObjectEngine", py::dynamic_attr())
+      .def(py::init<const std::string &, const std::vector<std::string> &>(),
+           py::arg("path"),
+           py::arg("shared_libs") = std::vector<std::string>())
+      .def("raw_lookup", &ObjectEngine::rawLookup, py::arg("func_name"))
+      .def("raw_register_runtime", &ObjectEngine::rawRegisterRuntime,
+           py::arg("name"), py::arg("callback"));
+
   // Lowering APIs.
   hcl_m.def("lower_composite_type", &lowerCompositeType);
   hcl_m.def("lower_bit_ops", &lowerBitOps);
   hcl_m.def("legalize_cast", &legalizeCast);
   hcl_m.def("remove_stride_map", &removeStrideMap);
+  // Applies the unroll and pipeline_ii attributes to the loops for the CPU.
+  hcl_m.def("lower_loop_attributes", &lowerLoopAttributes, py::arg("module"),
+            py::arg("interleave_factor") = 4);
 }
@@ -2,6 +2,7 @@
 
 #include "mlir/Conversion/AffineToStandard/AffineToStandard.h"
 #include "mlir/Conversion/ArithmeticToLLVM/ArithmeticToLLVM.h"
+#include "mlir/Conversion/AsyncToLLVM/AsyncToLLVM.h"
 #include "mlir/Conversion/ControlFlowToLLVM/ControlFlowToLLVM.h"
 #include "mlir/Conversion/FuncToLLVM/ConvertFuncToLLVM.h"
 #include "mlir/Conversion/LLVMCommon/ConversionTarget.h"
@@ -10,14 +11,20 @@
 #include "mlir/Conversion/MemRefToLLVM/MemRefToLLVM.h"
 #include "mlir/Conversion/ReconcileUnrealizedCasts/ReconcileUnrealizedCasts.h"
 #include "mlir/Conversion/SCFToControlFlow/SCFToControlFlow.h"
+#include "mlir/Dialect/Affine/Analysis/AffineAnalysis.h"
 #include "mlir/Dialect/Affine/IR/AffineOps.h"
+#include "mlir/Dialect/Affine/Utils.h"
+#include "mlir/Dialect/Arithmetic/Transforms/Passes.h"
+#include "mlir/Dialect/Async/Passes.h"
 #include "mlir/Dialect/Func/IR/FuncOps.h"
 #include "mlir/Dialect/LLVMIR/LLVMDialect.h"
 #include "mlir/Dialect/MemRef/IR/MemRef.h"
 #include "mlir/Dialect/SCF/IR/SCF.h"
 #include "mlir/Pass/Pass.h"
+#include "mlir/Pass/PassManager.h"
 #include "mlir/Transforms/DialectConversion.h"
 #include "llvm/ADT/Sequence.h"
+#include "llvm/Support/Threading.h"
 
 using namespace mlir;
 using namespace hcl;
@@ -397,19 +404,54 @@ public:
 } // namespace
 
 namespace {
-struct HCLToLLVMLoweringPass
-    : public HCLToLLVMLoweringBase<HCLToLLVMLoweringPass> {
-  void runOnOperation() override {
-    auto module = getOperation();
-    if (!applyHCLToLLVMLoweringPass(module, getContext()))
-      signalPassFailure();
+
+// Turn the loops marked by the parallel schedule into affine.parallel loops.
+// Only the outermost marked loop of a nest is parallelized. A loop with
+// loop-carried dependences is kept sequential, including a reduction, as
+// async-parallel-for does not lower the reductions of affine.parallel.
+// Returns true if any loop has been parallelized.
+bool parallelizeMarkedLoops(ModuleOp &module) {
+  SmallVector<AffineForOp, 4> forOps;
+  module.walk<WalkOrder::PreOrder>([&](AffineForOp forOp) {
+    if (forOp->hasAttr("parallel"))
+      forOps.push_back(forOp);
+  });
+  bool changed = false;
+  for (auto forOp : forOps) {
+    if (forOp->getParentOfType<AffineParallelOp>())
+      continue;
+    if (!isLoopParallel(forOp)) {
+      forOp.emitWarning("loop has loop-carried dependences and is not "
+                        "parallelized");
+      continue;
+    }
+    (void)affineParallelize(forOp);
+    changed = true;
   }
-};
-} // namespace
+  return changed;
+}
 
-namespace mlir {
-namespace hcl {
-bool applyHCLToLLVMLoweringPass(ModuleOp &module, MLIRContext &context) {
+// Lower the parallelized loops to tasks of the MLIR async runtime, which run
+// on its thread pool. The iterations are partitioned into blocks for
+// numThreads workers, all hardware threads if it is 0. The lowered module has
+// to be linked with the mlir_async_runtime library.
+void buildAsyncParallelPipeline(OpPassManager &pm, unsigned numThreads) {
+  if (numThreads == 0)
+    numThreads = llvm::hardware_concurrency().compute_thread_count();
+  pm.addPass(createLowerAffinePass());
+  // A task runs a whole iteration of the loop nest, so that even a few
+  // iterations are worth to be distributed.
+  pm.addPass(createAsyncParallelForPass(/*asyncDispatch=*/true, numThreads,
+                                        /*minTaskSize=*/1));
+  pm.addPass(createAsyncToAsyncRuntimePass());
+  pm.addPass(createAsyncRuntimeRefCountingPass());
+  pm.addPass(createAsyncRuntimeRefCountingOptPass());
+  pm.addPass(arith::createArithmeticExpandOpsPass());
+  pm.addPass(createConvertAsyncToLLVMPass());
+}
+
+// Lower the module, whose parallel loops are lowered already, to LLVM.
+bool applyLLVMConversion(ModuleOp &module, MLIRContext &context) {
   // The first thing to define is the conversion target. This will define the
   // final target for this lowering. For this lowering, we are only targeting
   // the LLVM dialect.
@@ -456,6 +498,53 @@ bool applyHCLToLLVMLoweringPass(ModuleOp &module, MLIRContext &context) {
     return false;
   return true;
 }
+
+struct HCLToLLVMLoweringPass
+    : public HCLToLLVMLoweringBase<HCLToLLVMLoweringPass> {
+  HCLToLLVMLoweringPass() = default;
+  HCLToLLVMLoweringPass(unsigned numThreads) {
+    this->numThreads = numThreads;
+  }
+
+  void getDependentDialects(DialectRegistry &registry) const override {
+    HCLToLLVMLoweringBase::getDependentDialects(registry);
+    OpPassManager pm(ModuleOp::getOperationName());
+    buildAsyncParallelPipeline(pm, numThreads);
+    pm.getDependentDialects(registry);
+  }
+
+  void runOnOperation() override {
+    auto module = getOperation();
+    // The parallel loops are lowered by a pipeline nested in this pass, so
+    // that it runs with the instrumentation and options of the enclosing
+    // pass manager
+    if (numThreads != 1 && parallelizeMarkedLoops(module)) {
+      OpPassManager pm(ModuleOp::getOperationName());
+      buildAsyncParallelPipeline(pm, numThreads);
+      if (failed(runPipeline(pm, module)))
+        return signalPassFailure();
+    }
+    if (!applyLLVMConversion(module, getContext()))
+      signalPassFailure();
+  }
+};
+
+} // namespace
+
+namespace mlir {
+namespace hcl {
+bool applyHCLToLLVMLoweringPass(ModuleOp &module, MLIRContext &context,
+                                unsigned numThreads) {
+  // The entry point of the Python bindings, which is not run by a pass
+  // manager
+  if (numThreads != 1 && parallelizeMarkedLoops(module)) {
+    PassManager pm(&context);
+    buildAsyncParallelPipeline(pm, numThreads);
+    if (failed(pm.run(module)))
+      return false;
+  }
+  return applyLLVMConversion(module, context);
+}
 } // namespace hcl
 } // namespace mlir
 
@@ -465,8 +554,9 @@ namespace hcl {
 //   PassRegistration<HCLToLLVMLoweringPass>();
 // }
 
-std::unique_ptr<OperationPass<ModuleOp>> createHCLToLLVMLoweringPass() {
-  return std::make_unique<HCLToLLVMLoweringPass>();
+std::unique_ptr<OperationPass<ModuleOp>>
+createHCLToLLVMLoweringPass(unsigned numThreads) {
+  return std::make_unique<HCLToLLVMLoweringPass>(numThreads);
 }
 } // namespace hcl
 } // namespace mlir
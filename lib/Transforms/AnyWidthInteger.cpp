@@ -8,7 +8,8 @@
 // AnyWidthInteger Pass
 // This pass is to support any-width integer input from numpy.
 // The input program has any-width integer input/output arguments
-// The output program has 64-bit integer input/output and casts
+// The output program has 64-bit integer input/output and casts, or with
+// native widths, the integer width of the next numpy integer type
 //===----------------------------------------------------------------------===//
 
 #include "PassDetail.h"
@@ -32,7 +33,20 @@ using namespace hcl;
 namespace mlir {
 namespace hcl {
 
-void updateTopFunctionSignature(func::FuncOp &funcOp) {
+/// Integer width of the top function interface. By default, all integers are
+/// widened to 64 bits. With native widths, the widths of numpy integer types
+/// are kept and the other widths are widened to the next one.
+static size_t getInterfaceWidth(Type type, bool nativeWidth) {
+  size_t width = type.cast<IntegerType>().getWidth();
+  if (!nativeWidth || width > 64)
+    return 64;
+  size_t interfaceWidth = 8;
+  while (interfaceWidth < width)
+    interfaceWidth *= 2;
+  return interfaceWidth;
+}
+
+void updateTopFunctionSignature(func::FuncOp &funcOp, bool nativeWidth) {
   FunctionType functionType = funcOp.getFunctionType();
   SmallVector<Type, 4> result_types =
       llvm::to_vector<4>(functionType.getResults());
@@ -49,7 +63,7 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
       // If result memref element type is integer
       // change it to i64 to be compatible with numpy
       if (et.isa<IntegerType>()) {
-        size_t width = 64;
+        size_t width = getInterfaceWidth(et, nativeWidth);
         Type newElementType = IntegerType::get(funcOp.getContext(), width);
         new_result_types.push_back(memrefType.clone(newElementType));
       } else {
@@ -64,7 +78,7 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
       // If argument memref element type is integer
       // change it to i64 to be compatible with numpy
       if (et.isa<IntegerType>()) {
-        size_t width = 64;
+        size_t width = getInterfaceWidth(et, nativeWidth);
         Type newElementType = IntegerType::get(funcOp.getContext(), width);
         new_arg_types.push_back(memrefType.clone(newElementType));
       } else {
@@ -87,6 +101,7 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
   // Also build loop nest to cast the input args
   SmallVector<Value, 4> newMemRefs;
   SmallVector<Value, 4> blockArgs;
+  SmallVector<std::pair<size_t, bool>, 4> blockArgWidths;
   OpBuilder builder(funcOp->getRegion(0));
   for (Block &block : funcOp.getBlocks()) {
     for (unsigned i = 0; i < block.getNumArguments(); i++) {
@@ -94,10 +109,13 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
       if (MemRefType memrefType = argType.cast<MemRefType>()) {
         Type et = memrefType.getElementType();
         if (et.isa<IntegerType>()) {
-          size_t width = 64;
+          size_t width = getInterfaceWidth(et, nativeWidth);
+          size_t oldWidth = et.cast<IntegerType>().getWidth();
+          // The argument is used in place if it has the interface width.
+          if (width == oldWidth)
+            continue;
           Type newType = IntegerType::get(funcOp.getContext(), width);
           Type newMemRefType = memrefType.clone(newType);
-          size_t oldWidth = et.cast<IntegerType>().getWidth();
           block.getArgument(i).setType(newMemRefType);
           bool is_unsigned = false;
           if (i < itypes.length()) {
@@ -108,6 +126,7 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
                             oldWidth, is_unsigned);
           newMemRefs.push_back(newMemRef);
           blockArgs.push_back(block.getArgument(i));
+          blockArgWidths.push_back({width, is_unsigned});
         }
       }
     }
@@ -133,9 +152,9 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
           if (i < otypes.length()) {
             is_unsigned = otypes[i] == 'u';
           }
-          Value newMemRef =
-              castIntMemRef(returnRewriter, op->getLoc(), allocOp.getResult(),
-                            64, is_unsigned, false);
+          Value newMemRef = castIntMemRef(
+              returnRewriter, op->getLoc(), allocOp.getResult(),
+              getInterfaceWidth(etype, nativeWidth), is_unsigned, false);
           // Only replace the single use of oldMemRef: returnOp
           op->setOperand(i, newMemRef);
         }
@@ -145,12 +164,10 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
     for (auto v : llvm::enumerate(newMemRefs)) {
       Value newMemRef = v.value();
       Value &blockArg = blockArgs[v.index()];
-      bool is_unsigned = false;
-      if (v.index() < itypes.length()) {
-        is_unsigned = itypes[v.index()] == 'u';
-      }
-      castIntMemRef(returnRewriter, op->getLoc(), newMemRef, 64, is_unsigned,
-                    false, blockArg);
+      size_t width = blockArgWidths[v.index()].first;
+      bool is_unsigned = blockArgWidths[v.index()].second;
+      castIntMemRef(returnRewriter, op->getLoc(), newMemRef, width,
+                    is_unsigned, false, blockArg);
     }
   }
 
@@ -161,7 +178,7 @@ void updateTopFunctionSignature(func::FuncOp &funcOp) {
 }
 
 /// entry point
-bool applyAnyWidthInteger(ModuleOp &mod) {
+bool applyAnyWidthInteger(ModuleOp &mod, bool nativeWidth) {
   // Find top-level function
   bool isFoundTopFunc = false;
   func::FuncOp *topFunc;
@@ -174,7 +191,7 @@ bool applyAnyWidthInteger(ModuleOp &mod) {
   }
 
   if (isFoundTopFunc && topFunc) {
-    updateTopFunctionSignature(*topFunc);
+    updateTopFunctionSignature(*topFunc, nativeWidth);
   }
 
   return true;
@@ -187,10 +204,14 @@ namespace {
 
 struct HCLAnyWidthIntegerTransformation
     : public AnyWidthIntegerBase<HCLAnyWidthIntegerTransformation> {
+  HCLAnyWidthIntegerTransformation() = default;
+  HCLAnyWidthIntegerTransformation(bool nativeWidth) {
+    this->nativeWidth = nativeWidth;
+  }
 
   void runOnOperation() override {
     auto mod = getOperation();
-    if (!applyAnyWidthInteger(mod))
+    if (!applyAnyWidthInteger(mod, nativeWidth))
       return signalPassFailure();
   }
 };
@@ -199,8 +220,9 @@ struct HCLAnyWidthIntegerTransformation
 namespace mlir {
 namespace hcl {
 
-std::unique_ptr<OperationPass<ModuleOp>> createAnyWidthIntegerPass() {
-  return std::make_unique<HCLAnyWidthIntegerTransformation>();
+std::unique_ptr<OperationPass<ModuleOp>>
+createAnyWidthIntegerPass(bool nativeWidth) {
+  return std::make_unique<HCLAnyWidthIntegerTransformation>(nativeWidth);
 }
 
 } // namespace hcl
@@ -787,11 +787,25 @@ void lowerFixedMax(MaxFixedOp &op) {
   }
 }
 
-// Build a memref.get_global operation that points to an I64 global memref
-// The assumption is that all fixed-point encoding's global memrefs are of
-// type I64.
+// Update affine.load operations res type to be consistent with the
+// element type of the integer memref that replaced a fixed-point memref
+void updateAffineLoadTypes(Value memref) {
+  for (auto &use : memref.getUses()) {
+    if (auto loadOp = dyn_cast<AffineLoadOp>(use.getOwner())) {
+      for (auto v : llvm::enumerate(loadOp->getResults())) {
+        Type newType =
+            loadOp->getOperand(0).getType().cast<MemRefType>().getElementType();
+        loadOp->getResult(v.index()).setType(newType);
+      }
+    }
+  }
+}
+
+// Build a memref.get_global operation that points to the integer global
+// memref holding the fixed-point encodings. The global is stored at the
+// width of the fixed-point type, or at the next width a dense attribute
+// can hold as a native integer, in which case the encodings are truncated.
 void lowerGetGlobalFixedOp(GetGlobalFixedOp &op) {
-  // TODO(Niansong): truncate the global memref to the width of the fixed-point
   OpBuilder rewriter(op);
   auto loc = op.getLoc();
   MemRefType oldType = op->getResult(0).getType().dyn_cast<MemRefType>();
@@ -802,10 +816,16 @@ void lowerGetGlobalFixedOp(GetGlobalFixedOp &op) {
   } else {
     isSigned = false;
   }
-  auto memRefType = oldType.clone(IntegerType::get(op.getContext(), 64));
   auto symbolName = op.name();
+  auto global =
+      SymbolTable::lookupNearestSymbolFrom<memref::GlobalOp>(op, op.nameAttr());
+  if (!global) {
+    op.emitError("cannot find the global memref of GetGlobalFixedOp");
+    return;
+  }
+  auto memRefType = global.type();
   auto res = rewriter.create<memref::GetGlobalOp>(loc, memRefType, symbolName);
-  // Truncate or Extend I64 memref to the width of the fixed-point
+  // Truncate or Extend the global memref to the width of the fixed-point
   size_t bitwidth;
   if (auto fixedType = oldElementType.dyn_cast<FixedType>()) {
     bitwidth = fixedType.getWidth();
@@ -815,6 +835,12 @@ void lowerGetGlobalFixedOp(GetGlobalFixedOp &op) {
     llvm::errs() << "unknown fixed-point type in GetGlobalFixedOp\n";
     return;
   }
+  if (memRefType.getElementType().isInteger(bitwidth)) {
+    // the global is stored at the width of the fixed-point type
+    op->replaceAllUsesWith(res);
+    updateAffineLoadTypes(res.getResult());
+    return;
+  }
   auto castedMemRefType =
       oldType.clone(IntegerType::get(op.getContext(), bitwidth))
           .cast<MemRefType>();
@@ -831,17 +857,7 @@ void lowerGetGlobalFixedOp(GetGlobalFixedOp &op) {
       });
 
   op->replaceAllUsesWith(castedMemRef);
-  // update affine.load operations res type to be consistent with castedMemRef's
-  // element type
-  for (auto &use : castedMemRef.getResult().getUses()) {
-    if (auto loadOp = dyn_cast<AffineLoadOp>(use.getOwner())) {
-      for (auto v : llvm::enumerate(loadOp->getResults())) {
-        Type newType =
-            loadOp->getOperand(0).getType().cast<MemRefType>().getElementType();
-        loadOp->getResult(v.index()).setType(newType);
-      }
-    }
-  }
+  updateAffineLoadTypes(castedMemRef.getResult());
 }
 
 void lowerFixedToFloat(FixedToFloatOp &op) {
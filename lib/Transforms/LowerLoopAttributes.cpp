@@ -0,0 +1,105 @@
+//===----------------------------------------------------------------------===//
+//
+// Copyright 2021-2022 The HCL-MLIR Authors.
+//
+//===----------------------------------------------------------------------===//
+
+#include "PassDetail.h"
+
+#include "hcl/Dialect/HeteroCLDialect.h"
+#include "hcl/Dialect/HeteroCLOps.h"
+#include "hcl/Transforms/Passes.h"
+
+#include "mlir/Dialect/Affine/Analysis/AffineAnalysis.h"
+#include "mlir/Dialect/Affine/IR/AffineOps.h"
+#include "mlir/Dialect/Affine/LoopUtils.h"
+#include "mlir/Dialect/Func/IR/FuncOps.h"
+
+using namespace mlir;
+using namespace hcl;
+
+namespace mlir {
+namespace hcl {
+
+// The unroll and pipeline_ii attributes of the loop schedules only become
+// pragmas of the HLS code. This pass applies them to the loops themselves for
+// the CPU: a loop marked unroll is unrolled by its factor, or fully if it is
+// 0, and the iterations of a loop marked pipeline_ii are interleaved by
+// interleaveFactor, so that their independent operations overlap.
+bool applyLowerLoopAttributes(ModuleOp &module, unsigned interleaveFactor) {
+  // Innermost loops first, so that the loops copied by unrolling an outer
+  // loop are already transformed
+  SmallVector<AffineForOp, 8> forOps;
+  module.walk([&](AffineForOp forOp) {
+    if (forOp->hasAttr("unroll") || forOp->hasAttr("pipeline_ii"))
+      forOps.push_back(forOp);
+  });
+
+  for (auto forOp : forOps) {
+    // The attributes are removed first, so that the cleanup loops are not
+    // marked as well
+    auto unrollAttr = forOp->getAttrOfType<IntegerAttr>("unroll");
+    bool pipelined = forOp->hasAttr("pipeline_ii");
+    forOp->removeAttr("unroll");
+    forOp->removeAttr("pipeline_ii");
+
+    // Unrolling already overlaps the iterations of a loop that is also
+    // pipelined
+    if (unrollAttr) {
+      unsigned factor = unrollAttr.getInt();
+      if (factor == 1)
+        continue;
+      LogicalResult result = factor == 0
+                                 ? loopUnrollFull(forOp)
+                                 : loopUnrollUpToFactor(forOp, factor);
+      if (failed(result))
+        forOp.emitWarning("Cannot unroll the loop, keeping it rolled");
+      continue;
+    }
+
+    if (!pipelined || interleaveFactor <= 1)
+      continue;
+    // The inner loops of independent iterations are jammed, while the
+    // iterations of a loop with carried dependences are only unrolled, which
+    // keeps the order of their memory accesses
+    LogicalResult result =
+        isLoopParallel(forOp)
+            ? loopUnrollJamUpToFactor(forOp, interleaveFactor)
+            : loopUnrollUpToFactor(forOp, interleaveFactor);
+    if (failed(result))
+      forOp.emitWarning("Cannot interleave the iterations of the loop");
+  }
+  return true;
+}
+
+} // namespace hcl
+} // namespace mlir
+
+namespace {
+
+struct HCLLowerLoopAttributesTransformation
+    : public LowerLoopAttributesBase<HCLLowerLoopAttributesTransformation> {
+  HCLLowerLoopAttributesTransformation() = default;
+  HCLLowerLoopAttributesTransformation(unsigned interleaveFactor) {
+    this->interleaveFactor = interleaveFactor;
+  }
+
+  void runOnOperation() override {
+    auto mod = getOperation();
+    if (!applyLowerLoopAttributes(mod, interleaveFactor))
+      return signalPassFailure();
+  }
+};
+} // namespace
+
+namespace mlir {
+namespace hcl {
+
+std::unique_ptr<OperationPass<ModuleOp>>
+createLowerLoopAttributesPass(unsigned interleaveFactor) {
+  return std::make_unique<HCLLowerLoopAttributesTransformation>(
+      interleaveFactor);
+}
+
+} // namespace hcl
+} // namespace mlir
@@ -26,11 +26,10 @@ using namespace hcl;
 // Utils
 //===----------------------------------------------------------------------===//
 
-static SmallString<16> getTypeName(Value val) {
+static SmallString<16> getTypeName(Type valType) {
   // Handle memref, tensor, and vector types.
   bool BIT_FLAG = false;
-  auto valType = val.getType();
-  if (auto arrayType = val.getType().dyn_cast<ShapedType>())
+  if (auto arrayType = valType.dyn_cast<ShapedType>())
     valType = arrayType.getElementType();
 
   // Handle float types.
@@ -81,12 +80,17 @@ static SmallString<16> getTypeName(Value val) {
     return SmallString<16>(
         "ac_ufixed<" + std::to_string(ufixedType.getWidth()) + ", " +
         std::to_string(ufixedType.getWidth() - ufixedType.getFrac()) + ">");
-  else
-    val.getDefiningOp()->emitError("has unsupported type.");
 
   return SmallString<16>();
 }
 
+static SmallString<16> getTypeName(Value val) {
+  auto name = getTypeName(val.getType());
+  if (name.empty())
+    val.getDefiningOp()->emitError("has unsupported type.");
+  return name;
+}
+
 //===----------------------------------------------------------------------===//
 // ModuleEmitter Class Declaration
 //===----------------------------------------------------------------------===//
@@ -108,6 +112,8 @@ public:
   template <typename OpType> void emitAlloc(OpType op);
   void emitLoad(memref::LoadOp op);
   void emitStore(memref::StoreOp op);
+  void emitGetGlobal(memref::GetGlobalOp op);
+  void emitGlobal(memref::GlobalOp op);
 
   /// Standard expression emitters.
   void emitBinary(Operation *op, const char *syntax);
@@ -245,6 +251,9 @@ public:
   bool visitOp(memref::LoadOp op) { return emitter.emitLoad(op), true; }
   bool visitOp(memref::StoreOp op) { return emitter.emitStore(op), true; }
   bool visitOp(memref::DeallocOp op) { return true; }
+  bool visitOp(memref::GetGlobalOp op) {
+    return emitter.emitGetGlobal(op), true;
+  }
 
 private:
   ModuleEmitter &emitter;
@@ -536,6 +545,34 @@ void ModuleEmitter::emitStore(memref::StoreOp op) {
   emitInfoAndNewLine(op);
 }
 
+void ModuleEmitter::emitGetGlobal(memref::GetGlobalOp op) {
+  // The global is defined at file scope, see emitGlobal, so its accesses
+  // refer to it by name and nothing is emitted here.
+  state.nameTable[op.getResult()] = op.name();
+}
+
+void ModuleEmitter::emitGlobal(memref::GlobalOp op) {
+  if (!hasGlobalData(op)) {
+    emitError(op, "has no initial value to define the global with.");
+    return;
+  }
+  // e.g. f16, which has no type in the generated code
+  auto typeName = getTypeName(getGlobalDeclType(op));
+  if (typeName.empty()) {
+    emitError(op, "has an unsupported element type.");
+    return;
+  }
+  // Other values are not given the name of the global.
+  state.nameConflictCnt.emplace(op.sym_name().str(), 0);
+  os << "const " << typeName << " " << op.sym_name();
+  for (auto &shape : op.type().cast<ShapedType>().getShape())
+    os << "[" << shape << "]";
+  os << " = ";
+  emitGlobalInitializer(op);
+  os << ";";
+  emitInfoAndNewLine(op);
+}
+
 void ModuleEmitter::emitArrayDecl(Value array, bool isFunc, std::string name) {
   assert(!isDeclared(array) && "has been declared before.");
 
@@ -1064,7 +1101,15 @@ using namespace sycl;
 // This is an FPGA best practice that makes it easier to identify the kernel in 
 // the optimization reports.
 class Top;
+)XXX";
+  os << snippet;
 
+  // Constant globals are declared at namespace scope.
+  for (auto &op : *module.getBody())
+    if (auto global = dyn_cast<memref::GlobalOp>(op))
+      emitGlobal(global);
+
+  snippet = R"XXX(
 
 int main() {
 )XXX";
@@ -1105,7 +1150,7 @@ int main() {
   for (auto &op : *module.getBody()) {
     if (auto func = dyn_cast<func::FuncOp>(op))
       emitFunction(func);
-    else
+    else if (!isa<memref::GlobalOp>(op))
       emitError(&op, "is unsupported operation.");
   }
 
@@ -1126,7 +1171,7 @@ int main() {
   for (auto &op : *module.getBody()) {
     if (auto func = dyn_cast<func::FuncOp>(op))
       emitFunction(func, true);
-    else
+    else if (!isa<memref::GlobalOp>(op))
       emitError(&op, "is unsupported operation.");
   }
 
@@ -1184,14 +1229,24 @@ int main() {
 //===----------------------------------------------------------------------===//
 
 LogicalResult hcl::emitIntelHLS(ModuleOp module, llvm::raw_ostream &os) {
-  HCLEmitterState state(os);
+  return emitIntelHLS(module, os, EmitterOptions());
+}
+
+LogicalResult hcl::emitIntelHLS(ModuleOp module, llvm::raw_ostream &os,
+                                const EmitterOptions &options) {
+  HCLEmitterState state(os, options);
   ModuleEmitter(state).emitModule(module);
   return failure(state.encounteredError);
 }
 
 void hcl::registerEmitIntelHLSTranslation() {
+  registerEmitterCLOptions();
   static TranslateFromMLIRRegistration toIntelHLS(
-      "emit-intel-hls", emitIntelHLS, [&](DialectRegistry &registry) {
+      "emit-intel-hls",
+      [](ModuleOp module, llvm::raw_ostream &os) {
+        return emitIntelHLS(module, os, getEmitterOptionsFromCommandLine());
+      },
+      [&](DialectRegistry &registry) {
         // clang-format off
         registry.insert<
           mlir::hcl::HeteroCLDialect,
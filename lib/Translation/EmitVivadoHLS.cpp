@@ -14,9 +14,17 @@
 #include "mlir/Dialect/Func/IR/FuncOps.h"
 #include "mlir/IR/AffineExprVisitor.h"
 #include "mlir/IR/IntegerSet.h"
+#include "mlir/IR/Threading.h"
 #include "mlir/InitAllDialects.h"
 #include "mlir/Tools/mlir-translate/Translation.h"
+#include "llvm/ADT/StringExtras.h"
+#include "llvm/ADT/StringSet.h"
+#include "llvm/Support/FileSystem.h"
+#include "llvm/Support/JSON.h"
+#include "llvm/Support/MemoryBuffer.h"
+#include "llvm/Support/Path.h"
 #include "llvm/Support/raw_ostream.h"
+#include "llvm/Support/xxhash.h"
 
 #include "hcl/Dialect/HeteroCLDialect.h"
 #include "hcl/Dialect/HeteroCLOps.h"
@@ -29,7 +37,8 @@ using namespace hcl;
 //===----------------------------------------------------------------------===//
 
 // used for determine whether to generate C++ default types or ap_(u)int
-static bool BIT_FLAG = false;
+// thread-local, as the functions of a module can be emitted in parallel
+static thread_local bool BIT_FLAG = false;
 
 static SmallString<16> getTypeName(Type valType) {
   if (auto arrayType = valType.dyn_cast<ShapedType>())
@@ -158,6 +167,11 @@ public:
   /// Top-level MLIR module emitter.
   void emitModule(ModuleOp module);
 
+  /// Emitters of the translation units of a module, i.e. the header with the
+  /// globals and function prototypes and the file of one function.
+  void emitModuleHeader(ModuleOp module);
+  void emitFunctionFile(func::FuncOp func);
+
 private:
   /// C++ component emitters.
   void emitValue(Value val, unsigned rank = 0, bool isPtr = false,
@@ -172,7 +186,7 @@ private:
   void emitLoopDirectives(Operation *op);
   void emitArrayDirectives(Value memref);
   void emitFunctionDirectives(func::FuncOp func, ArrayRef<Value> portList);
-  void emitFunction(func::FuncOp func);
+  void emitFunction(func::FuncOp func, bool declOnly = false);
   void emitHostFunction(func::FuncOp func);
 };
 } // namespace
@@ -1143,56 +1157,20 @@ void ModuleEmitter::emitGetGlobalFixed(hcl::GetGlobalFixedOp op) {
 }
 
 void ModuleEmitter::emitGlobal(memref::GlobalOp op) {
-  auto init_val = op.initial_value();
-  if (!init_val.hasValue())
+  if (!hasGlobalData(op))
     return;
-  auto attr = init_val.getValue();
-  if (auto denseAttr = attr.dyn_cast<DenseElementsAttr>()) {
-    os << "\n";
-    indent();
-    auto arrayType = op.type().cast<ShapedType>();
-    auto type = arrayType.getElementType();
-    os << "const ";
-    os << getTypeName(type);
-    os << " " << op.sym_name();
-    for (auto &shape : arrayType.getShape())
-      os << "[" << shape << "]";
-    os << " = {";
-
-    unsigned elementIdx = 0;
-    for (auto element : denseAttr.getValues<Attribute>()) {
-      if (type.isF32()) {
-        auto value = element.cast<FloatAttr>().getValue().convertToFloat();
-        if (std::isfinite(value))
-          os << value;
-        else if (value > 0)
-          os << "INFINITY";
-        else
-          os << "-INFINITY";
-
-      } else if (type.isF64()) {
-        auto value = element.cast<FloatAttr>().getValue().convertToDouble();
-        if (std::isfinite(value))
-          os << value;
-        else if (value > 0)
-          os << "INFINITY";
-        else
-          os << "-INFINITY";
-
-      } else if (type.isInteger(1))
-        os << element.cast<BoolAttr>().getValue();
-      else if (type.isIntOrIndex())
-        os << element.cast<IntegerAttr>().getValue();
-      else
-        emitError(op, "array has unsupported element type.");
-
-      if (elementIdx++ != denseAttr.getNumElements() - 1)
-        os << ", ";
-    }
-    os << "};";
-    emitInfoAndNewLine(op);
-    os << "\n";
-  }
+  os << "\n";
+  indent();
+  os << "const ";
+  os << getTypeName(getGlobalDeclType(op));
+  os << " " << op.sym_name();
+  for (auto &shape : op.type().cast<ShapedType>().getShape())
+    os << "[" << shape << "]";
+  os << " = ";
+  emitGlobalInitializer(op);
+  os << ";";
+  emitInfoAndNewLine(op);
+  os << "\n";
 }
 
 void ModuleEmitter::emitTensorExtract(tensor::ExtractOp op) {
@@ -1882,7 +1860,7 @@ void ModuleEmitter::emitFunctionDirectives(func::FuncOp func,
   // }
 }
 
-void ModuleEmitter::emitFunction(func::FuncOp func) {
+void ModuleEmitter::emitFunction(func::FuncOp func, bool declOnly) {
   if (func->hasAttr("bit"))
     BIT_FLAG = true;
 
@@ -1983,6 +1961,10 @@ void ModuleEmitter::emitFunction(func::FuncOp func) {
     emitError(func, "doesn't have a return operation as terminator.");
 
   reduceIndent();
+  if (declOnly) {
+    os << "\n);\n\n";
+    return;
+  }
   os << "\n) {";
   emitInfoAndNewLine(func);
 
@@ -2026,9 +2008,7 @@ void ModuleEmitter::emitHostFunction(func::FuncOp func) {
   os << "\n";
 }
 
-/// Top-level MLIR module emitter.
-void ModuleEmitter::emitModule(ModuleOp module) {
-  std::string device_header = R"XXX(
+static const char *device_header = R"XXX(
 //===------------------------------------------------------------*- C++ -*-===//
 //
 // Automatically generated file for High-level Synthesis (HLS).
@@ -2045,6 +2025,8 @@ void ModuleEmitter::emitModule(ModuleOp module) {
 using namespace std;
 )XXX";
 
+/// Top-level MLIR module emitter.
+void ModuleEmitter::emitModule(ModuleOp module) {
   std::string host_header = R"XXX(
 //===------------------------------------------------------------*- C++ -*-===//
 //
@@ -2095,19 +2077,259 @@ using namespace std;
   }
 }
 
+/// Header of the translation units of a module, which declares the globals and
+/// the prototypes of all functions.
+void ModuleEmitter::emitModuleHeader(ModuleOp module) {
+  os << "#ifndef KERNEL_H\n#define KERNEL_H\n";
+  os << device_header;
+  for (auto &op : *module.getBody()) {
+    if (auto func = dyn_cast<func::FuncOp>(op)) {
+      // The prototype has to match the types of the definition, which is
+      // emitted in its own translation unit.
+      BIT_FLAG = false;
+      emitFunction(func, /*declOnly=*/true);
+    } else if (auto cst = dyn_cast<memref::GlobalOp>(op))
+      emitGlobal(cst);
+    else
+      emitError(&op, "is unsupported operation.");
+  }
+  os << "\n#endif // KERNEL_H\n";
+}
+
+/// Translation unit of one function of a module.
+void ModuleEmitter::emitFunctionFile(func::FuncOp func) {
+  os << "#include \"kernel.h\"\n\n";
+  emitFunction(func);
+}
+
 //===----------------------------------------------------------------------===//
 // Entry of hcl-translate
 //===----------------------------------------------------------------------===//
 
 LogicalResult hcl::emitVivadoHLS(ModuleOp module, llvm::raw_ostream &os) {
-  HCLEmitterState state(os);
+  return emitVivadoHLS(module, os, EmitterOptions());
+}
+
+LogicalResult hcl::emitVivadoHLS(ModuleOp module, llvm::raw_ostream &os,
+                                 const EmitterOptions &options) {
+  if (!options.splitDir.empty()) {
+    std::vector<std::string> files;
+    auto result = emitVivadoHLSFiles(module, options.splitDir, options, files);
+    for (auto &file : files)
+      os << file << "\n";
+    return result;
+  }
+  BIT_FLAG = false;
+  HCLEmitterState state(os, options);
   ModuleEmitter(state).emitModule(module);
   return failure(state.encounteredError);
 }
 
+/// The emitter options that change the generated code. The split directory,
+/// which is also the sidecar directory, is where the manifest is kept.
+static std::string getOptionsKey(const EmitterOptions &options) {
+  return "sidecar-threshold=" + std::to_string(options.sidecarThreshold) +
+         "\n";
+}
+
+/// The signless type of an unsigned integer type or of a memref of them.
+static Type getSignlessType(Type type) {
+  if (auto memrefType = type.dyn_cast<MemRefType>()) {
+    auto elementType = getSignlessType(memrefType.getElementType());
+    if (elementType == memrefType.getElementType())
+      return type;
+    return MemRefType::get(memrefType.getShape(), elementType,
+                           memrefType.getLayout(),
+                           memrefType.getMemorySpace());
+  }
+  if (auto intType = type.dyn_cast<IntegerType>())
+    if (intType.isUnsigned())
+      return IntegerType::get(type.getContext(), intType.getWidth());
+  return type;
+}
+
+/// Fingerprint of the IR of a function and of the emitter options, which
+/// determine the code of its translation unit. The emitter fixes the
+/// signedness of the types in place, following the "unsigned", "itypes" and
+/// "otypes" attributes, so the types of a copy are made signless again, for
+/// the fingerprint of a module not to change once it has been emitted.
+static std::string getFingerprint(func::FuncOp func, StringRef optionsKey) {
+  auto copy = cast<func::FuncOp>(func->clone());
+  copy.walk([](Operation *op) {
+    for (auto result : op->getResults())
+      result.setType(getSignlessType(result.getType()));
+    for (auto &region : op->getRegions())
+      for (auto &block : region)
+        for (auto arg : block.getArguments())
+          arg.setType(getSignlessType(arg.getType()));
+  });
+  std::string ir = optionsKey.str();
+  llvm::raw_string_ostream os(ir);
+  copy->print(os, OpPrintingFlags().useLocalScope());
+  copy->erase();
+  return llvm::utohexstr(llvm::xxHash64(os.str()));
+}
+
+/// The manifest maps the files of an emitted module to their fingerprints.
+static llvm::StringMap<std::string> readManifest(StringRef path) {
+  llvm::StringMap<std::string> manifest;
+  auto buffer = llvm::MemoryBuffer::getFile(path);
+  if (!buffer)
+    return manifest;
+  auto json = llvm::json::parse((*buffer)->getBuffer());
+  if (!json) {
+    llvm::consumeError(json.takeError());
+    return manifest;
+  }
+  if (auto *files = json->getAsObject())
+    for (auto &file : *files)
+      if (auto fingerprint = file.second.getAsString())
+        manifest[file.first.str()] = fingerprint->str();
+  return manifest;
+}
+
+LogicalResult hcl::emitVivadoHLSFiles(ModuleOp module, StringRef dir,
+                                      const EmitterOptions &options,
+                                      std::vector<std::string> &files) {
+  if (auto ec = llvm::sys::fs::create_directories(dir))
+    return module.emitError("cannot create directory ")
+           << dir << ": " << ec.message();
+
+  // The sidecar files are included by the header, so they are placed next
+  // to it.
+  EmitterOptions fileOptions = options;
+  fileOptions.sidecarDir = dir.str();
+
+  auto getPath = [&](StringRef name) {
+    SmallString<128> path(dir);
+    llvm::sys::path::append(path, name);
+    return path.str().str();
+  };
+  auto emitFile = [&](StringRef name,
+                      function_ref<void(ModuleEmitter &)> emit) {
+    auto path = getPath(name);
+    std::error_code ec;
+    llvm::raw_fd_ostream os(path, ec);
+    if (ec) {
+      module.emitError("cannot open ") << path << ": " << ec.message();
+      return failure();
+    }
+    BIT_FLAG = false;
+    HCLEmitterState state(os, fileOptions);
+    ModuleEmitter emitter(state);
+    emit(emitter);
+    return failure(state.encounteredError || os.has_error());
+  };
+
+  // The host program is a single translation unit.
+  if (module.getName().hasValue() && module.getName().getValue() == "host") {
+    files.push_back(getPath("host.cpp"));
+    return emitFile("host.cpp",
+                    [&](ModuleEmitter &emitter) { emitter.emitModule(module); });
+  }
+
+  // The fingerprints are taken before anything is emitted, as the emitter
+  // fixes the signedness of the types of the functions in place.
+  struct TranslationUnit {
+    func::FuncOp func;
+    std::string name;
+    std::string fingerprint;
+  };
+  SmallVector<TranslationUnit, 8> units;
+  for (auto func : module.getOps<func::FuncOp>())
+    units.push_back({func, (func.getName() + ".cpp").str(), ""});
+  auto optionsKey = getOptionsKey(options);
+  parallelForEach(module.getContext(), units, [&](TranslationUnit &unit) {
+    unit.fingerprint = getFingerprint(unit.func, optionsKey);
+  });
+
+  auto manifestPath = getPath("manifest.json");
+  auto manifest = readManifest(manifestPath);
+  auto isUpToDate = [&](StringRef name, StringRef fingerprint) {
+    auto it = manifest.find(name);
+    return options.incremental && it != manifest.end() &&
+           it->second == fingerprint && llvm::sys::fs::exists(getPath(name));
+  };
+  // The manifest is only valid once all files are written.
+  llvm::sys::fs::remove(manifestPath);
+
+  // The header is emitted first, as it fixes the signedness of the function
+  // ports, which is shared by all translation units. It is rewritten only if
+  // its code changes.
+  std::string header;
+  llvm::raw_string_ostream headerOS(header);
+  {
+    BIT_FLAG = false;
+    HCLEmitterState state(headerOS, fileOptions);
+    ModuleEmitter(state).emitModuleHeader(module);
+    if (state.encounteredError)
+      return failure();
+  }
+  // The code of the header already reflects the options.
+  auto headerFingerprint = llvm::utohexstr(llvm::xxHash64(headerOS.str()));
+  if (!isUpToDate("kernel.h", headerFingerprint)) {
+    auto path = getPath("kernel.h");
+    std::error_code ec;
+    llvm::raw_fd_ostream os(path, ec);
+    if (ec)
+      return module.emitError("cannot open ") << path << ": " << ec.message();
+    os << header;
+    os.flush();
+    if (os.has_error()) {
+      auto message = os.error().message();
+      os.clear_error();
+      return module.emitError("cannot write ") << path << ": " << message;
+    }
+    files.push_back(path);
+  }
+
+  // Files of the functions which are no longer in the module are removed.
+  llvm::StringSet<> names;
+  for (auto &unit : units)
+    names.insert(unit.name);
+  for (auto &file : manifest)
+    if (file.first() != "kernel.h" && !names.count(file.first()))
+      llvm::sys::fs::remove(getPath(file.first()));
+
+  SmallVector<TranslationUnit *, 8> changed;
+  for (auto &unit : units)
+    if (!isUpToDate(unit.name, unit.fingerprint)) {
+      changed.push_back(&unit);
+      files.push_back(getPath(unit.name));
+    }
+
+  // Every function only touches its own body, so the functions are emitted on
+  // the thread pool of the context.
+  if (failed(failableParallelForEach(
+          module.getContext(), changed, [&](TranslationUnit *unit) {
+            return emitFile(unit->name, [&](ModuleEmitter &emitter) {
+              emitter.emitFunctionFile(unit->func);
+            });
+          })))
+    return failure();
+
+  std::error_code ec;
+  llvm::raw_fd_ostream os(manifestPath, ec);
+  if (ec)
+    return module.emitError("cannot open ")
+           << manifestPath << ": " << ec.message();
+  llvm::json::OStream json(os, /*IndentSize=*/2);
+  json.object([&] {
+    json.attribute("kernel.h", headerFingerprint);
+    for (auto &unit : units)
+      json.attribute(unit.name, unit.fingerprint);
+  });
+  return success();
+}
+
 void hcl::registerEmitVivadoHLSTranslation() {
+  registerEmitterCLOptions();
   static TranslateFromMLIRRegistration toVivadoHLS(
-      "emit-vivado-hls", emitVivadoHLS, [&](DialectRegistry &registry) {
+      "emit-vivado-hls",
+      [](ModuleOp module, llvm::raw_ostream &os) {
+        return emitVivadoHLS(module, os, getEmitterOptionsFromCommandLine());
+      },
+      [&](DialectRegistry &registry) {
         // clang-format off
         registry.insert<
           mlir::hcl::HeteroCLDialect,
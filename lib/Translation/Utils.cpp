@@ -5,11 +5,61 @@
 //===----------------------------------------------------------------------===//
 
 #include "hcl/Translation/Utils.h"
+#include "llvm/Support/CommandLine.h"
+#include "llvm/Support/FileSystem.h"
+#include "llvm/Support/Format.h"
+#include "llvm/Support/MathExtras.h"
+#include "llvm/Support/ManagedStatic.h"
+#include "llvm/Support/MemoryBuffer.h"
+#include "llvm/Support/Path.h"
 #include "llvm/Support/raw_ostream.h"
 
 using namespace mlir;
 using namespace hcl;
 
+//===----------------------------------------------------------------------===//
+// Emitter options
+//===----------------------------------------------------------------------===//
+
+namespace {
+struct EmitterCLOptions {
+  llvm::cl::opt<uint64_t> sidecarThreshold{
+      "sidecar-threshold",
+      llvm::cl::desc("Write constant globals of at least this many bytes to "
+                     "sidecar .dat files (0 to disable)"),
+      llvm::cl::init(0)};
+  llvm::cl::opt<std::string> sidecarDir{
+      "sidecar-dir", llvm::cl::desc("Directory of the sidecar .dat files"),
+      llvm::cl::init(".")};
+  llvm::cl::opt<std::string> splitDir{
+      "split-dir",
+      llvm::cl::desc("Emit one file per function and a shared kernel.h to "
+                     "this directory")};
+  llvm::cl::opt<bool> incremental{
+      "incremental",
+      llvm::cl::desc("With -split-dir, only rewrite the files of the functions "
+                     "which changed since the last emission"),
+      llvm::cl::init(false)};
+};
+} // namespace
+
+// The options are only registered by hcl-translate, so that they are not
+// registered twice when the library is linked into the Python extension.
+static llvm::ManagedStatic<EmitterCLOptions> clOptions;
+
+void hcl::registerEmitterCLOptions() { *clOptions; }
+
+EmitterOptions hcl::getEmitterOptionsFromCommandLine() {
+  EmitterOptions options;
+  if (!clOptions.isConstructed())
+    return options;
+  options.sidecarThreshold = clOptions->sidecarThreshold;
+  options.sidecarDir = clOptions->sidecarDir;
+  options.splitDir = clOptions->splitDir;
+  options.incremental = clOptions->incremental;
+  return options;
+}
+
 // TODO: update naming rule.
 SmallString<8> HCLEmitterBase::addName(Value val, bool isPtr,
                                        std::string name) {
@@ -82,4 +132,184 @@ void fixUnsignedType(Value &result, bool isUnsigned) {
       result.setType(type);
     }
   }
-}
\ No newline at end of file
+}
+//===----------------------------------------------------------------------===//
+// Constant globals
+//===----------------------------------------------------------------------===//
+
+ArrayAttr getExternalData(memref::GlobalOp op) {
+  if (op.initial_value())
+    return ArrayAttr();
+  auto module = op->getParentOfType<ModuleOp>();
+  if (!module)
+    return ArrayAttr();
+  auto externals = module->getAttrOfType<DictionaryAttr>("hcl.external_data");
+  if (!externals)
+    return ArrayAttr();
+  auto entry = externals.getAs<ArrayAttr>(op.sym_name());
+  if (!entry || entry.size() != 3)
+    return ArrayAttr();
+  return entry;
+}
+
+bool hasGlobalData(memref::GlobalOp op) {
+  if (auto init_val = op.initial_value())
+    return init_val.getValue().isa<DenseElementsAttr>();
+  return bool(getExternalData(op));
+}
+
+Type getGlobalDeclType(memref::GlobalOp op) {
+  auto type = op.type().cast<ShapedType>().getElementType();
+  if (auto fixedAttr = op->getAttrOfType<TypeAttr>("fixed_type")) {
+    unsigned width = 0;
+    if (auto fixedType = fixedAttr.getValue().dyn_cast<hcl::FixedType>())
+      width = fixedType.getWidth();
+    else if (auto ufixedType =
+                 fixedAttr.getValue().dyn_cast<hcl::UFixedType>())
+      width = ufixedType.getWidth();
+    if (width && width <= 53)
+      return fixedAttr.getValue();
+  }
+  if (op->hasAttr("unsigned") && type.isa<IntegerType>() &&
+      !type.isInteger(1))
+    return IntegerType::get(type.getContext(), type.getIntOrFloatBitWidth(),
+                            IntegerType::Unsigned);
+  return type;
+}
+
+void HCLEmitterBase::emitGlobalInitializer(memref::GlobalOp op) {
+  auto arrayType = op.type().cast<ShapedType>();
+  auto type = arrayType.getElementType();
+  int64_t numElements = arrayType.getNumElements();
+  if (!type.isF32() && !type.isF64() && !type.isIntOrIndex()) {
+    emitError(op, "array has unsupported element type.");
+    return;
+  }
+
+  // The elements are read from the raw data, where an element of iN or fN
+  // takes ceil(N / 8) bytes in the byte order of the host, which is assumed
+  // to be little-endian. i1 is bit-packed, so i1, index and integers wider
+  // than 64 bits are read as APInts.
+  unsigned width = type.isIntOrFloat() ? type.getIntOrFloatBitWidth() : 64;
+  unsigned elementBytes = 0;
+  if (type.isIntOrFloat() && width > 1 && width <= 64)
+    elementBytes = (width + 7) / 8;
+  DenseElementsAttr denseAttr;
+  std::unique_ptr<llvm::MemoryBuffer> externalData;
+  const char *data = nullptr;
+  bool isSplat = false;
+  if (auto init_val = op.initial_value()) {
+    denseAttr = init_val.getValue().dyn_cast<DenseElementsAttr>();
+    if (!denseAttr) {
+      emitError(op, "has unsupported initial value.");
+      return;
+    }
+    if (elementBytes) {
+      data = denseAttr.getRawData().data();
+      isSplat = denseAttr.isSplat();
+    }
+  } else if (auto entry = getExternalData(op)) {
+    // A global created from a memory-mapped file. The file region is mapped
+    // instead of copied.
+    auto path = entry[0].cast<StringAttr>().getValue();
+    uint64_t offset = entry[1].cast<IntegerAttr>().getInt();
+    if (!elementBytes) {
+      emitError(op, "array has unsupported element type.");
+      return;
+    }
+    auto buffer = llvm::MemoryBuffer::getFileSlice(
+        path, numElements * elementBytes, offset);
+    if (!buffer) {
+      emitError(op, "cannot read external data: ")
+          << buffer.getError().message();
+      return;
+    }
+    externalData = std::move(*buffer);
+    data = externalData->getBufferStart();
+  } else {
+    emitError(op, "has no initial value.");
+    return;
+  }
+
+  Type declType = getGlobalDeclType(op);
+  bool isUnsigned = op->hasAttr("unsigned");
+  bool isFixed = false, isFixedSigned = true;
+  unsigned fixedFrac = 0;
+  if (auto fixedType = declType.dyn_cast<hcl::FixedType>()) {
+    isFixed = true;
+    fixedFrac = fixedType.getFrac();
+  } else if (auto ufixedType = declType.dyn_cast<hcl::UFixedType>()) {
+    isFixed = true;
+    isFixedSigned = false;
+    fixedFrac = ufixedType.getFrac();
+  }
+
+  auto printFloat = [](raw_ostream &out, double value) {
+    if (std::isfinite(value))
+      out << value;
+    else if (value > 0)
+      out << "INFINITY";
+    else
+      out << "-INFINITY";
+  };
+  auto printElement = [&](raw_ostream &out, int64_t i) {
+    if (!data) {
+      auto value = *(denseAttr.value_begin<APInt>() + i);
+      value.print(out, !isUnsigned && !type.isInteger(1));
+      return;
+    }
+    const char *element = data + (isSplat ? 0 : i * elementBytes);
+    if (type.isF32()) {
+      float value;
+      std::memcpy(&value, element, sizeof(value));
+      printFloat(out, value);
+    } else if (type.isF64()) {
+      double value;
+      std::memcpy(&value, element, sizeof(value));
+      printFloat(out, value);
+    } else {
+      uint64_t raw = 0;
+      std::memcpy(&raw, element, elementBytes);
+      uint64_t zext = raw & llvm::maskTrailingOnes<uint64_t>(width);
+      int64_t sext = llvm::SignExtend64(raw, width);
+      if (isFixed) {
+        double real = isFixedSigned ? (double)sext : (double)zext;
+        out << llvm::format("%.*f", (int)fixedFrac,
+                            std::ldexp(real, -(int)fixedFrac));
+      } else if (isUnsigned)
+        out << zext;
+      else
+        out << sext;
+    }
+  };
+  auto printElements = [&](raw_ostream &out) {
+    for (int64_t i = 0; i < numElements; ++i) {
+      if (i)
+        out << ", ";
+      printElement(out, i);
+    }
+  };
+
+  uint64_t threshold = state.options.sidecarThreshold;
+  uint64_t size = numElements * std::max(elementBytes, 1u);
+  if (!threshold || size < threshold) {
+    os << "{";
+    printElements(os);
+    os << "}";
+    return;
+  }
+
+  // Large globals are written to a sidecar file, which keeps the generated
+  // code small.
+  SmallString<128> path(state.options.sidecarDir);
+  llvm::sys::path::append(path, op.sym_name() + ".dat");
+  std::error_code ec;
+  llvm::raw_fd_ostream file(path, ec, llvm::sys::fs::OF_Text);
+  if (ec) {
+    emitError(op, "cannot write sidecar file: ") << ec.message();
+    return;
+  }
+  printElements(file);
+  file << "\n";
+  os << "{\n#include \"" << op.sym_name() << ".dat\"\n}";
+}
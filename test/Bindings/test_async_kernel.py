@@ -0,0 +1,84 @@
+# RUN: %PYTHON %s
+
+import asyncio
+import os
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.kernels import KernelPool, KernelExecutor
+
+code = """
+module {
+    func.func @top(%A: memref<64x64xf32>, %B: memref<64x64xf32>) -> memref<64x64xf32> attributes {llvm.emit_c_interface, top} {
+        %C = memref.alloc() : memref<64x64xf32>
+        %zero = arith.constant 0.0 : f32
+        affine.for %i = 0 to 64 {
+            affine.for %j = 0 to 64 {
+                affine.store %zero, %C[%i, %j] : memref<64x64xf32>
+                affine.for %k = 0 to 64 {
+                    %a = affine.load %A[%i, %k] : memref<64x64xf32>
+                    %b = affine.load %B[%k, %j] : memref<64x64xf32>
+                    %c = affine.load %C[%i, %j] : memref<64x64xf32>
+                    %prod = arith.mulf %a, %b : f32
+                    %sum = arith.addf %prod, %c : f32
+                    affine.store %sum, %C[%i, %j] : memref<64x64xf32>
+                } {loop_name = "k"}
+            } {loop_name = "j"}
+        } {loop_name = "i", op_name = "s"}
+        return %C : memref<64x64xf32>
+    }
+}
+"""
+
+
+def test_async_kernel(num_calls=200):
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        kernel = KernelPool().get_numpy_kernel(Module.parse(code))
+
+    A = np.random.rand(num_calls, 64, 64).astype(np.float32)
+    B = np.random.rand(num_calls, 64, 64).astype(np.float32)
+    expected = A @ B
+
+    start = time.perf_counter()
+    for i in range(num_calls):
+        assert np.allclose(kernel(A[i], B[i]), expected[i], rtol=1e-4)
+    t_sync = time.perf_counter() - start
+
+    # a small queue makes the submitting thread wait for the workers
+    num_workers = min(4, os.cpu_count() or 1)
+    with KernelExecutor(num_workers=num_workers, max_pending=4) as executor:
+        start = time.perf_counter()
+        futures = [kernel.submit(A[i], B[i], executor=executor)
+                   for i in range(num_calls)]
+        for i, future in enumerate(futures):
+            assert np.allclose(future.result(), expected[i], rtol=1e-4)
+        t_futures = time.perf_counter() - start
+
+        async def run_all():
+            return await asyncio.gather(*[
+                kernel.run_async(A[i], B[i], executor=executor)
+                for i in range(num_calls)])
+
+        start = time.perf_counter()
+        results = asyncio.run(run_all())
+        t_async = time.perf_counter() - start
+        for i, result in enumerate(results):
+            assert np.allclose(result, expected[i], rtol=1e-4)
+
+        # errors are raised by the future, not by the worker
+        future = executor.submit(kernel, A[0].T, B[0])
+        assert future.exception() is not None
+        stats = executor.statistics()
+        assert stats["completed"] == 2 * num_calls
+        assert stats["failed"] == 1
+
+    print("sync {:.3f}s, futures {:.3f}s, asyncio {:.3f}s with {} workers".format(
+        t_sync, t_futures, t_async, num_workers))
+    print("Done async kernel test")
+
+
+if __name__ == "__main__":
+    test_async_kernel()
@@ -0,0 +1,67 @@
+# RUN: %PYTHON %s
+
+import os
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.kernels import KernelPool
+
+code = """
+module {
+    func.func @top(%A: memref<64xf32>, %s: f32) -> memref<64xf32> attributes {llvm.emit_c_interface, top} {
+        %B = memref.alloc() : memref<64xf32>
+        affine.for %i = 0 to 64 {
+            %a = affine.load %A[%i] : memref<64xf32>
+            %b = arith.mulf %a, %a : f32
+            %c = arith.addf %b, %s : f32
+            affine.store %c, %B[%i] : memref<64xf32>
+        } {loop_name = "i"}
+        return %B : memref<64xf32>
+    }
+}
+"""
+
+
+def test_batch_kernel(batch_size=20000):
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        kernel = KernelPool().get_numpy_kernel(Module.parse(code))
+
+    A = np.random.rand(batch_size, 64).astype(np.float32)
+    S = np.random.rand(batch_size).astype(np.float32)
+
+    start = time.perf_counter()
+    expected = np.stack([kernel(A[i], S[i]) for i in range(batch_size)])
+    t_loop = time.perf_counter() - start
+    assert np.allclose(expected, A * A + S[:, None])
+
+    results = {"looped calls": batch_size / t_loop}
+    num_threads = min(4, os.cpu_count() or 1)
+    for threads in sorted({1, num_threads}):
+        out = kernel.batch(A, S, num_threads=threads)
+        assert np.array_equal(out, expected)
+        results["batch, {} threads".format(threads)] = \
+            kernel.batch_statistics["items_per_second"]
+
+    # small chunks are still run by one copy of the kernel per thread
+    copies = []
+    copy = kernel.copy
+    kernel.copy = lambda: copies.append(None) or copy()
+    out = kernel.batch(A, S, num_threads=2, chunk_size=100)
+    del kernel.copy
+    assert np.array_equal(out, expected)
+    assert 1 <= len(copies) <= 2
+
+    # a scalar argument is shared by all items
+    out = kernel.batch(A, 1.0)
+    assert np.allclose(out, A * A + 1.0)
+
+    print(", ".join("{} {:.0f} items/s".format(name, rate)
+          for name, rate in results.items()))
+    print("Done batch kernel test")
+
+
+if __name__ == "__main__":
+    test_batch_kernel()
@@ -0,0 +1,100 @@
+# RUN: %PYTHON %s
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def build_loops(k):
+    # a loop nest of a different size for every variant
+    index = IndexType.get()
+    for i in range(k % 4 + 1):
+        loop = hcl_mlir.make_for(0, k + 1, name="l{}".format(i))
+        hcl_mlir.GlobalInsertionPoint.save(
+            InsertionPoint(loop.body.operations[0]))
+        iv = hcl_mlir.IterVar(loop.induction_variable, name="i")
+        iv + hcl_mlir.ConstantOp(index, k)
+        hcl_mlir.GlobalInsertionPoint.restore()
+
+
+def build_variant(k):
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with hcl_mlir.BuilderContext() as builder:
+            hcl_mlir.enable_build_inplace()
+            with InsertionPoint(module.body):
+
+                @func.FuncOp.from_py_func()
+                def kernel():
+                    hcl_mlir.GlobalInsertionPoint.save(module.body)
+                    hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+                    build_loops(k)
+                    hcl_mlir.GlobalInsertionPoint.restore()
+                    hcl_mlir.GlobalInsertionPoint.restore()
+
+            assert hcl_mlir.get_builder() is builder
+        assert module.operation.verify()
+        return str(module)
+
+
+def test_builder_context(num_variants=32):
+    expected = [build_variant(k) for k in range(num_variants)]
+    # the default builder is not changed by the scoped builders
+    assert not hcl_mlir.is_build_inplace()
+
+    # concurrent builds in a thread pool
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(build_variant, range(num_variants)))
+    assert results == expected
+
+    # builds in asyncio tasks
+    async def build_task(k):
+        await asyncio.sleep(0)
+        return build_variant(k)
+
+    async def build_all():
+        return await asyncio.gather(
+            *[build_task(k) for k in range(num_variants)])
+
+    assert list(asyncio.run(build_all())) == expected
+
+    # interleaved builds in one thread: every builder keeps its own
+    # insertion point stack while the others are built
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        modules = []
+        builders = []
+        for k in range(4):
+            module = Module.create()
+            builder = hcl_mlir.BuilderContext()
+            with builder, InsertionPoint(module.body):
+                hcl_mlir.enable_build_inplace()
+                kernel = func.FuncOp("kernel", ([], []))
+                block = kernel.add_entry_block()
+                with InsertionPoint(block):
+                    func.ReturnOp([])
+                hcl_mlir.GlobalInsertionPoint.save(module.body)
+                hcl_mlir.GlobalInsertionPoint.save(
+                    InsertionPoint.at_block_terminator(block))
+            modules.append(module)
+            builders.append(builder)
+        for k in range(4):
+            for builder in builders:
+                with builder:
+                    build_loops(k)
+        for module, builder in zip(modules, builders):
+            with builder:
+                hcl_mlir.GlobalInsertionPoint.restore()
+                hcl_mlir.GlobalInsertionPoint.restore()
+            assert module.operation.verify()
+        assert len(set(str(module) for module in modules)) == 1
+    print("Done builder context test")
+
+
+if __name__ == "__main__":
+    test_builder_context()
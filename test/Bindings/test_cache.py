@@ -0,0 +1,130 @@
+# RUN: %PYTHON %s
+
+import tempfile
+import time
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.cache import CompilationCache
+import hcl_mlir
+import hcl_mlir.cache
+
+code = """
+module {
+    func.func @top(%A: memref<64x64xi32>, %B: memref<64x64xi32>, %C: memref<64x64xi32>) {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        %lj = hcl.create_loop_handle %s, "j"
+        affine.for %i = 0 to 64 {
+            affine.for %j = 0 to 64 {
+                affine.for %k = 0 to 64 {
+                    %a = affine.load %A[%i, %k] : memref<64x64xi32>
+                    %b = affine.load %B[%k, %j] : memref<64x64xi32>
+                    %c = affine.load %C[%i, %j] : memref<64x64xi32>
+                    %prod = arith.muli %a, %b : i32
+                    %sum = arith.addi %prod, %c : i32
+                    affine.store %sum, %C[%i, %j] : memref<64x64xi32>
+                } {loop_name = "k"}
+            } {loop_name = "j"}
+        } {loop_name = "i", op_name = "s"}
+        %li0, %li1 = hcl.split (%li, 8)
+        hcl.reorder(%li0, %lj, %li1)
+        return
+    }
+}
+"""
+
+passes = ["loop_transformation", "lower_hcl_to_llvm"]
+
+
+def compile_once(cache):
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        start = time.perf_counter()
+        module = Module.parse(code)
+        transformed = cache.run_passes(Module.parse(code), ["loop_transformation"])
+        hls = cache.emit(transformed, "vhls")
+        lowered = cache.run_passes(module, passes)
+        return str(lowered), hls, time.perf_counter() - start
+
+
+def test_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CompilationCache(tmp)
+        cold_ir, cold_hls, t_cold = compile_once(cache)
+        stats = cache.statistics()
+        assert stats["hits"] == {}
+        assert stats["misses"] == {"mlir": 2, "cpp": 1}
+        assert stats["size"] > 0
+
+        # a new cache object on the same directory, like a restarted job
+        cache = CompilationCache(tmp)
+        warm_ir, warm_hls, t_warm = compile_once(cache)
+        assert warm_ir == cold_ir
+        assert warm_hls == cold_hls
+        assert "void top(" in warm_hls
+        assert cache.statistics()["hits"] == {"mlir": 2, "cpp": 1}
+
+        # the least recently used entries are evicted beyond the budget
+        size = cache.size
+        cache.max_size = size - 1
+        cache.put(cache.key("other"), "mlir", b"module {}")
+        stats = cache.statistics()
+        assert stats["evictions"] >= 1
+        assert stats["size"] <= cache.max_size
+        assert cache.get(cache.key("other"), "mlir") == b"module {}"
+
+        # the options of a pass are part of the key, with their defaults
+        with Context() as ctx:
+            hcl_d.register_dialect(ctx)
+            cache.clear()
+            cache.run_passes(Module.parse(code), passes)
+            cache.run_passes(Module.parse(code), [
+                "loop_transformation", ("lower_hcl_to_llvm", {"num_threads": 1})])
+            assert cache.statistics()["hits"] == {"mlir": 1}
+            cache.run_passes(Module.parse(code), [
+                "loop_transformation", ("lower_hcl_to_llvm", {"num_threads": 4})])
+            assert cache.statistics()["misses"] == {"mlir": 2}
+            try:
+                cache.run_passes(Module.parse(code), [
+                    ("lower_hcl_to_llvm", {"threads": 4})])
+            except hcl_mlir.APIError:
+                pass
+            else:
+                assert False, "an unknown option is accepted"
+
+        # an entry written again replaces its size
+        cache.clear()
+        cache.put(cache.key("same"), "mlir", b"module {}")
+        cache.put(cache.key("same"), "mlir", b"module {\n}")
+        assert cache.size == len(b"module {\n}")
+        assert cache.size == sum(size for _, _, size in cache.entries())
+
+        # the keys of another build of the libraries are different
+        key = cache.key("same")
+        build_id = hcl_mlir.cache.build_id
+        hcl_mlir.cache.build_id = "another build"
+        try:
+            assert cache.key("same") != key
+        finally:
+            hcl_mlir.cache.build_id = build_id
+        assert cache.key("same") == key
+
+        cache.clear()
+        assert cache.statistics()["size"] == 0
+        print("cold {:.3f}s, warm {:.3f}s".format(t_cold, t_warm))
+    print("Done compilation cache test")
+
+
+def test_exports():
+    # only the cache itself is exported to hcl_mlir
+    assert hcl_mlir.CompilationCache is CompilationCache
+    for name in ("CACHE_VERSION", "CACHED_PASSES", "get_module_fingerprint",
+                 "get_build_id", "hashlib", "tempfile"):
+        assert not hasattr(hcl_mlir, name), name
+    print("Done exports test")
+
+
+if __name__ == "__main__":
+    test_cache()
+    test_exports()
@@ -0,0 +1,203 @@
+# RUN: %PYTHON %s
+
+import ctypes
+import io
+import os
+import tempfile
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func, memref
+from hcl_mlir.execution_engine import ExecutionEngine
+from hcl_mlir.runtime import get_ranked_memref_descriptor
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def test_global_storage():
+    # constant globals are stored at the width of their type
+    expected = {
+        "int8": "memref<2x2xi8>",
+        "uint8": "memref<2x2xi8>",
+        "int12": "memref<2x2xi12>",
+        "int24": "memref<2x2xi32>",
+        "int1": "memref<2x2xi8>",
+        "fixed8_4": "memref<2x2xi8>",
+        "ufixed16_8": "memref<2x2xi16>",
+        "fixed20_10": "memref<2x2xi32>",
+    }
+    data = np.array([[1, 0], [1, 1]])
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                # globals go to the module, the get_global ops to the kernel
+                hcl_mlir.GlobalInsertionPoint.save(module.body)
+                hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+                for dtype in expected:
+                    const = hcl_mlir.ConstantOp(dtype, data, name=dtype)
+                    const.build()
+                hcl_mlir.GlobalInsertionPoint.restore()
+                hcl_mlir.GlobalInsertionPoint.restore()
+
+        globals = {
+            op.attributes["sym_name"].value: op
+            for op in module.body.operations
+            if isinstance(op, memref.GlobalOp)
+        }
+        for name, memref_type in expected.items():
+            assert str(globals[name].type) == memref_type, (name, globals[name])
+        assert "unsigned" in globals["uint8"].attributes
+        assert "fixed_type" in globals["fixed8_4"].attributes
+        assert module.operation.verify()
+    print("Done global storage test")
+
+
+def test_dedup():
+    # identical constants share one global, per data type
+    data = np.arange(16).reshape(4, 4)
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                hcl_mlir.GlobalInsertionPoint.save(module.body)
+                hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+                consts = [
+                    hcl_mlir.ConstantOp("int32", data, name="lut_a"),
+                    hcl_mlir.ConstantOp("int32", data.copy(), name="lut_b"),
+                    hcl_mlir.ConstantOp("uint32", data, name="lut_c"),
+                    hcl_mlir.ConstantOp("int32", data + 1, name="lut_d"),
+                ]
+                for const in consts:
+                    const.build()
+                assert [const.name for const in consts] == [
+                    "lut_a", "lut_a", "lut_c", "lut_d"]
+                hcl_mlir.GlobalInsertionPoint.restore()
+                hcl_mlir.GlobalInsertionPoint.restore()
+
+        globals = [
+            op.attributes["sym_name"].value
+            for op in module.body.operations
+            if isinstance(op, memref.GlobalOp)
+        ]
+        assert globals == ["lut_a", "lut_c", "lut_d"], globals
+        assert module.operation.verify()
+    print("Done dedup test")
+
+
+def test_emit_global():
+    mlir_code = """
+    module {
+        memref.global "private" constant @w : memref<4xi8> = dense<[24, -8, 3, 127]> {fixed_type = !hcl.Fixed<8, 4>}
+        memref.global "private" constant @u : memref<4xi8> = dense<[1, -1, 2, 3]> {unsigned}
+        func.func @top(%A: memref<4xi8>) {
+            return
+        }
+    }
+    """
+    ctx = Context()
+    hcl_d.register_dialect(ctx)
+    mod = Module.parse(mlir_code, ctx)
+    buf = io.StringIO()
+    assert hcl_d.emit_vhls(mod, buf)
+    buf.seek(0)
+    hls_code = buf.read()
+    print(hls_code)
+    assert "const ap_fixed<8, 4> w[4] = {1.5000, -0.5000, 0.1875, 7.9375};" in hls_code
+    assert "const uint8_t u[4] = {1, 255, 2, 3};" in hls_code
+    print("Done global emission test")
+
+
+def test_external_data():
+    # memory-mapped constants reference their file instead of copying it
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = np.memmap(
+            os.path.join(tmp, "weights.bin"), dtype=np.float32, mode="w+", shape=(4, 4)
+        )
+        weights[:] = np.arange(16).reshape(4, 4) / 4
+        weights.flush()
+        lut = np.memmap(
+            os.path.join(tmp, "lut.bin"), dtype=np.int16, mode="w+", shape=(4,)
+        )
+        lut[:] = [1, -2, 3, 4]
+        lut.flush()
+
+        with Context() as ctx, Location.unknown():
+            hcl_d.register_dialect(ctx)
+            module = Module.create()
+            with InsertionPoint(module.body):
+
+                @func.FuncOp.from_py_func()
+                def kernel():
+                    hcl_mlir.GlobalInsertionPoint.save(module.body)
+                    hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+                    consts = [
+                        hcl_mlir.ConstantOp("float32", weights, name="weights"),
+                        hcl_mlir.ConstantOp("int16", lut, name="lut"),
+                        # a view of a mapping is copied
+                        hcl_mlir.ConstantOp("float32", weights[1:], name="rows"),
+                    ]
+                    for const in consts:
+                        const.build()
+                    hcl_mlir.GlobalInsertionPoint.restore()
+                    hcl_mlir.GlobalInsertionPoint.restore()
+
+            globals = {
+                op.attributes["sym_name"].value: op
+                for op in module.body.operations
+                if isinstance(op, memref.GlobalOp)
+            }
+            assert "initial_value" not in globals["weights"].attributes
+            assert "initial_value" not in globals["lut"].attributes
+            assert "initial_value" in globals["rows"].attributes
+            external = DictAttr(module.operation.attributes["hcl.external_data"])
+            assert len(external) == 2
+            assert module.operation.verify()
+
+            # the HLS emitter reads the values from the files
+            buf = io.StringIO()
+            assert hcl_d.emit_vhls(module, buf)
+            buf.seek(0)
+            hls_code = buf.read()
+            assert "weights[4][4] = {" in hls_code
+            assert "const int16_t lut[4] = {1, -2, 3, 4};" in hls_code
+
+        # the JIT resolves the globals to the mapped files
+        mlir_code = """
+        module attributes {{hcl.external_data = {{lut = ["{}", 0 : i64, 8 : i64]}}}} {{
+            memref.global constant @lut : memref<4xi16>
+            func.func @top(%out: memref<4xi16>) attributes {{llvm.emit_c_interface}} {{
+                %lut = memref.get_global @lut : memref<4xi16>
+                affine.for %i = 0 to 4 {{
+                    %v = affine.load %lut[%i] : memref<4xi16>
+                    affine.store %v, %out[%i] : memref<4xi16>
+                }}
+                return
+            }}
+        }}
+        """.format(lut.filename)
+        with Context() as ctx:
+            hcl_d.register_dialect(ctx)
+            module = Module.parse(mlir_code)
+            assert hcl_d.lower_hcl_to_llvm(module, ctx)
+            engine = ExecutionEngine(module)
+            hcl_mlir.register_external_constants(engine, module)
+            out = np.zeros(4, dtype=np.int16)
+            out_memref = ctypes.pointer(
+                ctypes.pointer(get_ranked_memref_descriptor(out)))
+            engine.invoke("top", out_memref)
+            assert np.array_equal(out, lut)
+    print("Done external data test")
+
+
+if __name__ == "__main__":
+    test_global_storage()
+    test_dedup()
+    test_emit_global()
+    test_external_data()
@@ -0,0 +1,329 @@
+# RUN: %PYTHON %s
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.kernels import KernelPool, get_numpy_dtype
+import hcl_mlir
+
+# The folded constants are compared with the results of the same
+# expressions on loaded operands, which are not folded but built,
+# lowered and JIT-compiled.
+
+BINARY_OPS = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": lambda a, b: a / b,
+    "rem": lambda a, b: a % b,
+    "shl": lambda a, b: a << b,
+    "shr": lambda a, b: a >> b,
+    "and": lambda a, b: a & b,
+    "or": lambda a, b: a | b,
+    "xor": lambda a, b: a ^ b,
+}
+
+pool = KernelPool(capacity=4)
+
+
+def get_storage_dtype(dtype):
+    if hcl_mlir.is_fixed_type(dtype):
+        # fixed point arguments of the top function are passed as i64
+        return np.dtype(np.int64)
+    if hcl_mlir.is_unsigned_type(dtype):
+        dtype = IntegerType.get_signless(dtype.width)
+    return get_numpy_dtype(dtype)
+
+
+def get_memref_type(size, dtype):
+    if hcl_mlir.is_unsigned_type(dtype):
+        dtype = IntegerType.get_signless(dtype.width)
+    return MemRefType.get((size,), dtype)
+
+
+def to_array(values, dtype):
+    """Store folding values the way the kernel stores them"""
+    np_dtype = get_storage_dtype(dtype)
+    if hcl_mlir.is_floating_point_type(dtype):
+        return np.array(values, dtype=np_dtype)
+    bits = np_dtype.itemsize * 8
+    return np.array([hcl_mlir.wrap_integer(v, bits) for v in values],
+                    dtype=np_dtype)
+
+
+def from_array(array, dtype):
+    """Folding values of the elements of a result array"""
+    if hcl_mlir.is_floating_point_type(dtype):
+        return [float(x) for x in array]
+    return [hcl_mlir.normalize_constant(dtype, int(x))
+            if not hcl_mlir.is_fixed_type(dtype)
+            else hcl_mlir.wrap_integer(int(x), dtype.width,
+                                       hcl_mlir.is_signed_fixed_type(dtype))
+            for x in array]
+
+
+def same_value(lhs, rhs):
+    if isinstance(lhs, float) and lhs != lhs:
+        return rhs != rhs
+    return lhs == rhs
+
+
+def build_kernel(arg_type, num_args, res_type, num_results, make_results):
+    """JIT-compile a top function storing make_results(loads of the
+    first argument) into the second argument"""
+    module = Module.create()
+    hcl_mlir.enable_build_inplace()
+    with InsertionPoint(module.body):
+
+        @func.FuncOp.from_py_func(
+            get_memref_type(num_args, arg_type),
+            get_memref_type(num_results, res_type))
+        def top(A, B):
+            hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+            tA = hcl_mlir.TensorOp((num_args,), A, arg_type, name="A")
+            tB = hcl_mlir.TensorOp((num_results,), B, res_type, name="B")
+            tA.build()
+            tB.build()
+            loads = [tA[i] for i in range(num_args)]
+            for i, result in enumerate(make_results(loads)):
+                tB[i] = result
+            hcl_mlir.GlobalInsertionPoint.restore()
+            return
+
+        top.func_op.attributes["llvm.emit_c_interface"] = UnitAttr.get()
+    hcl_mlir.disable_build_inplace()
+    assert module.operation.verify()
+    return pool.get_numpy_kernel(module, "top")
+
+
+def fold(make_expr, dtype, *vals):
+    """(type, folding value) of make_expr on constants, or None if the
+    expression is not folded"""
+    operands = [
+        hcl_mlir.ConstantOp(dtype, hcl_mlir.get_constant_value(dtype, val))
+        for val in vals
+    ]
+    return hcl_mlir.get_constant(make_expr(*operands))
+
+
+def traps(dtype, lhs, rhs):
+    """A signed division of the operands that would trap the kernel"""
+    if hcl_mlir.is_floating_point_type(dtype):
+        return False
+    if rhs == 0:
+        return True
+    if hcl_mlir.is_fixed_type(dtype):
+        return False
+    width = 64 if hcl_mlir.is_index_type(dtype) else dtype.width
+    return lhs == -(2 ** (width - 1)) and rhs == -1
+
+
+def check_binary_ops(dtype, ops, pairs):
+    kernel = build_kernel(
+        dtype, 2, dtype, len(ops),
+        lambda loads: [BINARY_OPS[op](*loads) for op in ops])
+    num_folded = 0
+    for lhs, rhs in pairs:
+        folded = [fold(BINARY_OPS[op], dtype, lhs, rhs) for op in ops]
+        if any(op in ("div", "rem") for op in ops) and traps(dtype, lhs, rhs):
+            # the division is left to the IR
+            for op, const in zip(ops, folded):
+                if op in ("div", "rem"):
+                    assert const is None, (dtype, op, lhs, rhs)
+            continue
+        A = to_array([lhs, rhs], dtype)
+        B = np.zeros(len(ops), dtype=get_storage_dtype(dtype))
+        kernel(A, B)
+        for op, const, result in zip(ops, folded, from_array(B, dtype)):
+            if const is None:
+                continue
+            assert const[0] == dtype, (dtype, op, const[0])
+            assert same_value(const[1], result), (
+                dtype, op, lhs, rhs, const[1], result)
+            num_folded += 1
+    return num_folded
+
+
+def check_casts(src_type, res_type, values):
+    kernel = build_kernel(
+        src_type, len(values), res_type, len(values),
+        lambda loads: [hcl_mlir.CastOp(load, res_type) for load in loads])
+    A = to_array(values, src_type)
+    B = np.zeros(len(values), dtype=get_storage_dtype(res_type))
+    kernel(A, B)
+    num_folded = 0
+    for val, result in zip(values, from_array(B, res_type)):
+        const = fold(lambda x: hcl_mlir.CastOp(x, res_type), src_type, val)
+        if const is None:
+            continue
+        assert const[0] == res_type, (src_type, res_type, const[0])
+        assert same_value(const[1], result), (
+            src_type, res_type, val, const[1], result)
+        num_folded += 1
+    return num_folded
+
+
+def test_integer_folding():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        for width in (7, 8, 16, 32, 33, 64):
+            dtype = IntegerType.get_signless(width)
+            imin, imax = -(2 ** (width - 1)), 2 ** (width - 1) - 1
+            pairs = [
+                (imax, 1), (imin, 1), (imax, imax), (imin, imin),
+                (imin, -1), (-7, 2), (7, -2), (-7, -2), (5, 0),
+                (1, width - 1), (-1, 3), (3, width), (-1, width + 3),
+            ]
+            assert check_binary_ops(dtype, list(BINARY_OPS), pairs) > 0
+            # wraparound
+            assert fold(BINARY_OPS["add"], dtype, imax, 1)[1] == imin
+            assert fold(BINARY_OPS["mul"], dtype, imin, -1)[1] == imin
+            # divsi and remsi truncate towards zero
+            assert fold(BINARY_OPS["div"], dtype, -7, 2)[1] == -3
+            assert fold(BINARY_OPS["rem"], dtype, -7, 2)[1] == -1
+            assert fold(BINARY_OPS["rem"], dtype, 7, -2)[1] == 1
+            # INT_MIN / -1, division by zero and shifts by the width or
+            # more are undefined
+            assert fold(BINARY_OPS["div"], dtype, imin, -1) is None
+            assert fold(BINARY_OPS["rem"], dtype, imin, -1) is None
+            assert fold(BINARY_OPS["div"], dtype, 5, 0) is None
+            assert fold(BINARY_OPS["shl"], dtype, 1, width) is None
+            assert fold(BINARY_OPS["shr"], dtype, -1, width + 3) is None
+            # arith.shrui is a logical shift
+            assert fold(BINARY_OPS["shr"], dtype, -1, width - 1)[1] == 1
+
+        index = IndexType.get()
+        pairs = [(2 ** 63 - 1, 1), (-(2 ** 63), -1), (-9, 4), (9, 0), (1, 63)]
+        assert check_binary_ops(index, list(BINARY_OPS), pairs) > 0
+    print("Done integer folding test")
+
+
+def test_unsigned_folding():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        ops = ["add", "sub", "mul", "shl", "shr", "and", "or", "xor"]
+        for width in (8, 33, 64):
+            dtype = IntegerType.get_unsigned(width)
+            umax = 2 ** width - 1
+            high = 2 ** (width - 1)
+            pairs = [
+                (umax, 1), (high + 5, high), (umax, umax), (0, 1),
+                (high, 1), (high + 3, width - 1), (umax, width),
+            ]
+            assert check_binary_ops(dtype, ops, pairs) > 0
+            assert fold(BINARY_OPS["add"], dtype, umax, 1)[1] == 0
+            assert fold(BINARY_OPS["add"], dtype, high + 5, high)[1] == 5
+            assert fold(BINARY_OPS["shr"], dtype, high, 1)[1] == high >> 1
+            # unsigned division is not folded
+            assert fold(BINARY_OPS["div"], dtype, umax, 3) is None
+            assert fold(BINARY_OPS["rem"], dtype, umax, 3) is None
+    print("Done unsigned folding test")
+
+
+def test_float_folding():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        ops = ["add", "sub", "mul", "div", "rem"]
+        pairs = [
+            (1.5, 0.1), (-7.25, 2.0), (7.25, -2.0), (3.4e38, 10.0),
+            (1e-30, 1e-30), (5.0, 0.0), (1.0, 3.0),
+        ]
+        for dtype in (F32Type.get(), F64Type.get()):
+            assert check_binary_ops(dtype, ops, pairs) > 0
+            # division by zero is left to the IR
+            assert fold(BINARY_OPS["div"], dtype, 5.0, 0.0) is None
+    print("Done float folding test")
+
+
+def test_fixed_folding():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        ops = ["add", "sub", "mul", "div"]
+        for dtype in (
+            hcl_d.FixedType.get(16, 4),
+            hcl_d.FixedType.get(32, 8),
+            hcl_d.UFixedType.get(12, 6),
+        ):
+            signed = hcl_mlir.is_signed_fixed_type(dtype)
+            emax = 2 ** (dtype.width - 1) - 1 if signed else 2 ** dtype.width - 1
+            emin = -(2 ** (dtype.width - 1)) if signed else 0
+            # encodings: odd products and quotients lose fraction bits
+            pairs = [
+                (3, 8), (5, 3), (emax, 1), (emax, emax), (emin, 3),
+                (7, 0), (2 ** dtype.frac + 1, 3),
+            ]
+            if signed:
+                pairs += [(-3, 8), (-5, 3), (5, -3), (-5, -3), (emin, -16)]
+            assert check_binary_ops(dtype, ops, pairs) > 0
+            assert fold(BINARY_OPS["div"], dtype, 7, 0) is None
+        # the product is shifted right, which rounds towards -inf
+        dtype = hcl_d.FixedType.get(16, 4)
+        assert fold(BINARY_OPS["mul"], dtype, -3, 8)[1] == -2
+        # the quotient is truncated towards zero
+        assert fold(BINARY_OPS["div"], dtype, -5, 3)[1] == -26
+    print("Done fixed point folding test")
+
+
+def test_cast_folding():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        i8 = IntegerType.get_signless(8)
+        i16 = IntegerType.get_signless(16)
+        i32 = IntegerType.get_signless(32)
+        i64 = IntegerType.get_signless(64)
+        ui8 = IntegerType.get_unsigned(8)
+        ui64 = IntegerType.get_unsigned(64)
+        f32 = F32Type.get()
+        f64 = F64Type.get()
+        index = IndexType.get()
+        fixed = hcl_d.FixedType.get(16, 4)
+        ints = [0, 1, -1, 127, -128, 300, -300, 2 ** 31 - 1, -(2 ** 31)]
+        floats = [0.0, 0.5, -0.5, 1.9, -1.9, 127.9, -128.9, 1e10, -1e10,
+                  16777217.0, 3e38, float("inf"), float("nan")]
+        cases = [
+            (i32, i8, ints),
+            (i32, i16, ints),
+            (i8, i32, [0, 1, -1, 127, -128]),
+            (ui8, i32, [0, 1, 127, 128, 255]),
+            (i32, index, ints),
+            (index, i16, ints + [2 ** 40 + 5]),
+            (i32, f32, ints + [16777217]),
+            (i64, f32, [2 ** 40 + 1, -(2 ** 52), 2 ** 53 + 1]),
+            (i64, f64, [2 ** 52 + 1, -(2 ** 53), 2 ** 62]),
+            (ui64, f64, [1, 2 ** 52, 2 ** 63 + 2 ** 11, 2 ** 64 - 1]),
+            (f32, i32, floats),
+            (f64, i8, floats),
+            (f64, f32, floats + [1e-50, 0.1]),
+            (f32, f64, floats),
+            (fixed, f32, [0, 1, -1, 2 ** 15 - 1, -(2 ** 15), 25, -25]),
+            (fixed, i8, [0, 1, -1, 2 ** 15 - 1, -(2 ** 15), 25, -25]),
+        ]
+        for src_type, res_type, values in cases:
+            if hcl_mlir.is_floating_point_type(src_type):
+                values = [hcl_mlir.normalize_constant(src_type, v)
+                          for v in values]
+            elif hcl_mlir.is_fixed_type(src_type):
+                values = [hcl_mlir.wrap_integer(v, src_type.width)
+                          for v in values]
+            else:
+                values = [hcl_mlir.normalize_constant(src_type, v)
+                          for v in values]
+            assert check_casts(src_type, res_type, values) > 0, (
+                src_type, res_type)
+        # out-of-range conversions to integers are poison
+        assert fold(lambda x: hcl_mlir.CastOp(x, i8), f64, 300.0) is None
+        assert fold(lambda x: hcl_mlir.CastOp(x, i32), f32,
+                    float("nan")) is None
+        # CastOp converts unsigned integers with arith.sitofp as well
+        assert fold(lambda x: hcl_mlir.CastOp(x, f64), ui64,
+                    2 ** 64 - 1)[1] == -1.0
+    print("Done cast folding test")
+
+
+if __name__ == "__main__":
+    test_integer_folding()
+    test_unsigned_folding()
+    test_float_folding()
+    test_fixed_folding()
+    test_cast_folding()
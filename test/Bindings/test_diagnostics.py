@@ -0,0 +1,102 @@
+# RUN: %PYTHON %s
+
+import contextlib
+import io
+import time
+import warnings
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def build_casts(num_casts, other_site=False):
+    # every sum casts the index to f32
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                for_i = hcl_mlir.make_for(0, 16, name="i")
+                iv = hcl_mlir.IterVar(for_i.induction_variable, name="i")
+                for k in range(num_casts):
+                    iv + hcl_mlir.ConstantOp("float32", k + 0.5)
+                if other_site:
+                    iv + hcl_mlir.ConstantOp("float32", 0.5)
+
+
+CAST_LINE = 26
+
+
+def test_diagnostics(num_casts=2000):
+    diagnostics = hcl_mlir.diagnostics
+    timings = {}
+    for mode in diagnostics.MODES:
+        diagnostics.set_mode(mode)
+        with warnings.catch_warnings(record=True) as issued:
+            warnings.simplefilter("always")
+            start = time.perf_counter()
+            build_casts(num_casts)
+            timings[mode] = time.perf_counter() - start
+        if mode == "always":
+            assert len(issued) == num_casts, len(issued)
+        elif mode == "aggregate":
+            # one warning per call site and cast kind
+            assert len(issued) == 1, len(issued)
+            summary = diagnostics.summary()
+            assert len(summary) == 1
+            category, message, count, (filename, lineno) = summary[0]
+            assert category is hcl_mlir.DTypeWarning
+            assert count == num_casts
+            # the call site is the line of the design, not of the builder
+            assert filename == __file__ and lineno == CAST_LINE
+            out = io.StringIO()
+            diagnostics.report(out)
+            assert "{} x DTypeWarning at {}:{}".format(
+                num_casts, __file__, CAST_LINE) in out.getvalue()
+            assert not diagnostics.summary()
+        else:
+            assert not issued
+            assert not diagnostics.summary()
+    diagnostics.set_mode("aggregate")
+
+    # the same cast at another line of the design is another entry
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        build_casts(3, other_site=True)
+    counts = sorted(count for _, _, count, _ in diagnostics.summary())
+    assert counts == [1, 3], counts
+    diagnostics.clear()
+    print(", ".join("{} {:.3f}s".format(mode, t)
+          for mode, t in timings.items()))
+    print("Done diagnostics test")
+
+
+def test_builder_diagnostics(num_casts=100):
+    # each builder aggregates its own warnings and reports them when it
+    # is left
+    default = hcl_mlir.get_builder().diagnostics
+    default.clear()
+    err = io.StringIO()
+    with contextlib.redirect_stderr(err), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        with hcl_mlir.BuilderContext() as builder:
+            build_casts(num_casts)
+            assert hcl_mlir.diagnostics.summary()[0][2] == num_casts
+            with hcl_mlir.BuilderContext():
+                assert not hcl_mlir.diagnostics.summary()
+                build_casts(1)
+            assert "1 x DTypeWarning" in err.getvalue()
+            assert builder.diagnostics.summary()[0][2] == num_casts
+        assert "{} x DTypeWarning".format(num_casts) in err.getvalue()
+        assert not builder.diagnostics.summary()
+    assert not default.summary()
+    print("Done builder diagnostics test")
+
+
+if __name__ == "__main__":
+    test_diagnostics()
+    test_builder_diagnostics()
@@ -0,0 +1,99 @@
+# RUN: %PYTHON %s
+
+import json
+import os
+import tempfile
+import time
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+
+
+def make_code(num_funcs):
+    funcs = []
+    for i in range(num_funcs):
+        funcs.append(
+            """
+        func.func @kernel{0}(%A: memref<64x64xi32>, %B: memref<64x64xi32>, %C: memref<64x64xi32>) {{
+            affine.for %i = 0 to 64 {{
+                affine.for %j = 0 to 64 {{
+                    affine.for %k = 0 to 64 {{
+                        %a = affine.load %A[%i, %k] : memref<64x64xi32>
+                        %b = affine.load %B[%k, %j] : memref<64x64xi32>
+                        %c = affine.load %C[%i, %j] : memref<64x64xi32>
+                        %prod = arith.muli %a, %b : i32
+                        %sum = arith.addi %prod, %c : i32
+                        affine.store %sum, %C[%i, %j] : memref<64x64xi32>
+                    }} {{loop_name = "k"}}
+                }} {{loop_name = "j"}}
+            }} {{loop_name = "i", op_name = "S{0}"}}
+            return
+        }}""".format(i)
+        )
+    return "module {" + "".join(funcs) + "\n}"
+
+
+def test_emit_files(num_funcs=256):
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        module = Module.parse(make_code(num_funcs))
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            assert hcl_d.emit_vhls(module, os.path.join(tmp, "kernel.cpp"))
+            t_single = time.perf_counter() - start
+
+            out_dir = os.path.join(tmp, "split")
+            start = time.perf_counter()
+            files = hcl_d.emit_vhls_files(module, out_dir)
+            t_split = time.perf_counter() - start
+
+            assert files[0] == os.path.join(out_dir, "kernel.h")
+            assert len(files) == num_funcs + 1
+            with open(files[0], "r") as f:
+                header = f.read()
+            for i in range(num_funcs):
+                assert "void kernel{}(".format(i) in header
+                path = os.path.join(out_dir, "kernel{}.cpp".format(i))
+                assert path == files[i + 1]
+                with open(path, "r") as f:
+                    code = f.read()
+                assert code.startswith('#include "kernel.h"')
+                assert "void kernel{}(".format(i) in code
+                assert "l_S{}_i".format(i) in code
+
+            # emitting again overwrites the files
+            assert hcl_d.emit_vhls_files(module, out_dir) == files
+
+            # an incremental emission only rewrites the changed functions
+            unchanged = Module.parse(make_code(num_funcs))
+            start = time.perf_counter()
+            assert hcl_d.emit_vhls_files(
+                unchanged, out_dir, incremental=True) == []
+            t_incremental = time.perf_counter() - start
+            changed = Module.parse(make_code(num_funcs).replace(
+                "@kernel7(", "@kernel7(%D: memref<64x64xi32>, "))
+            assert hcl_d.emit_vhls_files(changed, out_dir, incremental=True) == [
+                files[0], os.path.join(out_dir, "kernel7.cpp")]
+            with open(os.path.join(out_dir, "manifest.json"), "r") as f:
+                manifest = json.load(f)
+            assert len(manifest) == num_funcs + 1
+
+            # the emitter makes the unsigned ports unsigned in place, which
+            # does not change the fingerprints of the module emitted again
+            unsigned = Module.parse(make_code(num_funcs).replace(
+                "@kernel3(%A: memref<64x64xi32>, %B: memref<64x64xi32>, "
+                "%C: memref<64x64xi32>) {",
+                "@kernel3(%A: memref<64x64xi32>, %B: memref<64x64xi32>, "
+                "%C: memref<64x64xi32>) attributes {itypes = \"uuu\"} {"))
+            assert hcl_d.emit_vhls_files(unsigned, out_dir, incremental=True)
+            assert "ui32" in str(unsigned)
+            assert hcl_d.emit_vhls_files(
+                unsigned, out_dir, incremental=True) == []
+        print("emit {} functions: single file {:.3f}s, split {:.3f}s, "
+              "unchanged {:.3f}s".format(
+                  num_funcs, t_single, t_split, t_incremental))
+    print("Done split emission test")
+
+
+if __name__ == "__main__":
+    test_emit_files()
@@ -0,0 +1,87 @@
+# RUN: %PYTHON %s
+
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def build_module(size):
+    # the code of a large constant array is emitted in many small fragments
+    module = Module.create()
+    with InsertionPoint(module.body):
+
+        @func.FuncOp.from_py_func()
+        def kernel():
+            hcl_mlir.GlobalInsertionPoint.save(module.body)
+            hcl_mlir.GlobalInsertionPoint.save(InsertionPoint.current)
+            data = np.arange(size, dtype=np.int64).reshape(-1, 64) % 1000
+            hcl_mlir.ConstantOp("int32", data, name="lut").build()
+            hcl_mlir.GlobalInsertionPoint.restore()
+            hcl_mlir.GlobalInsertionPoint.restore()
+
+    return module
+
+
+def throughput(emit, num_bytes, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        emit()
+        best = min(best, time.perf_counter() - start)
+    return num_bytes / best / 1e6
+
+
+def test_emit_throughput(size=1 << 20):
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = build_module(size)
+
+        code = hcl_d.emit_vhls_str(module)
+        assert "lut[16384][64]" in code
+        num_bytes = len(code.encode())
+
+        buf = io.StringIO()
+        assert hcl_d.emit_vhls(module, buf)
+        assert buf.getvalue() == code
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "kernel.cpp")
+            assert hcl_d.emit_vhls(module, path)
+            with open(path, "r") as f:
+                assert f.read() == code
+            with open(path, "wb") as f:
+                assert hcl_d.emit_vhls(module, f)
+            with open(path, "r") as f:
+                assert f.read() == code
+
+            results = {
+                "file object": throughput(
+                    lambda: hcl_d.emit_vhls(module, io.StringIO()), num_bytes),
+                "str": throughput(lambda: hcl_d.emit_vhls_str(module), num_bytes),
+                "path": throughput(
+                    lambda: hcl_d.emit_vhls(module, path), num_bytes),
+            }
+
+            # the table goes to a sidecar file next to the code
+            assert hcl_d.emit_vhls(module, path, sidecar_threshold=1 << 16)
+            with open(path, "r") as f:
+                assert '#include "lut.dat"' in f.read()
+            assert os.path.exists(os.path.join(tmp, "lut.dat"))
+            results["path with sidecar"] = throughput(
+                lambda: hcl_d.emit_vhls(module, path, sidecar_threshold=1 << 16),
+                num_bytes,
+            )
+        print("emit {:.1f} MB: ".format(num_bytes / 1e6) + ", ".join(
+            "{} {:.1f} MB/s".format(name, mbps) for name, mbps in results.items()))
+    print("Done emission throughput test")
+
+
+if __name__ == "__main__":
+    test_emit_throughput()
@@ -0,0 +1,186 @@
+# RUN: %PYTHON %s
+
+import resource
+import subprocess
+import sys
+import time
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def make_expr(iv, num_ops):
+    # metaprogrammed chain of scalar ops, every intermediate value is kept
+    expr = iv
+    for k in range(num_ops // 2):
+        expr = expr * (k % 7 + 2) + iv
+    return expr
+
+
+def build_kernel(num_ops, compact, inplace=False):
+    """Build num_ops scalar ops, return the build time, the op names
+    and the module"""
+    if compact:
+        hcl_mlir.enable_compact_graph()
+    else:
+        hcl_mlir.disable_compact_graph()
+    if inplace:
+        hcl_mlir.enable_build_inplace()
+    hcl_mlir.finish_build()
+    stats = {}
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                for_i = hcl_mlir.make_for(0, 16, name="i")
+                ip = InsertionPoint(for_i.body.operations[0])
+                hcl_mlir.GlobalInsertionPoint.save(ip)
+                iv = hcl_mlir.IterVar(for_i.induction_variable, name="i")
+                start = time.perf_counter()
+                expr = make_expr(iv, num_ops)
+                hcl_mlir.ASTVisitor(mode="build").visit(expr)
+                stats["elapsed"] = time.perf_counter() - start
+                hcl_mlir.GlobalInsertionPoint.restore()
+                stats["ops"] = sorted(
+                    op.operation.name for op in for_i.body.operations)
+
+        assert module.operation.verify()
+        stats["module"] = str(module)
+    hcl_mlir.disable_compact_graph()
+    hcl_mlir.disable_build_inplace()
+    hcl_mlir.finish_build()
+    return stats["elapsed"], stats["ops"], stats["module"]
+
+
+def test_same_ops():
+    # both representations build the same ops
+    _, ops, _ = build_kernel(40, compact=False)
+    _, compact_ops, _ = build_kernel(40, compact=True)
+    assert ops == compact_ops, (ops, compact_ops)
+    # and in place, the same IR
+    _, _, module = build_kernel(40, compact=False, inplace=True)
+    _, _, compact_module = build_kernel(40, compact=True, inplace=True)
+    assert module == compact_module, (module, compact_module)
+    print("Done same ops test")
+
+
+def test_finish():
+    # the graph refers to the ops of one module, it is dropped with it
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with hcl_mlir.BuilderContext() as builder:
+            hcl_mlir.enable_compact_graph()
+            hcl_mlir.enable_build_inplace()
+            with InsertionPoint(module.body):
+
+                @func.FuncOp.from_py_func()
+                def kernel():
+                    for_i = hcl_mlir.make_for(0, 16, name="i")
+                    hcl_mlir.GlobalInsertionPoint.save(
+                        InsertionPoint(for_i.body.operations[0]))
+                    iv = hcl_mlir.IterVar(for_i.induction_variable, name="i")
+                    make_expr(iv, 10)
+                    hcl_mlir.GlobalInsertionPoint.restore()
+
+            assert len(builder.expr_graph) > 0
+        assert len(builder.expr_graph) == 0
+        assert not builder.expr_graph.externals
+        assert not builder.expr_graph.built_ops
+    print("Done finish test")
+
+
+def count_ops(module, name):
+    return str(module).count(" = {} ".format(name))
+
+
+def test_shared_remove():
+    # a node shared by two expressions stays until both are removed
+    handles = []
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with hcl_mlir.BuilderContext():
+            hcl_mlir.enable_compact_graph()
+            hcl_mlir.enable_build_inplace()
+            with InsertionPoint(module.body):
+
+                @func.FuncOp.from_py_func()
+                def kernel():
+                    for_i = hcl_mlir.make_for(0, 16, name="i")
+                    hcl_mlir.GlobalInsertionPoint.save(
+                        InsertionPoint(for_i.body.operations[0]))
+                    iv = hcl_mlir.IterVar(for_i.induction_variable, name="i")
+                    shared = iv * 3
+                    lhs = shared + 1
+                    rhs = shared + 2
+                    assert count_ops(module, "arith.muli") == 1
+                    assert count_ops(module, "arith.addi") == 2
+
+                    hcl_mlir.ASTVisitor(mode="remove").visit(lhs)
+                    assert count_ops(module, "arith.muli") == 1
+                    assert count_ops(module, "arith.addi") == 1
+                    assert module.operation.verify()
+
+                    hcl_mlir.ASTVisitor(mode="remove").visit(rhs)
+                    assert count_ops(module, "arith.muli") == 0
+                    assert count_ops(module, "arith.addi") == 0
+                    hcl_mlir.GlobalInsertionPoint.restore()
+                    handles.append(shared)
+
+            hcl_mlir.disable_compact_graph()
+            hcl_mlir.disable_build_inplace()
+        assert module.operation.verify()
+
+        # the handles of a finished build are invalid, as their node ids
+        # are reused
+        try:
+            handles[0].dtype
+        except hcl_mlir.APIError:
+            pass
+        else:
+            assert False, "a stale handle is accepted"
+    print("Done shared remove test")
+
+
+def run_child(num_ops, mode):
+    # peak RSS is per process, so each representation runs in its own
+    elapsed, _, _ = build_kernel(
+        num_ops, compact=mode.startswith("graph"),
+        inplace=mode.endswith("inplace"))
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(elapsed, peak_rss)
+
+
+def test_benchmark(num_ops=200000):
+    results = {}
+    for mode in ("classes", "graph", "classes-inplace", "graph-inplace"):
+        out = subprocess.run(
+            [sys.executable, __file__, mode, str(num_ops)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        results[mode] = (float(out[-2]), int(out[-1]))
+    for mode, (elapsed, peak_rss) in results.items():
+        print("{} {} ops: build {:.3f}s, peak RSS {:.1f} MB".format(
+            mode, num_ops, elapsed, peak_rss / 1024))
+    for suffix in ("", "-inplace"):
+        print("peak RSS ratio (classes{0} / graph{0}): {1:.2f}x".format(
+            suffix,
+            results["classes" + suffix][1] / results["graph" + suffix][1]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_child(int(sys.argv[2]), sys.argv[1])
+    else:
+        test_same_ops()
+        test_finish()
+        test_shared_remove()
+        test_benchmark()
@@ -0,0 +1,109 @@
+# RUN: %PYTHON %s
+
+import math
+import time
+from fractions import Fraction
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def quantize_vectorize(val, dtype):
+    # the np.vectorize quantization previously used by ConstantOp.build
+    sb = 1 << dtype.width
+    val = np.fix(val * (2 ** dtype.frac)) % sb
+    if hcl_mlir.is_signed_fixed_type(dtype):
+        sb_limit = 1 << (dtype.width - 1)
+        val = np.vectorize(lambda x: x if x < sb_limit else x - sb)(val)
+    return np.array(val, dtype=np.int64)
+
+
+def quantize_reference(x, dtype, rounding, overflow):
+    # exact per-element quantization with Python integers
+    width = dtype.width
+    signed = hcl_mlir.is_signed_fixed_type(dtype)
+    if signed:
+        lower, upper = -(1 << (width - 1)), (1 << (width - 1)) - 1
+    else:
+        lower, upper = 0, (1 << width) - 1
+    if math.isinf(x) and overflow == "saturate":
+        q = upper if x > 0 else lower
+    elif not math.isfinite(x):
+        q = 0
+    else:
+        scaled = Fraction(x) * 2 ** dtype.frac
+        q = math.trunc(scaled)
+        if rounding == "round" and abs(scaled - q) >= Fraction(1, 2):
+            q += 1 if scaled > 0 else -1
+        if overflow == "saturate":
+            q = max(lower, min(upper, q))
+        else:
+            q = hcl_mlir.wrap_integer(q, width, signed)
+    return hcl_mlir.wrap_integer(q, 64)
+
+
+def test_quantize():
+    rng = np.random.default_rng(0)
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        for width, frac, signed in [
+            (8, 4, True),
+            (8, 4, False),
+            (16, 8, True),
+            (32, 16, False),
+            (12, 0, True),
+            (63, 5, True),
+            (64, 10, True),
+            (64, 3, False),
+        ]:
+            if signed:
+                dtype = hcl_d.FixedType.get(width, frac)
+            else:
+                dtype = hcl_d.UFixedType.get(width, frac)
+            ulp = 2.0 ** -frac
+            data = np.concatenate([
+                rng.normal(0, 2.0 ** (width - frac), 2000),
+                rng.uniform(-4, 4, 2000),
+                [0.5 * ulp, -0.5 * ulp, 2.5 * ulp, -2.5 * ulp],
+                [np.inf, -np.inf, np.nan, 1e300, -1e300],
+            ])
+            for rounding in hcl_mlir.FIXED_ROUNDING_MODES:
+                for overflow in hcl_mlir.FIXED_OVERFLOW_MODES:
+                    res = hcl_mlir.quantize_fixed(
+                        data, dtype, rounding, overflow)
+                    ref = [
+                        quantize_reference(float(x), dtype, rounding, overflow)
+                        for x in data
+                    ]
+                    assert (res == np.array(ref, dtype=np.int64)).all(), (
+                        dtype, rounding, overflow)
+            # truncate and wrap is the previous quantization
+            if width <= 32:
+                data = rng.normal(0, 2.0 ** (width - frac), 5000)
+                assert (
+                    hcl_mlir.quantize_fixed(data, dtype)
+                    == quantize_vectorize(data, dtype)
+                ).all(), dtype
+    print("Done quantize test")
+
+
+def test_quantize_speed(size=1000000):
+    data = np.random.default_rng(1).normal(0, 100, size)
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        dtype = hcl_d.FixedType.get(16, 8)
+        start = time.perf_counter()
+        hcl_mlir.quantize_fixed(data, dtype)
+        t_new = time.perf_counter() - start
+        start = time.perf_counter()
+        quantize_vectorize(data, dtype)
+        t_old = time.perf_counter() - start
+    print("quantize {} elements: np.vectorize {:.3f}s, vectorized {:.3f}s".format(
+        size, t_old, t_new))
+
+
+if __name__ == "__main__":
+    test_quantize()
+    test_quantize_speed()
@@ -0,0 +1,111 @@
+# RUN: %PYTHON %s
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+
+
+def make_code(num_funcs):
+    funcs = []
+    for i in range(num_funcs):
+        funcs.append(
+            """
+        func.func @top{0}(%A: memref<64x64xi32>, %B: memref<64x64xi32>, %C: memref<64x64xi32>) {{
+            affine.for %i = 0 to 64 {{
+                affine.for %j = 0 to 64 {{
+                    affine.for %k = 0 to 64 {{
+                        %a = affine.load %A[%i, %k] : memref<64x64xi32>
+                        %b = affine.load %B[%k, %j] : memref<64x64xi32>
+                        %c = affine.load %C[%i, %j] : memref<64x64xi32>
+                        %prod = arith.muli %a, %b : i32
+                        %sum = arith.addi %prod, %c : i32
+                        affine.store %sum, %C[%i, %j] : memref<64x64xi32>
+                    }} {{loop_name = "k"}}
+                }} {{loop_name = "j"}}
+            }} {{loop_name = "i", op_name = "S{0}"}}
+            return
+        }}""".format(i)
+        )
+    return "module {" + "".join(funcs) + "\n}"
+
+
+def parse_modules(code, num_modules):
+    modules = []
+    for _ in range(num_modules):
+        ctx = Context()
+        # one thread per module, so that the speedup comes from the
+        # Python threads
+        ctx.enable_multithreading(False)
+        hcl_d.register_dialect(ctx)
+        modules.append((ctx, Module.parse(code, ctx)))
+    return modules
+
+
+def lower(item):
+    ctx, module = item
+    assert hcl_d.lower_hcl_to_llvm(module, ctx)
+    return module
+
+
+def test_gil_release(num_modules=8, num_funcs=64):
+    code = make_code(num_funcs)
+    num_workers = min(num_modules, os.cpu_count() or 1)
+
+    modules = parse_modules(code, num_modules)
+    start = time.perf_counter()
+    expected = [str(module) for module in map(lower, modules)]
+    t_seq = time.perf_counter() - start
+
+    modules = parse_modules(code, num_modules)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        results = [str(module) for module in pool.map(lower, modules)]
+    t_par = time.perf_counter() - start
+
+    assert results == expected
+    print("lower {} modules: sequential {:.3f}s, {} threads {:.3f}s, speedup {:.2f}x".format(
+        num_modules, t_seq, num_workers, t_par, t_seq / t_par))
+    print("Done GIL release test")
+
+
+def test_progress(num_funcs=256):
+    # a Python thread keeps running while a native pass runs
+    ((ctx, module),) = parse_modules(make_code(num_funcs), 1)
+    samples = []
+    stop = threading.Event()
+
+    def count():
+        counter = 0
+        while not stop.is_set():
+            counter += 1
+            if counter % 1000 == 0:
+                samples.append(time.perf_counter())
+
+    thread = threading.Thread(target=count)
+    thread.start()
+    while not samples:
+        time.sleep(0.001)
+    start = time.perf_counter()
+    assert hcl_d.lower_hcl_to_llvm(module, ctx)
+    end = time.perf_counter()
+    stop.set()
+    thread.join()
+
+    # with the GIL held by the pass, the counter would only resume after
+    # the call returned
+    during = [t for t in samples if start <= t <= end]
+    assert during, "no progress during {:.3f}s in the pass".format(end - start)
+    assert during[-1] - during[0] >= 0.5 * (end - start), (
+        during[0] - start, end - during[-1], end - start)
+    print("{} counter samples during {:.3f}s in the pass".format(
+        len(during), end - start))
+    print("Done progress test")
+
+
+if __name__ == "__main__":
+    test_gil_release()
+    test_progress()
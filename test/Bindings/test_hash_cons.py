@@ -0,0 +1,72 @@
+# RUN: %PYTHON %s
+
+from hcl_mlir.build_ir import IterVar
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+def count_ops(module, name):
+    return str(module).count(" = {} ".format(name))
+
+
+def test_hash_cons():
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        hcl_mlir.enable_build_inplace()
+        hcl_mlir.enable_hash_cons()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                for_i = hcl_mlir.make_for(0, 16, name="i")
+                hcl_mlir.GlobalInsertionPoint.save(
+                    InsertionPoint(for_i.body.operations[0]))
+                i = IterVar(for_i.induction_variable, name="i")
+
+                # duplicate pure expressions are built once
+                t1 = i * 3 + 5
+                t2 = i * 3 + 5
+                u = i * 3 + 7
+                assert t1 is t2
+                assert count_ops(module, "arith.muli") == 1
+                assert count_ops(module, "arith.addi") == 2
+                num_constants = count_ops(module, "arith.constant")
+                assert num_constants == 3
+
+                # a shared expression stays while it has other users
+                hcl_mlir.ASTVisitor(mode="remove").visit(t1)
+                assert count_ops(module, "arith.addi") == 1
+                assert count_ops(module, "arith.muli") == 1
+                assert count_ops(module, "arith.constant") == 2
+
+                # and is erased with its last user
+                hcl_mlir.ASTVisitor(mode="remove").visit(u)
+                for name in ("arith.addi", "arith.muli", "arith.constant",
+                             "arith.index_cast"):
+                    assert count_ops(module, name) == 0, name
+
+                # a removed expression is built again by the next lookup
+                t3 = i * 3 + 5
+                assert t3.built_op is not None
+                assert count_ops(module, "arith.addi") == 1
+
+                # signed zeros are different constants
+                f32 = F32Type.get()
+                pos = hcl_mlir.make_constant(f32, 0.0)
+                neg = hcl_mlir.make_constant(f32, -0.0)
+                assert pos is not neg
+                assert pos is hcl_mlir.make_constant(f32, 0.0)
+                assert "-0.000000e+00" in str(neg.built_op)
+                hcl_mlir.GlobalInsertionPoint.restore()
+
+        hcl_mlir.disable_hash_cons()
+        hcl_mlir.disable_build_inplace()
+        assert module.operation.verify()
+    print("Done hash-consing test")
+
+
+if __name__ == "__main__":
+    test_hash_cons()
@@ -0,0 +1,182 @@
+# RUN: %PYTHON %s
+
+import ctypes
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.runtime import get_ranked_memref_descriptor
+from hcl_mlir.cache import CompilationCache
+from hcl_mlir.kernels import KernelPool
+import hcl_mlir.kernels
+
+code = """
+module {
+    func.func @top(%A: memref<32x32xf32>, %B: memref<32x32xf32>, %C: memref<32x32xf32>) attributes {llvm.emit_c_interface, top} {
+        affine.for %i = 0 to 32 {
+            affine.for %j = 0 to 32 {
+                affine.for %k = 0 to 32 {
+                    %a = affine.load %A[%i, %k] : memref<32x32xf32>
+                    %b = affine.load %B[%k, %j] : memref<32x32xf32>
+                    %c = affine.load %C[%i, %j] : memref<32x32xf32>
+                    %prod = arith.mulf %a, %b : f32
+                    %sum = arith.addf %prod, %c : f32
+                    affine.store %sum, %C[%i, %j] : memref<32x32xf32>
+                } {loop_name = "k"}
+            } {loop_name = "j"}
+        } {loop_name = "i", op_name = "s"}
+        return
+    }
+}
+"""
+
+
+def run(pool):
+    A = np.random.rand(32, 32).astype(np.float32)
+    B = np.random.rand(32, 32).astype(np.float32)
+    C = np.zeros((32, 32), dtype=np.float32)
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        module = Module.parse(code)
+        start = time.perf_counter()
+        kernel = pool.get_kernel(module)
+        elapsed = time.perf_counter() - start
+    kernel(*[ctypes.pointer(ctypes.pointer(get_ranked_memref_descriptor(arr)))
+             for arr in (A, B, C)])
+    assert np.allclose(C, A @ B, rtol=1e-4)
+    return kernel, elapsed
+
+
+def test_kernel_pool():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CompilationCache(tmp)
+        pool = KernelPool(cache=cache)
+        kernel, t_compile = run(pool)
+        assert pool.statistics()["compiles"] == 1
+        assert cache.statistics()["misses"] == {"o": 1}
+
+        # the same module hits the pool
+        for _ in range(10):
+            assert run(pool)[0] is kernel
+        stats = pool.statistics()
+        assert stats["hits"] == 10 and stats["compiles"] == 1
+        _, t_hit = run(pool)
+
+        # a new pool, like a restarted service, links the object file
+        pool = KernelPool(cache=cache)
+        _, t_load = run(pool)
+        stats = pool.statistics()
+        assert stats["loads"] == 1 and stats["compiles"] == 0
+
+        # without a cache, the least recently used modules are dropped
+        pool = KernelPool(capacity=1)
+        run(pool)
+        with Context() as ctx:
+            hcl_d.register_dialect(ctx)
+            pool.get_kernel(Module.parse(code.replace("32", "16")))
+        assert pool.statistics()["evictions"] == 1
+        print("compile {:.3f}s, pool hit {:.6f}s, object load {:.3f}s".format(
+            t_compile, t_hit, t_load))
+    print("Done kernel pool test")
+
+
+def test_memoized_keys():
+    # a module is only fingerprinted on its first lookup
+    fingerprints = []
+    get_module_fingerprint = hcl_mlir.kernels.get_module_fingerprint
+
+    def count(module):
+        fingerprints.append(module)
+        return get_module_fingerprint(module)
+
+    hcl_mlir.kernels.get_module_fingerprint = count
+    try:
+        pool = KernelPool()
+        with Context() as ctx:
+            hcl_d.register_dialect(ctx)
+            module = Module.parse(code)
+            kernel = pool.get_kernel(module)
+            for _ in range(10):
+                assert pool.get_kernel(module) is kernel
+            assert len(fingerprints) == 1
+            # a key given by the caller is used as is
+            key = pool.get_key(module)
+            assert pool.get_kernel(Module.parse(code), key=key) is kernel
+            assert len(fingerprints) == 1
+    finally:
+        hcl_mlir.kernels.get_module_fingerprint = get_module_fingerprint
+    print("Done memoized keys test")
+
+
+def test_cached_external_data():
+    # an object file loaded from the cache resolves the memory-mapped
+    # constants of the module too
+    with tempfile.TemporaryDirectory() as tmp:
+        lut = np.memmap(os.path.join(tmp, "lut.bin"), dtype=np.int16,
+                        mode="w+", shape=(4,))
+        lut[:] = [1, -2, 3, 4]
+        lut.flush()
+        external_code = """
+        module attributes {{hcl.external_data = {{lut = ["{}", 0 : i64, 8 : i64]}}}} {{
+            memref.global constant @lut : memref<4xi16>
+            func.func @top(%out: memref<4xi16>) attributes {{llvm.emit_c_interface, top}} {{
+                %lut = memref.get_global @lut : memref<4xi16>
+                affine.for %i = 0 to 4 {{
+                    %v = affine.load %lut[%i] : memref<4xi16>
+                    affine.store %v, %out[%i] : memref<4xi16>
+                }}
+                return
+            }}
+        }}
+        """.format(lut.filename)
+        cache = CompilationCache(os.path.join(tmp, "cache"))
+        for expected in ("compiles", "loads"):
+            pool = KernelPool(cache=cache)
+            with Context() as ctx:
+                hcl_d.register_dialect(ctx)
+                kernel = pool.get_numpy_kernel(Module.parse(external_code))
+            assert pool.statistics()[expected] == 1
+            assert kernel.kernel.engine.external_data
+            out = np.zeros(4, dtype=np.int16)
+            kernel(out)
+            assert np.array_equal(out, lut)
+    print("Done cached external data test")
+
+
+def test_concurrent_misses(num_threads=8):
+    pool = KernelPool()
+    barrier = threading.Barrier(num_threads)
+    kernels = [None] * num_threads
+
+    def get(i):
+        with Context() as ctx:
+            hcl_d.register_dialect(ctx)
+            module = Module.parse(code)
+            barrier.wait()
+            kernels[i] = pool.get_kernel(module)
+
+    threads = [threading.Thread(target=get, args=(i,))
+               for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the threads that missed the module waited for its only compilation
+    assert all(kernel is kernels[0] for kernel in kernels)
+    stats = pool.statistics()
+    assert stats["compiles"] == 1 and stats["misses"] == 1
+    assert stats["hits"] == num_threads - 1
+    assert not pool.pending
+    print("Done concurrent misses test")
+
+
+if __name__ == "__main__":
+    test_kernel_pool()
+    test_memoized_keys()
+    test_cached_external_data()
+    test_concurrent_misses()
@@ -0,0 +1,73 @@
+# RUN: %PYTHON %s | FileCheck %s
+
+from hcl_mlir.build_ir import IterVar
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import arith, func, scf
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+with Context() as ctx, Location.unknown():
+    hcl_d.register_dialect(ctx)
+    module = Module.create()
+    f32 = F32Type.get()
+    index = IndexType.get()
+    memref_type = MemRefType.get((16, 16), f32)
+    hcl_mlir.enable_build_inplace()
+
+    with InsertionPoint(module.body):
+
+        @func.FuncOp.from_py_func(memref_type, memref_type)
+        def kernel(A, B):
+            tA = hcl_mlir.TensorOp((16, 16), A, f32, name="A")
+            tB = hcl_mlir.TensorOp((16, 16), B, f32, name="B")
+            tA.build()
+            tB.build()
+            for_i = hcl_mlir.make_for(0, 16, name="i")
+            hcl_mlir.GlobalInsertionPoint.save(
+                InsertionPoint(for_i.body.operations[0]))
+            i = IterVar(for_i.induction_variable, name="i")
+
+            # affine access: the literals are folded into the map
+            tB[i, 1] = tA[i, 0]
+
+            for_j = hcl_mlir.make_for(
+                0, 16, name="j", ip=hcl_mlir.GlobalInsertionPoint.get())
+            hcl_mlir.GlobalInsertionPoint.save(
+                InsertionPoint(for_j.body.operations[0]))
+            j = IterVar(for_j.induction_variable, name="j")
+            # not affine: a product of loop variables
+            tB[i * j, 1] = tA[i * j, 0]
+            hcl_mlir.GlobalInsertionPoint.restore()
+
+            # not affine: the variable of an scf loop
+            c0 = arith.ConstantOp(index, 0, ip=hcl_mlir.GlobalInsertionPoint.get())
+            c1 = arith.ConstantOp(index, 1, ip=hcl_mlir.GlobalInsertionPoint.get())
+            c16 = arith.ConstantOp(index, 16, ip=hcl_mlir.GlobalInsertionPoint.get())
+            for_k = scf.ForOp(c0.result, c16.result, c1.result,
+                              ip=hcl_mlir.GlobalInsertionPoint.get())
+            scf.YieldOp([], ip=InsertionPoint(for_k.body))
+            hcl_mlir.GlobalInsertionPoint.save(
+                InsertionPoint(for_k.body.operations[0]))
+            k = IterVar(for_k.induction_variable, name="k")
+            tB[k, 1] = tA[k, 0]
+            hcl_mlir.GlobalInsertionPoint.restore()
+            hcl_mlir.GlobalInsertionPoint.restore()
+            return
+
+    assert module.operation.verify()
+    print(module)
+
+# CHECK: affine.for %[[I:.*]] = 0 to 16 {
+# CHECK:   %[[A:.*]] = affine.load %arg0[%[[I]], 0]
+# CHECK:   affine.store %[[A]], %arg1[%[[I]], 1]
+# CHECK:   affine.for %[[J:.*]] = 0 to 16 {
+# CHECK:     %[[IJ:.*]] = arith.muli %[[I]], %[[J]]
+# CHECK:     %[[ZERO:.*]] = arith.constant 0 : index
+# CHECK:     memref.load %arg0[%[[IJ]], %[[ZERO]]]
+# CHECK:     %[[ONE:.*]] = arith.constant 1 : index
+# CHECK:     memref.store %{{.*}}, %arg1[%{{.*}}, %[[ONE]]]
+# CHECK:   scf.for %[[K:.*]] = %{{.*}} to %{{.*}} step %{{.*}} {
+# CHECK:     %[[ZERO:.*]] = arith.constant 0 : index
+# CHECK:     memref.load %arg0[%[[K]], %[[ZERO]]]
+# CHECK:     %[[ONE:.*]] = arith.constant 1 : index
+# CHECK:     memref.store %{{.*}}, %arg1[%[[K]], %[[ONE]]]
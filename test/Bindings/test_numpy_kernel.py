@@ -0,0 +1,108 @@
+# RUN: %PYTHON %s
+
+import ctypes
+import gc
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.runtime import get_ranked_memref_descriptor
+from hcl_mlir.exceptions import APIError
+from hcl_mlir.kernels import KernelPool
+
+code = """
+module {
+    func.func @top(%A: memref<16xi8>, %s: i32) -> memref<16xi32> attributes {llvm.emit_c_interface, top, itypes = "u_"} {
+        %B = memref.alloc() : memref<16xi32>
+        affine.for %i = 0 to 16 {
+            %a = affine.load %A[%i] : memref<16xi8>
+            %e = arith.extui %a : i8 to i32
+            %b = arith.addi %e, %s : i32
+            affine.store %b, %B[%i] : memref<16xi32>
+        } {loop_name = "i"}
+        return %B : memref<16xi32>
+    }
+    func.func @noop(%A: memref<4xf32>, %B: memref<4xf32>, %C: memref<4xf32>) attributes {llvm.emit_c_interface} {
+        return
+    }
+    memref.global "private" constant @table : memref<4xi32> = dense<[1, 2, 3, 4]>
+    func.func @identity(%A: memref<4xi32>) -> memref<4xi32> attributes {llvm.emit_c_interface} {
+        %B = memref.cast %A : memref<4xi32> to memref<?xi32>
+        %C = memref.cast %B : memref<?xi32> to memref<4xi32>
+        return %C : memref<4xi32>
+    }
+    func.func @table(%A: memref<4xi32>) -> memref<4xi32> attributes {llvm.emit_c_interface} {
+        %T = memref.get_global @table : memref<4xi32>
+        return %T : memref<4xi32>
+    }
+}
+"""
+
+
+def per_call(fn, repeat=10000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def test_numpy_kernel():
+    pool = KernelPool()
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        module = Module.parse(code)
+        top = pool.get_numpy_kernel(module)
+        noop = pool.get_numpy_kernel(module, "noop")
+
+    A = np.arange(16, dtype=np.uint8) * 16
+    for s in range(3):
+        B = top(A, s)
+        assert B.dtype == np.int32
+        assert np.array_equal(B, A.astype(np.int32) + s)
+
+    # the arrays are validated, not converted
+    for bad in (A.astype(np.int8), A[::2], A.reshape(4, 4), list(A)):
+        try:
+            top(bad, 0)
+        except APIError:
+            pass
+        else:
+            assert False, "{} is not rejected".format(bad)
+
+    # only the buffers allocated by a kernel are freed with its results
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        identity = pool.get_numpy_kernel(module, "identity")
+        table = pool.get_numpy_kernel(module, "table")
+    assert top.results[0].ownership == "alloc"
+    assert identity.results[0].ownership == "borrowed"
+    assert table.results[0].ownership == "borrowed"
+    X = np.arange(4, dtype=np.int32)
+    for _ in range(3):
+        Y = identity(X)
+        assert np.shares_memory(X, Y)
+        T = table(X)
+        del Y, T
+        gc.collect()
+    assert np.array_equal(X, np.arange(4, dtype=np.int32))
+    assert np.array_equal(table(X), [1, 2, 3, 4])
+
+    # per-call overhead of the wrapper and of hand-built descriptors
+    X, Y, Z = [np.zeros(4, dtype=np.float32) for _ in range(3)]
+    engine = noop.kernel.engine
+    t_wrapper = per_call(lambda: noop(X, Y, Z))
+
+    def invoke():
+        engine.invoke("noop", *[
+            ctypes.pointer(ctypes.pointer(get_ranked_memref_descriptor(arr)))
+            for arr in (X, Y, Z)])
+
+    t_manual = per_call(invoke)
+    print("per-call overhead: wrapper {:.1f} us, manual {:.1f} us".format(
+        t_wrapper, t_manual))
+    print("Done NumPy kernel test")
+
+
+if __name__ == "__main__":
+    test_numpy_kernel()
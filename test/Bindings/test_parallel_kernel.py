@@ -0,0 +1,114 @@
+# RUN: %PYTHON %s
+
+import os
+import time
+
+import numpy as np
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import hcl as hcl_d
+from hcl_mlir.kernels import KernelPool
+
+gemm = """
+module {
+    func.func @top(%A: memref<256x256xf32>, %B: memref<256x256xf32>, %C: memref<256x256xf32>) attributes {llvm.emit_c_interface, top} {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        affine.for %i = 0 to 256 {
+            affine.for %j = 0 to 256 {
+                affine.for %k = 0 to 256 {
+                    %a = affine.load %A[%i, %k] : memref<256x256xf32>
+                    %b = affine.load %B[%k, %j] : memref<256x256xf32>
+                    %c = affine.load %C[%i, %j] : memref<256x256xf32>
+                    %prod = arith.mulf %a, %b : f32
+                    %sum = arith.addf %prod, %c : f32
+                    affine.store %sum, %C[%i, %j] : memref<256x256xf32>
+                } {loop_name = "k"}
+            } {loop_name = "j"}
+        } {loop_name = "i", op_name = "s"}
+        hcl.parallel (%li)
+        return
+    }
+}
+"""
+
+conv = """
+module {
+    func.func @top(%A: memref<514x514xf32>, %W: memref<3x3xf32>, %B: memref<512x512xf32>) attributes {llvm.emit_c_interface, top} {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        affine.for %i = 0 to 512 {
+            affine.for %j = 0 to 512 {
+                affine.for %r = 0 to 3 {
+                    affine.for %c = 0 to 3 {
+                        %a = affine.load %A[%i + %r, %j + %c] : memref<514x514xf32>
+                        %w = affine.load %W[%r, %c] : memref<3x3xf32>
+                        %b = affine.load %B[%i, %j] : memref<512x512xf32>
+                        %prod = arith.mulf %a, %w : f32
+                        %sum = arith.addf %prod, %b : f32
+                        affine.store %sum, %B[%i, %j] : memref<512x512xf32>
+                    } {loop_name = "c"}
+                } {loop_name = "r"}
+            } {loop_name = "j"}
+        } {loop_name = "i", op_name = "s"}
+        hcl.parallel (%li)
+        return
+    }
+}
+"""
+
+
+def get_kernel(code, num_threads, shared_libs):
+    with Context() as ctx:
+        hcl_d.register_dialect(ctx)
+        module = Module.parse(code)
+        assert hcl_d.loop_transformation(module)
+        pool = KernelPool(num_threads=num_threads, shared_libs=shared_libs)
+        return pool.get_numpy_kernel(module)
+
+
+def measure(kernel, make_args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        args = make_args()
+        start = time.perf_counter()
+        kernel(*args)
+        best = min(best, time.perf_counter() - start)
+    return args, best
+
+
+def test_parallel_kernel():
+    # the parallel loops are run by the MLIR async runtime
+    shared_libs = []
+    thread_counts = [1]
+    if os.getenv("LLVM_BUILD_DIR") is not None:
+        shared_libs.append(os.path.join(
+            os.getenv("LLVM_BUILD_DIR"), "lib", "libmlir_async_runtime.so"))
+        cpus = os.cpu_count() or 1
+        thread_counts += [n for n in (2, 4, 8, 16) if n <= cpus]
+
+    A = np.random.rand(256, 256).astype(np.float32)
+    B = np.random.rand(256, 256).astype(np.float32)
+    X = np.random.rand(514, 514).astype(np.float32)
+    W = np.random.rand(3, 3).astype(np.float32)
+    Y = sum(X[r:r + 512, c:c + 512] * W[r, c]
+            for r in range(3) for c in range(3))
+
+    benchmarks = [
+        ("gemm", gemm, lambda: (A, B, np.zeros((256, 256), np.float32)),
+         A @ B),
+        ("conv", conv, lambda: (X, W, np.zeros((512, 512), np.float32)), Y),
+    ]
+    for name, code, make_args, expected in benchmarks:
+        times = {}
+        for num_threads in thread_counts:
+            kernel = get_kernel(code, num_threads, shared_libs)
+            args, times[num_threads] = measure(kernel, make_args)
+            assert np.allclose(args[-1], expected, rtol=1e-3)
+        print("{}: ".format(name) + ", ".join(
+            "{} threads {:.4f}s ({:.2f}x)".format(n, t, times[1] / t)
+            for n, t in times.items()))
+    print("Done parallel kernel test")
+
+
+if __name__ == "__main__":
+    test_parallel_kernel()
@@ -22,6 +22,78 @@ def test_print():
         print(hcl_mlir.print_mlir_type(IntegerType.get_unsigned(12)))
 
 
+def promote_reference(ltype, rtype):
+    # the promotion of ExprOp.generic_op before the promotion table:
+    # cast_types on the operand of higher rank first, then
+    # regularize_fixed_type, which has nothing left to cast
+    if hcl_mlir.compute_type_rank(ltype) > hcl_mlir.compute_type_rank(rtype):
+        return hcl_mlir.get_promoted_type(ltype, rtype)
+    return hcl_mlir.get_promoted_type(rtype, ltype)
+
+
+def test_promotion():
+    with Context() as ctx, Location.unknown() as loc:
+        hcl_d.register_dialect(ctx)
+        types = [
+            IntegerType.get_signless(1),
+            IntegerType.get_signless(8),
+            IntegerType.get_signless(32),
+            IntegerType.get_signless(64),
+            IntegerType.get_unsigned(8),
+            IntegerType.get_unsigned(32),
+            IndexType.get(),
+            hcl_d.FixedType.get(12, 6),
+            hcl_d.FixedType.get(16, 8),
+            hcl_d.UFixedType.get(20, 12),
+            F16Type.get(),
+            F32Type.get(),
+            F64Type.get(),
+        ]
+        registry = hcl_mlir.type_registry
+        num_promoted = 0
+        for ltype in types:
+            for rtype in types:
+                if ltype == rtype:
+                    assert registry.promote(ltype, rtype) == (
+                        ltype, False, False)
+                    continue
+                try:
+                    expected = promote_reference(ltype, rtype)
+                except hcl_mlir.DTypeError:
+                    # unsupported pairs still fail and are not memoized
+                    try:
+                        registry.promote(ltype, rtype)
+                    except hcl_mlir.DTypeError:
+                        pass
+                    else:
+                        assert False, (ltype, rtype)
+                    continue
+                plan = registry.promote(ltype, rtype)
+                assert plan == (expected, ltype != expected, rtype != expected)
+                # served from the table afterwards
+                assert registry.promote(ltype, rtype) is plan
+
+                # cast_types casts exactly the operands flagged by the plan
+                lhs = hcl_mlir.ConstantOp(ltype, 1)
+                rhs = hcl_mlir.ConstantOp(rtype, 1)
+                new_lhs, new_rhs = hcl_mlir.cast_types(lhs, rhs)
+                assert new_lhs.dtype == expected and new_rhs.dtype == expected
+                assert (new_lhs is not lhs) == plan[1]
+                assert (new_rhs is not rhs) == plan[2]
+                num_promoted += 1
+        assert num_promoted > 0
+
+    # the table belongs to the context the types were created in
+    with Context() as ctx, Location.unknown() as loc:
+        hcl_d.register_dialect(ctx)
+        i8 = IntegerType.get_signless(8)
+        f32 = F32Type.get()
+        assert hcl_mlir.type_registry.promote(i8, f32) == (f32, True, False)
+        assert len(hcl_mlir.type_registry.promotions) == 1
+    print("Done promotion test")
+
+
 if __name__ == "__main__":
     test_fixed()
     test_print()
+    test_promotion()
@@ -0,0 +1,172 @@
+# RUN: %PYTHON %s
+
+import sys
+import time
+
+from hcl_mlir.ir import *
+from hcl_mlir.dialects import func
+from hcl_mlir.dialects import hcl as hcl_d
+import hcl_mlir
+
+
+class RecursiveVisitor(hcl_mlir.ASTVisitor):
+    """The isinstance-chain, recursive dispatch of the visitor before the
+    dispatch table, used as the baseline. It calls the same handlers, but
+    visits the operands by recursion."""
+
+    def visit(self, expr):
+        if (
+            self.mode == "build"
+            and not isinstance(expr, tuple)
+            and expr.built_op is not None
+        ):
+            return expr.built_op
+
+        if isinstance(expr, hcl_mlir.UnaryOp):
+            return self.visit_operands(expr, (expr.val,))
+        elif isinstance(expr, hcl_mlir.BinaryOp):
+            return self.visit_operands(expr, (expr.lhs, expr.rhs))
+        elif isinstance(expr, hcl_mlir.SelectOp):
+            return self.visit_ternary_op(expr)
+        elif isinstance(expr, hcl_mlir.LoadOp):
+            return self.visit_load_op(expr)
+        elif isinstance(expr, hcl_mlir.StoreOp):
+            return self.visit_store_op(expr)
+        elif isinstance(expr, hcl_mlir.GetBitOp):
+            return self.visit_operands(expr, (expr.num, expr.index))
+        elif isinstance(expr, hcl_mlir.SetBitOp):
+            return self.visit_operands(expr, (expr.num, expr.index, expr.val))
+        elif isinstance(expr, hcl_mlir.GetSliceOp):
+            return self.visit_operands(expr, (expr.num, expr.hi, expr.lo))
+        elif isinstance(expr, hcl_mlir.SetSliceOp):
+            return self.visit_operands(
+                expr, (expr.num, expr.hi, expr.lo, expr.val))
+        elif isinstance(expr, hcl_mlir.CastOp):
+            return self.visit_operands(expr, (expr.val,))
+        elif isinstance(expr, hcl_mlir.ReduceOp):
+            return self.visit_reduce_op(expr)
+        elif isinstance(expr, hcl_mlir.ConstantOp):
+            return self.visit_constant_op(expr)
+        elif isinstance(expr, tuple):
+            return self.visit_struct_op(expr)
+        elif isinstance(expr, hcl_mlir.StructGetOp):
+            self.visit(expr.struct)
+            return self.visit_struct_get_op(expr)
+        else:  # IterVar
+            return self.visit_block_arg(expr)
+
+    def visit_operands(self, expr, operands):
+        if self.mode == "remove":
+            result = self.visit_inner_op(expr)
+            for operand in reversed(operands):
+                self.visit(operand)
+            return result
+        for operand in operands:
+            self.visit(operand)
+        return self.visit_inner_op(expr)
+
+
+def make_dag(leaves, num_nodes):
+    # balanced binary tree of AddOp/MulOp whose leaves are shared
+    index = IndexType.get()
+    level = [leaves[i % len(leaves)] for i in range((num_nodes + 1) // 2)]
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            OpClass = hcl_mlir.AddOp if i % 4 == 0 else hcl_mlir.MulOp
+            next_level.append(OpClass(index, level[i], level[i + 1]))
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def make_chain(iv, depth):
+    # every constant has a single use, so the chain can be removed again
+    index = IndexType.get()
+    expr = iv
+    for i in range(depth):
+        expr = hcl_mlir.AddOp(index, expr, hcl_mlir.ConstantOp(index, i))
+    return expr
+
+
+def timeit(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def build_kernel(visitor_cls, num_nodes):
+    """Profile and build a DAG of num_nodes nodes with a visitor class and
+    return the module and the times"""
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        index = IndexType.get()
+        times = {}
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                for_i = hcl_mlir.make_for(0, 16, name="i")
+                for_j = hcl_mlir.make_for(
+                    0, 16, name="j", ip=InsertionPoint(for_i.body.operations[0]))
+                ip = InsertionPoint(for_j.body.operations[0])
+                hcl_mlir.GlobalInsertionPoint.save(ip)
+                leaves = [
+                    hcl_mlir.IterVar(for_i.induction_variable, name="i"),
+                    hcl_mlir.IterVar(for_j.induction_variable, name="j"),
+                ] + [hcl_mlir.ConstantOp(index, k) for k in range(8)]
+                dag = make_dag(leaves, num_nodes)
+                times["profile"] = timeit(
+                    lambda: visitor_cls(mode="profile").visit(dag))
+                start = time.perf_counter()
+                visitor_cls(mode="build").visit(dag)
+                times["build"] = time.perf_counter() - start
+                assert dag.built_op is not None
+                hcl_mlir.GlobalInsertionPoint.restore()
+
+        assert module.operation.verify()
+        return str(module), times
+
+
+def test_visitor(num_nodes=100000):
+    # the table-driven visitor builds the same IR as the recursive one
+    new_ir, t_new = build_kernel(hcl_mlir.ASTVisitor, num_nodes)
+    old_ir, t_old = build_kernel(RecursiveVisitor, num_nodes)
+    assert new_ir == old_ir
+    for mode in ("profile", "build"):
+        print("{} {} nodes: recursive {:.3f}s, table-driven {:.3f}s, speedup {:.2f}x".format(
+            mode, num_nodes, t_old[mode], t_new[mode],
+            t_old[mode] / t_new[mode]))
+
+    # expressions deeper than the recursion limit
+    with Context() as ctx, Location.unknown():
+        hcl_d.register_dialect(ctx)
+        module = Module.create()
+        with InsertionPoint(module.body):
+
+            @func.FuncOp.from_py_func()
+            def kernel():
+                for_i = hcl_mlir.make_for(0, 16, name="i")
+                hcl_mlir.GlobalInsertionPoint.save(
+                    InsertionPoint(for_i.body.operations[0]))
+                iv = hcl_mlir.IterVar(for_i.induction_variable, name="i")
+                chain = make_chain(iv, sys.getrecursionlimit() * 4)
+                hcl_mlir.ASTVisitor(mode="build").visit(chain)
+                assert chain.built_op is not None
+                hcl_mlir.ASTVisitor(mode="remove").visit(chain)
+                assert chain.built_op is None
+                hcl_mlir.GlobalInsertionPoint.restore()
+
+        assert module.operation.verify()
+        # the removed chain leaves only the loop
+        assert "arith.addi" not in str(module)
+    print("Done visitor test")
+
+
+if __name__ == "__main__":
+    test_visitor()
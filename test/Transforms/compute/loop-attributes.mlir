@@ -0,0 +1,81 @@
+// RUN: hcl-opt -opt -lower-loop-attrs %s | FileCheck %s
+
+module {
+    // CHECK-LABEL: func.func @unroll
+    func.func @unroll(%A: memref<64xf32>, %B: memref<64xf32>, %C: memref<64xf32>)
+    {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        // CHECK: affine.for %{{.*}} = 0 to 64 step 4 {
+        // CHECK-COUNT-4: arith.addf
+        // CHECK-NOT: unroll
+        affine.for %i = 0 to 64 {
+            %a = affine.load %A[%i] : memref<64xf32>
+            %b = affine.load %B[%i] : memref<64xf32>
+            %sum = arith.addf %a, %b : f32
+            affine.store %sum, %C[%i] : memref<64xf32>
+        } { loop_name = "i", op_name = "s" }
+        hcl.unroll (%li, 4)
+        return
+    }
+
+    // CHECK-LABEL: func.func @full_unroll
+    func.func @full_unroll(%A: memref<4xf32>, %B: memref<4xf32>)
+    {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        // CHECK-NOT: affine.for
+        // CHECK-COUNT-4: affine.store
+        affine.for %i = 0 to 4 {
+            %a = affine.load %A[%i] : memref<4xf32>
+            affine.store %a, %B[%i] : memref<4xf32>
+        } { loop_name = "i", op_name = "s" }
+        hcl.unroll (%li)
+        return
+    }
+
+    // CHECK-LABEL: func.func @pipeline
+    func.func @pipeline(%A: memref<64x64xf32>, %B: memref<64x64xf32>, %C: memref<64x64xf32>)
+    {
+        %s = hcl.create_op_handle "s"
+        %lj = hcl.create_loop_handle %s, "j"
+        // the iterations of j are independent, so their k loops are jammed
+        // CHECK: affine.for %{{.*}} = 0 to 64 {
+        // CHECK:   affine.for %{{.*}} = 0 to 64 step 4 {
+        // CHECK:     affine.for %{{.*}} = 0 to 64 {
+        // CHECK-COUNT-4: arith.mulf
+        // CHECK-NOT: pipeline_ii
+        affine.for %i = 0 to 64 {
+            affine.for %j = 0 to 64 {
+                affine.for %k = 0 to 64 {
+                    %a = affine.load %A[%i, %k] : memref<64x64xf32>
+                    %b = affine.load %B[%k, %j] : memref<64x64xf32>
+                    %c = affine.load %C[%i, %j] : memref<64x64xf32>
+                    %prod = arith.mulf %a, %b : f32
+                    %sum = arith.addf %prod, %c: f32
+                    affine.store %sum, %C[%i, %j] : memref<64x64xf32>
+                } { loop_name = "k" }
+            } { loop_name = "j" }
+        } { loop_name = "i", op_name = "s" }
+        hcl.pipeline (%lj, 1)
+        return
+    }
+
+    // CHECK-LABEL: func.func @pipeline_carried
+    func.func @pipeline_carried(%A: memref<64xf32>, %B: memref<1xf32>)
+    {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        // the accumulation is carried by i, so its order is kept
+        // CHECK: affine.for %{{.*}} = 0 to 64 step 4 {
+        // CHECK-COUNT-4: affine.store
+        affine.for %i = 0 to 64 {
+            %a = affine.load %A[%i] : memref<64xf32>
+            %b = affine.load %B[0] : memref<1xf32>
+            %sum = arith.addf %a, %b : f32
+            affine.store %sum, %B[0] : memref<1xf32>
+        } { loop_name = "i", op_name = "s" }
+        hcl.pipeline (%li, 1)
+        return
+    }
+}
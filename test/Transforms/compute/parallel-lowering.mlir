@@ -0,0 +1,26 @@
+// RUN: hcl-opt -opt -lower-to-llvm -num-threads=4 %s | FileCheck %s
+// RUN: hcl-opt -opt -lower-to-llvm %s | FileCheck %s --check-prefix=SEQ
+
+module {
+    // CHECK: llvm.func @mlirAsyncRuntimeExecute
+    // SEQ-NOT: mlirAsyncRuntime
+    func.func @matrix_multiply(%A: memref<64x64xf32>, %B: memref<64x64xf32>, %C: memref<64x64xf32>)
+    {
+        %s = hcl.create_op_handle "s"
+        %li = hcl.create_loop_handle %s, "i"
+        affine.for %i = 0 to 64 {
+            affine.for %j = 0 to 64 {
+                affine.for %k = 0 to 64 {
+                    %a = affine.load %A[%i, %k] : memref<64x64xf32>
+                    %b = affine.load %B[%k, %j] : memref<64x64xf32>
+                    %c = affine.load %C[%i, %j] : memref<64x64xf32>
+                    %prod = arith.mulf %a, %b : f32
+                    %sum = arith.addf %prod, %c: f32
+                    affine.store %sum, %C[%i, %j] : memref<64x64xf32>
+                } { loop_name = "k" }
+            } { loop_name = "j" }
+        } { loop_name = "i", op_name = "s" }
+        hcl.parallel (%li)
+        return
+    }
+}
@@ -0,0 +1,19 @@
+// RUN: hcl-opt -lower-to-llvm -num-threads=4 %s 2>&1 | FileCheck %s
+
+// A reduction marked parallel stays a sequential loop, as async-parallel-for
+// does not lower the reductions of affine.parallel.
+module {
+    // CHECK: warning: loop has loop-carried dependences and is not parallelized
+    // CHECK-NOT: mlirAsyncRuntime
+    func.func @sum(%A: memref<64xf32>, %R: memref<1xf32>)
+    {
+        %zero = arith.constant 0.0 : f32
+        %r = affine.for %i = 0 to 64 iter_args(%acc = %zero) -> (f32) {
+            %a = affine.load %A[%i] : memref<64xf32>
+            %s = arith.addf %acc, %a : f32
+            affine.yield %s : f32
+        } { loop_name = "i", op_name = "s", parallel = 1 : i32 }
+        affine.store %r, %R[0] : memref<1xf32>
+        return
+    }
+}
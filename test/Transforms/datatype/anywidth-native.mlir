@@ -0,0 +1,22 @@
+// RUN: hcl-opt %s --lower-anywidth-integer --native-width | FileCheck %s
+module {
+  // CHECK-LABEL: func.func @top
+  // CHECK-SAME: (%arg0: memref<10xi8>, %arg1: memref<10xi8>) -> memref<10xi16>
+  func.func @top(%arg0: memref<10xi8>, %arg1: memref<10xi3>) -> memref<10xi16> attributes {itypes = "su", otypes = "s", llvm.emit_c_interface, top} {
+    // CHECK: arith.trunci %{{.*}} : i8 to i3
+    // CHECK-NOT: : i8 to i64
+    %0 = memref.alloc() {name = "C"} : memref<10xi16>
+    affine.for %arg2 = 0 to 10 {
+      %1 = affine.load %arg0[%arg2] : memref<10xi8>
+      %2 = affine.load %arg1[%arg2] : memref<10xi3>
+      %3 = arith.extsi %1 : i8 to i16
+      %4 = arith.extui %2 : i3 to i16
+      %5 = arith.addi %3, %4 : i16
+      affine.store %5, %0[%arg2] : memref<10xi16>
+    } {loop_name = "x", op_name = "C"}
+    // CHECK: arith.extui %{{.*}} : i3 to i8
+    // CHECK-NOT: memref.alloc() : memref<10xi64>
+    // CHECK: return %{{.*}} : memref<10xi16>
+    return %0 : memref<10xi16>
+  }
+}
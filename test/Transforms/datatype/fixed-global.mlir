@@ -0,0 +1,30 @@
+// RUN: hcl-opt %s --fixed-to-integer | FileCheck %s
+module {
+  // CHECK: memref.global "private" constant @w8 : memref<4xi8>
+  memref.global "private" constant @w8 : memref<4xi8> = dense<[24, -8, 3, 127]> {constant, fixed_type = !hcl.Fixed<8, 4>}
+  // CHECK: memref.global "private" constant @w24 : memref<4xi32>
+  memref.global "private" constant @w24 : memref<4xi32> = dense<[24, -8, 3, 8388607]> {constant, fixed_type = !hcl.Fixed<24, 4>}
+
+  func.func @native_width(%arg0: memref<4x!hcl.Fixed<8, 4>>) attributes {itypes = "_", otypes = ""} {
+    // CHECK: %[[W8:.*]] = memref.get_global @w8 : memref<4xi8>
+    // CHECK-NOT: memref.alloc
+    // CHECK: affine.load %[[W8]]
+    %0 = hcl.get_global_fixed @w8 : memref<4x!hcl.Fixed<8, 4>>
+    affine.for %arg1 = 0 to 4 {
+      %1 = affine.load %0[%arg1] : memref<4x!hcl.Fixed<8, 4>>
+      affine.store %1, %arg0[%arg1] : memref<4x!hcl.Fixed<8, 4>>
+    }
+    return
+  }
+
+  func.func @padded_width(%arg0: memref<4x!hcl.Fixed<24, 4>>) attributes {itypes = "_", otypes = ""} {
+    // CHECK: memref.get_global @w24 : memref<4xi32>
+    // CHECK: arith.trunci %{{.*}} : i32 to i24
+    %0 = hcl.get_global_fixed @w24 : memref<4x!hcl.Fixed<24, 4>>
+    affine.for %arg1 = 0 to 4 {
+      %1 = affine.load %0[%arg1] : memref<4x!hcl.Fixed<24, 4>>
+      affine.store %1, %arg0[%arg1] : memref<4x!hcl.Fixed<24, 4>>
+    }
+    return
+  }
+}
@@ -0,0 +1,34 @@
+// RUN: rm -rf %t && mkdir -p %t
+// RUN: hcl-translate -emit-vivado-hls -sidecar-threshold=16 -sidecar-dir=%t %s | FileCheck %s
+// RUN: FileCheck %s --check-prefix=DAT < %t/big.dat
+// RUN: FileCheck %s --check-prefix=SPLAT < %t/ones.dat
+// RUN: hcl-translate -emit-intel-hls -sidecar-threshold=16 -sidecar-dir=%t %s | FileCheck %s --check-prefix=INTEL
+
+module {
+  memref.global "private" constant @small : memref<2xi32> = dense<[1, -2]>
+  memref.global "private" constant @big : memref<2x4xi16> = dense<[[1, -2, 3, 4], [5, 6, 7, -8]]>
+  memref.global "private" constant @ones : memref<16xi8> = dense<-1> {unsigned}
+  memref.global "private" constant @lut : memref<2xf32> = dense<[0.5, 0x7F800000]>
+  func.func @top(%A: memref<2x4xi16>) {
+    %0 = memref.get_global @big : memref<2x4xi16>
+    return
+  }
+}
+
+// CHECK: const int32_t small[2] = {1, -2};
+// CHECK: const int16_t big[2][4] = {
+// CHECK-NEXT: #include "big.dat"
+// CHECK-NEXT: };
+// CHECK: const uint8_t ones[16] = {
+// CHECK-NEXT: #include "ones.dat"
+// CHECK: const float lut[2] = {5.000000e-01, INFINITY};
+
+// DAT: 1, -2, 3, 4, 5, 6, 7, -8
+
+// SPLAT: 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255
+
+// INTEL: class Top;
+// INTEL-NEXT: const int32_t small[2] = {1, -2};
+// INTEL-NEXT: const int16_t big[2][4] = {
+// INTEL-NEXT: #include "big.dat"
+// INTEL: int main() {
@@ -0,0 +1,11 @@
+// RUN: not hcl-translate -emit-intel-hls %s 2>&1 | FileCheck %s
+
+module {
+  memref.global "private" constant @half : memref<2xf16> = dense<[0.5, 1.0]>
+  func.func @top(%A: memref<2xi32>) {
+    %0 = memref.get_global @half : memref<2xf16>
+    return
+  }
+}
+
+// CHECK: error: 'memref.global' op has an unsupported element type.
@@ -0,0 +1,22 @@
+// RUN: hcl-translate -emit-intel-hls %s | FileCheck %s
+
+module {
+  memref.global "private" constant @lut : memref<4xi32> = dense<[1, -2, 3, -4]>
+  func.func @top(%A: memref<4xi32>) {
+    %0 = memref.get_global @lut : memref<4xi32>
+    affine.for %i = 0 to 4 {
+      %v = affine.load %0[%i] : memref<4xi32>
+      affine.store %v, %A[%i] : memref<4xi32>
+    } {loop_name = "i"}
+    return
+  }
+}
+
+// The global is defined at file scope and accessed by name in the kernel.
+// CHECK: class Top;
+// CHECK-NEXT: const int32_t lut[4] = {1, -2, 3, -4};
+// CHECK: int main() {
+// CHECK-NOT: const int32_t lut
+// CHECK: single_task<Top>
+// CHECK-NOT: lut1
+// CHECK: = lut[
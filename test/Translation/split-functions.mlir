@@ -0,0 +1,49 @@
+// RUN: rm -rf %t
+// RUN: hcl-translate -emit-vivado-hls -split-dir=%t %s | FileCheck %s
+// RUN: FileCheck %s --check-prefix=HEADER < %t/kernel.h
+// RUN: FileCheck %s --check-prefix=ADD < %t/add.cpp
+// RUN: FileCheck %s --check-prefix=TOP < %t/top.cpp
+
+module {
+  memref.global "private" constant @lut : memref<2xi32> = dense<[1, -2]>
+  func.func @add(%A: memref<4xi32>, %B: memref<4xi32>) {
+    affine.for %i = 0 to 4 {
+      %a = affine.load %A[%i] : memref<4xi32>
+      %b = arith.addi %a, %a : i32
+      affine.store %b, %B[%i] : memref<4xi32>
+    } {loop_name = "i"}
+    return
+  }
+  func.func @top(%A: memref<4xi32>, %B: memref<4xi32>) attributes {top} {
+    %0 = memref.get_global @lut : memref<2xi32>
+    call @add(%A, %B) : (memref<4xi32>, memref<4xi32>) -> ()
+    return
+  }
+}
+
+// CHECK: kernel.h
+// CHECK-NEXT: add.cpp
+// CHECK-NEXT: top.cpp
+
+// HEADER: #ifndef KERNEL_H
+// HEADER: #include <ap_int.h>
+// HEADER: const int32_t lut[2] = {1, -2};
+// HEADER: void add(
+// HEADER: );
+// HEADER: /// This is top function.
+// HEADER-NEXT: void top(
+// HEADER: );
+// HEADER-NOT: {
+// HEADER: #endif // KERNEL_H
+
+// ADD: #include "kernel.h"
+// ADD-NOT: #include
+// ADD: void add(
+// ADD: ) {
+// ADD: for (
+// ADD-NOT: void top(
+
+// TOP: #include "kernel.h"
+// TOP-NOT: lut[2] =
+// TOP: void top(
+// TOP: add(
@@ -0,0 +1,46 @@
+// RUN: rm -rf %t
+// RUN: hcl-translate -emit-vivado-hls -split-dir=%t %s | FileCheck %s --check-prefix=FULL
+// RUN: hcl-translate -emit-vivado-hls -split-dir=%t -incremental %s | FileCheck %s --check-prefix=NONE --allow-empty
+// RUN: sed 's/arith.addi/arith.muli/' %s | hcl-translate -emit-vivado-hls -split-dir=%t -incremental | FileCheck %s --check-prefix=CHANGED
+// RUN: sed 's/arith.addi/arith.muli/' %s | hcl-translate -emit-vivado-hls -split-dir=%t -incremental -sidecar-threshold=64 | FileCheck %s --check-prefix=OPTIONS
+// RUN: FileCheck %s --check-prefix=MUL < %t/add.cpp
+// RUN: FileCheck %s --check-prefix=MANIFEST < %t/manifest.json
+
+module {
+  func.func @add(%A: memref<4xi32>, %B: memref<4xi32>) {
+    affine.for %i = 0 to 4 {
+      %a = affine.load %A[%i] : memref<4xi32>
+      %b = arith.addi %a, %a : i32
+      affine.store %b, %B[%i] : memref<4xi32>
+    } {loop_name = "i"}
+    return
+  }
+  func.func @top(%A: memref<4xi32>, %B: memref<4xi32>) attributes {top} {
+    call @add(%A, %B) : (memref<4xi32>, memref<4xi32>) -> ()
+    return
+  }
+}
+
+// FULL: kernel.h
+// FULL-NEXT: add.cpp
+// FULL-NEXT: top.cpp
+
+// NONE-NOT: kernel.h
+// NONE-NOT: .cpp
+
+// CHANGED-NOT: kernel.h
+// CHANGED: add.cpp
+// CHANGED-NOT: top.cpp
+
+// The emitter options are part of the fingerprints of the functions, the
+// header is compared by its code.
+// OPTIONS-NOT: kernel.h
+// OPTIONS: add.cpp
+// OPTIONS-NEXT: top.cpp
+
+// MUL: void add(
+// MUL: = {{.*}} * {{.*}};
+
+// MANIFEST: "kernel.h": "{{[0-9A-F]+}}"
+// MANIFEST: "add.cpp": "{{[0-9A-F]+}}"
+// MANIFEST: "top.cpp": "{{[0-9A-F]+}}"
@@ -92,6 +92,18 @@ static llvm::cl::opt<bool> removeStrideMap("remove-stride-map",
                                            llvm::cl::desc("Remove stride map"),
                                            llvm::cl::init(false));
 
+static llvm::cl::opt<bool> lowerLoopAttrs(
+    "lower-loop-attrs",
+    llvm::cl::desc("Unroll the loops marked unroll and interleave the "
+                   "iterations of the loops marked pipeline"),
+    llvm::cl::init(false));
+
+static llvm::cl::opt<unsigned> interleaveFactor(
+    "interleave-factor",
+    llvm::cl::desc("With -lower-loop-attrs, the number of iterations of a "
+                   "pipelined loop that are interleaved"),
+    llvm::cl::init(4));
+
 static llvm::cl::opt<bool>
     enableNormalize("normalize",
                     llvm::cl::desc("Enable other common optimizations"),
@@ -110,6 +122,25 @@ static llvm::cl::opt<bool>
                     llvm::cl::desc("Lower anywidth integer to 64-bit integer"),
                     llvm::cl::init(false));
 
+static llvm::cl::opt<bool> nativeWidth(
+    "native-width",
+    llvm::cl::desc("With -lower-anywidth-integer, keep 8/16/32/64-bit integers "
+                   "and widen the others to the next of these widths"),
+    llvm::cl::init(false));
+
+static llvm::cl::opt<unsigned> numThreads(
+    "num-threads",
+    llvm::cl::desc("With -lower-to-llvm or -jit, lower the loops marked "
+                   "parallel to multithreaded code for this number of threads, "
+                   "all hardware threads if 0"),
+    llvm::cl::init(1));
+
+static llvm::cl::list<std::string>
+    sharedLibs("shared-libs",
+               llvm::cl::desc("Libraries to link with the JiT-compiled code, "
+                              "e.g. mlir_async_runtime with -num-threads"),
+               llvm::cl::ZeroOrMore, llvm::cl::MiscFlags::CommaSeparated);
+
 static llvm::cl::opt<bool> moveReturnToInput(
     "return-to-input",
     llvm::cl::desc("Move return values to input argument list"),
@@ -141,7 +172,11 @@ int runJiTCompiler(mlir::ModuleOp module) {
 
   // Create an MLIR execution engine. The execution engine eagerly JIT-compiles
   // the module.
-  auto maybeEngine = mlir::ExecutionEngine::create(module);
+  llvm::SmallVector<llvm::StringRef, 4> sharedLibPaths(sharedLibs.begin(),
+                                                       sharedLibs.end());
+  mlir::ExecutionEngineOptions engineOptions;
+  engineOptions.sharedLibPaths = sharedLibPaths;
+  auto maybeEngine = mlir::ExecutionEngine::create(module, engineOptions);
   assert(maybeEngine && "failed to construct an execution engine");
   auto &engine = maybeEngine.get();
 
@@ -198,7 +233,7 @@ int main(int argc, char **argv) {
   }
 
   if (anyWidthInteger) {
-    pm.addPass(mlir::hcl::createAnyWidthIntegerPass());
+    pm.addPass(mlir::hcl::createAnyWidthIntegerPass(nativeWidth));
   }
 
   if (moveReturnToInput) {
@@ -217,6 +252,10 @@ int main(int argc, char **argv) {
     pm.addPass(mlir::hcl::createRemoveStrideMapPass());
   }
 
+  if (lowerLoopAttrs) {
+    pm.addPass(mlir::hcl::createLowerLoopAttributesPass(interleaveFactor));
+  }
+
   if (enableNormalize) {
     // To make all loop steps to 1.
     optPM.addPass(mlir::createAffineLoopNormalizePass());
@@ -239,7 +278,7 @@ int main(int argc, char **argv) {
     if (!removeStrideMap) {
       pm.addPass(mlir::hcl::createRemoveStrideMapPass());
     }
-    pm.addPass(mlir::hcl::createHCLToLLVMLoweringPass());
+    pm.addPass(mlir::hcl::createHCLToLLVMLoweringPass(numThreads));
   }
 
   // Run the pass pipeline